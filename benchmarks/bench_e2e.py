@@ -0,0 +1,263 @@
+"""
+End-to-end benchmark of the polling pipeline against a local fake VK server.
+
+Every scenario starts `benchmarks.fake_vk.FakeVK`, queues synthetic chat
+traffic on its long poll and runs `Module.run_polling` until every message
+has been replied to. Reported per scenario:
+
+- events/s: messages processed per second, from the start of polling to the
+  last reply
+- p50/p99: reply latency, from the long poll response carrying a message to
+  the `messages.send` call answering it
+- calls/event: api requests per message (an `execute` counts as one, long
+  poll requests are not counted)
+- mem/event: peak of memory allocated by Python while processing, divided by
+  the number of messages (a second pass under `tracemalloc`)
+
+Scenarios:
+
+- commands: 300 text commands in 10 routers, every message matches one
+- peers: 10000 conversations, the handler looks the sender up with `users.get`
+- slow: handlers wait 20 ms on I/O and load the message with `messages.getById`
+
+Run from the repository root, no network access is needed:
+
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e --events 2000 --scenario peers --json out.json
+"""
+
+import os
+
+os.environ.setdefault("DISABLE_LOGGING", "true")
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from benchmarks.fake_vk import FakeVK
+from client.api import API
+from core.context.event_context import EventContext
+from core.routers.router import Router
+from module import Module
+
+TOKEN = "bench"
+
+
+class Scenario:
+    """
+    A benchmark scenario.
+
+    :param name: The name used on the command line and in the report
+    :param build_routers: Returns the routers with the scenario handlers
+    :param make_message: Returns (peer_id, from_id, text) of the n-th message
+    :param max_concurrency: Passed to `Module.run_polling`
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build_routers: Callable[[], list[Router]],
+        make_message: Callable[[int], tuple[int, int, str]],
+        max_concurrency: Optional[int],
+    ):
+        self.name = name
+        self.build_routers = build_routers
+        self.make_message = make_message
+        self.max_concurrency = max_concurrency
+
+
+COMMANDS = [f"/command{i}" for i in range(300)]
+
+
+def command_routers() -> list[Router]:
+    routers = [Router() for _ in range(10)]
+    for i, command in enumerate(COMMANDS):
+
+        async def handler(ctx: EventContext, reply: str = f"done {i}") -> None:
+            await ctx.reply(reply)
+
+        routers[i % len(routers)].on_message(text=command)(handler)
+    return routers
+
+
+def command_message(n: int) -> tuple[int, int, str]:
+    peer_id = 2_000_000_000 + n % 100
+    return peer_id, 1000 + n % 500, COMMANDS[n * 7 % len(COMMANDS)]
+
+
+def peer_routers() -> list[Router]:
+    router = Router()
+
+    @router.on_message()
+    async def greet(ctx: EventContext) -> None:
+        users = await ctx.client.request("users.get", {"user_ids": ctx.from_id})
+        await ctx.reply(f"hello, {users[0]['first_name']}")
+
+    return [router]
+
+
+def peer_message(n: int) -> tuple[int, int, str]:
+    user_id = 1 + n % 10_000
+    return user_id, user_id, "hi"
+
+
+def slow_routers() -> list[Router]:
+    router = Router()
+
+    @router.on_message()
+    async def slow(ctx: EventContext) -> None:
+        await asyncio.sleep(0.02)
+        message = await ctx.get_full_message("reply_message")
+        await ctx.reply(f"got {message.get('id')}")
+
+    return [router]
+
+
+def slow_message(n: int) -> tuple[int, int, str]:
+    user_id = 1 + n % 1000
+    return user_id, user_id, "slow"
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("commands", command_routers, command_message, max_concurrency=100),
+        Scenario("peers", peer_routers, peer_message, max_concurrency=500),
+        Scenario("slow", slow_routers, slow_message, max_concurrency=500),
+    )
+}
+
+
+async def run_scenario(
+    scenario: Scenario,
+    events: int,
+    rate_limit: float,
+    trace_memory: bool = False,
+    timeout: float = 300.0,
+) -> dict[str, Any]:
+    """
+    Runs one scenario against a fresh fake server.
+
+    :param scenario: The scenario to run
+    :param events: The number of messages to process
+    :param rate_limit: Requests per second allowed to the api
+    :param trace_memory: Measure the allocation peak with `tracemalloc`
+    :param timeout: Seconds to wait for all replies
+    :return: The measured values
+    """
+    fake = FakeVK()
+    base_url = await fake.start()
+    for n in range(events):
+        fake.push_message(*scenario.make_message(n))
+
+    # the fake server speaks HTTP/1.1 only, where multiplexing just adds overhead
+    api = API(
+        TOKEN,
+        base_url=base_url,
+        rate_limit=rate_limit,
+        long_poll_wait=1,
+        multiplexed=False,
+    )
+    module = Module(api=api, routers=scenario.build_routers())
+
+    if trace_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(
+        module.run_polling(max_concurrency=scenario.max_concurrency)
+    )
+    try:
+        await asyncio.wait_for(fake.wait_replies(events), timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        await api.__aexit__(None, None, None)
+        await fake.stop()
+
+    latencies = fake.reply_latencies()
+    requests = sum(n for method, n in fake.requests.items() if method != "long_poll")
+    result = {
+        "scenario": scenario.name,
+        "events": events,
+        "seconds": elapsed,
+        "events_per_second": events / elapsed,
+        "latency_p50": _pick(latencies, 0.50),
+        "latency_p99": _pick(latencies, 0.99),
+        "calls_per_event": requests / events,
+        "requests": dict(fake.requests),
+        "executed": dict(fake.executed),
+    }
+    if trace_memory:
+        result["memory_per_event"] = (peak - baseline) / events
+    return result
+
+
+def _pick(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(results: list[dict[str, Any]]) -> None:
+    header = (
+        f"{'scenario':<10} {'events':>7} {'events/s':>9} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'calls/event':>11} {'mem/event':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        memory = r.get("memory_per_event")
+        print(
+            f"{r['scenario']:<10} {r['events']:>7} {r['events_per_second']:>9.0f} "
+            f"{r['latency_p50'] * 1000:>8.1f} {r['latency_p99'] * 1000:>8.1f} "
+            f"{r['calls_per_event']:>11.3f} "
+            f"{'-' if memory is None else f'{memory:.0f} B':>10}"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument(
+        "--scenario", choices=sorted(SCENARIOS), action="append", dest="scenarios"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=10_000,
+        help="api requests per second, VK allows 20 for group tokens",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the tracemalloc pass"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        scenario = SCENARIOS[name]
+        result = await run_scenario(scenario, args.events, args.rate_limit)
+        if not args.no_memory:
+            traced = await run_scenario(
+                scenario, args.events, args.rate_limit, trace_memory=True
+            )
+            result["memory_per_event"] = traced["memory_per_event"]
+        results.append(result)
+
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+Micro-benchmark of event normalization.
+
+Compares the lazy, slotted `NormalizedMessageEvent` with the pydantic model
+that was built and validated for every message before.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_events
+"""
+
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from core.context.event_context import EventContext
+from core.polling.adapter import normalize_event
+
+N = 100_000
+
+
+class PydanticMessageEvent(BaseModel):
+    """The model `normalize_event` used to build and validate for every message."""
+
+    message_id: int
+    peer_id: int
+    text: str
+    from_id: int
+    is_group: bool
+    raw: dict
+    date: int
+    out: int
+    conversation_message_id: int
+    random_id: int
+    attachments: list[Any]
+    fwd_messages: list[Any]
+
+
+def normalize_pydantic(raw: dict[str, Any], is_user: bool) -> Optional[BaseModel]:
+    """The previous `normalize_event` implementation."""
+    message_id = raw.get("id")
+    peer_id = raw.get("peer_id")
+    text = raw.get("text", "")
+    from_id = raw.get("from_id")
+    date = raw.get("date")
+    out = raw.get("out")
+    conversation_message_id = raw.get("conversation_message_id")
+    random_id = raw.get("random_id")
+    attachments = raw.get("attachments")
+    fwd_messages = raw.get("fwd_messages")
+
+    if not message_id or not peer_id:
+        return None
+
+    return PydanticMessageEvent(
+        message_id=message_id,
+        peer_id=peer_id,
+        text=text,
+        from_id=from_id,
+        is_group=not is_user,
+        raw=raw,
+        date=date,
+        out=out,
+        conversation_message_id=conversation_message_id,
+        random_id=random_id,
+        attachments=attachments or [],
+        fwd_messages=fwd_messages or [],
+    )
+
+
+def make_raw(i: int) -> dict[str, Any]:
+    return {
+        "id": i + 1,
+        "peer_id": 2_000_000_000 + i % 100,
+        "text": f"/command {i}",
+        "from_id": 1000 + i % 500,
+        "date": 1_700_000_000 + i,
+        "out": 0,
+        "conversation_message_id": i + 1,
+        "random_id": 0,
+        "attachments": [],
+        "fwd_messages": [],
+        "important": False,
+        "is_hidden": False,
+    }
+
+
+def measure(
+    name: str, normalize: Callable[[dict[str, Any], bool], Any], raws: list[dict]
+) -> None:
+    # dispatching reads a few fields of every event, so include that in timing
+    gc.collect()
+    start = time.perf_counter()
+    for raw in raws:
+        event = normalize(raw, False)
+        event.text, event.peer_id, event.from_id
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    events = [normalize(raw, False) for raw in raws]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+
+    print(
+        f"{name:<12} {elapsed / len(raws) * 1e9:>8.0f} ns/event "
+        f"{allocated / len(raws):>8.0f} B/event"
+    )
+
+
+def main() -> None:
+    raws = [make_raw(i) for i in range(N)]
+
+    print(f"normalize_event, {N} events")
+    measure("pydantic", normalize_pydantic, raws)
+    measure("slotted", normalize_event, raws)
+    measure(
+        "slotted+ctx",
+        lambda raw, is_user: EventContext(normalize_event(raw, is_user), None),
+        raws,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+In-process fake of the VK API used by the end-to-end benchmarks.
+
+It serves the group long poll and the methods the framework calls while
+processing messages: `groups.getById`, `groups.getLongPollServer`,
+`messages.send`, `messages.getById`, `users.get` and `execute`. Nothing
+leaves the machine, so the benchmarks run offline.
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qsl
+
+from utils.http import HTTPRequest, HTTPResponse, start_http_server
+
+Params = dict[str, Any]
+
+
+class FakeVK:
+    """
+    A fake VK API server for a single group.
+
+    Messages pushed with `push_message` are delivered through the long poll
+    in batches of at most `batch_size`. Replies sent with `messages.send` and
+    `reply_to` are matched to the message they answer, which gives the reply
+    latency: the time between handing a message out in a long poll response
+    and receiving the reply.
+
+    :param group_id: The id of the fake group
+    :param batch_size: The maximum number of updates in a long poll response
+    :param method_latency: Seconds every method call takes, to emulate the
+        network round trip
+    """
+
+    def __init__(
+        self, group_id: int = 1, batch_size: int = 100, method_latency: float = 0.0
+    ):
+        self.group_id = group_id
+        self.batch_size = batch_size
+        self.method_latency = method_latency
+
+        # http requests per method, calls inside `execute` are counted separately
+        self.requests: Counter[str] = Counter()
+        self.executed: Counter[str] = Counter()
+        self.delivered: dict[int, float] = {}
+        self.replied: dict[int, float] = {}
+
+        self.url = ""
+        self._server: Optional[asyncio.Server] = None
+        self._ts = 0
+        self._next_id = 1
+        self._cmids: Counter[int] = Counter()
+        self._messages: dict[int, dict[str, Any]] = {}
+        self._by_cmid: dict[tuple[int, int], dict[str, Any]] = {}
+        self._pending: deque[dict[str, Any]] = deque()
+        self._new_updates = asyncio.Event()
+        self._replies_target = 0
+        self._replies_done = asyncio.Event()
+
+        self._methods: dict[str, Callable[[Params], Any]] = {
+            "groups.getById": self._groups_get_by_id,
+            "groups.getLongPollServer": self._groups_get_long_poll_server,
+            "messages.send": self._messages_send,
+            "messages.getById": self._messages_get_by_id,
+            "users.get": self._users_get,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts the server.
+
+        :return: The base URL of the api methods, to be passed to `API`
+        """
+        self._server = await start_http_server(self._handle, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+        return f"{self.url}/method"
+
+    async def stop(self) -> None:
+        """Stops the server once the open connections are done."""
+        if self._server:
+            self._server.close()
+            # wakes up pending long polls so their connections can finish
+            self._new_updates.set()
+            await self._server.wait_closed()
+
+    def push_message(self, peer_id: int, from_id: int, text: str) -> int:
+        """
+        Queues a `message_new` update for the long poll.
+
+        :return: The id of the message
+        """
+        message_id = self._next_id
+        self._next_id += 1
+        self._cmids[peer_id] += 1
+
+        message = {
+            "id": message_id,
+            "date": int(time.time()),
+            "peer_id": peer_id,
+            "from_id": from_id,
+            "text": text,
+            "out": 0,
+            "conversation_message_id": self._cmids[peer_id],
+            "random_id": 0,
+            "attachments": [],
+            "fwd_messages": [],
+            "important": False,
+            "is_hidden": False,
+        }
+        self._messages[message_id] = message
+        self._by_cmid[(peer_id, message["conversation_message_id"])] = message
+        self._pending.append(
+            {
+                "type": "message_new",
+                "event_id": f"e{message_id}",
+                "v": "5.199",
+                "object": {"message": message, "client_info": {}},
+                "group_id": self.group_id,
+            }
+        )
+        self._new_updates.set()
+        return message_id
+
+    async def wait_replies(self, count: int) -> None:
+        """Waits until `count` messages have been replied to."""
+        self._replies_target = count
+        if len(self.replied) >= count:
+            return
+        self._replies_done.clear()
+        await self._replies_done.wait()
+
+    def reply_latencies(self) -> list[float]:
+        """Returns the sorted reply latencies in seconds."""
+        return sorted(
+            replied - self.delivered[message_id]
+            for message_id, replied in self.replied.items()
+            if message_id in self.delivered
+        )
+
+    async def _handle(self, request: HTTPRequest) -> HTTPResponse:
+        if request.path == "/lp":
+            return _json(await self._long_poll(request))
+
+        if not request.path.startswith("/method/"):
+            return HTTPResponse("not found", status=404)
+
+        method = request.path.removeprefix("/method/")
+        params = {**request.query, **dict(parse_qsl(request.body.decode()))}
+        self.requests[method] += 1
+
+        if self.method_latency:
+            await asyncio.sleep(self.method_latency)
+
+        if method == "execute":
+            return _json(self._execute(params["code"]))
+        return _json(self._call(method, params))
+
+    async def _long_poll(self, request: HTTPRequest) -> dict[str, Any]:
+        self.requests["long_poll"] += 1
+        if not self._pending:
+            self._new_updates.clear()
+            try:
+                async with asyncio.timeout(float(request.query.get("wait", 25))):
+                    await self._new_updates.wait()
+            except TimeoutError:
+                pass
+
+        updates = []
+        now = time.perf_counter()
+        while self._pending and len(updates) < self.batch_size:
+            update = self._pending.popleft()
+            self.delivered[update["object"]["message"]["id"]] = now
+            updates.append(update)
+
+        self._ts += 1
+        return {"ts": str(self._ts), "updates": updates}
+
+    def _call(self, method: str, params: Params) -> dict[str, Any]:
+        handler = self._methods.get(method)
+        if handler is None:
+            return _error(3, "Unknown method passed", method, params)
+        return {"response": handler(params)}
+
+    def _execute(self, code: str) -> dict[str, Any]:
+        results: list[Any] = []
+        errors: list[dict[str, Any]] = []
+        for method, params in _parse_execute_code(code):
+            self.executed[method] += 1
+            data = self._call(method, params)
+            if "error" in data:
+                results.append(False)
+                errors.append({**data["error"], "method": method})
+            else:
+                results.append(data["response"])
+
+        body: dict[str, Any] = {"response": results}
+        if errors:
+            body["execute_errors"] = errors
+        return body
+
+    def _groups_get_by_id(self, params: Params) -> dict[str, Any]:
+        return {"groups": [{"id": self.group_id, "name": "bench", "type": "group"}]}
+
+    def _groups_get_long_poll_server(self, params: Params) -> dict[str, Any]:
+        return {"server": f"{self.url}/lp", "key": "bench", "ts": str(self._ts)}
+
+    def _messages_send(self, params: Params) -> int:
+        reply_to = params.get("reply_to")
+        if reply_to:
+            self.replied[int(reply_to)] = time.perf_counter()
+            if len(self.replied) >= self._replies_target:
+                self._replies_done.set()
+
+        message_id = self._next_id
+        self._next_id += 1
+        return message_id
+
+    def _messages_get_by_id(self, params: Params) -> dict[str, Any]:
+        if "cmids" in params:
+            peer_id = int(params["peer_id"])
+            items = [
+                self._by_cmid[(peer_id, int(cmid))]
+                for cmid in str(params["cmids"]).split(",")
+                if (peer_id, int(cmid)) in self._by_cmid
+            ]
+        else:
+            items = [
+                self._messages[int(i)]
+                for i in str(params.get("message_ids", "")).split(",")
+                if i and int(i) in self._messages
+            ]
+        return {"count": len(items), "items": items}
+
+    def _users_get(self, params: Params) -> list[dict[str, Any]]:
+        return [
+            {"id": int(i), "first_name": "User", "last_name": i}
+            for i in str(params.get("user_ids", "")).split(",")
+            if i
+        ]
+
+
+def _parse_execute_code(code: str) -> list[tuple[str, Params]]:
+    """Parses the `return [API.method({...}),...];` code built by `build_execute_code`."""
+    decoder = json.JSONDecoder()
+    body = code.strip().removeprefix("return [").removesuffix("];")
+
+    calls = []
+    pos = 0
+    while pos < len(body):
+        start = body.index("API.", pos) + len("API.")
+        paren = body.index("(", start)
+        params, end = decoder.raw_decode(body, paren + 1)
+        calls.append((body[start:paren], params))
+        pos = end + 1  # skip the closing parenthesis
+        if pos < len(body) and body[pos] == ",":
+            pos += 1
+    return calls
+
+
+def _error(code: int, message: str, method: str, params: Params) -> dict[str, Any]:
+    request_params = [{"key": "method", "value": method}]
+    request_params += [{"key": k, "value": str(v)} for k, v in params.items()]
+    return {
+        "error": {
+            "error_code": code,
+            "error_msg": message,
+            "request_params": request_params,
+        }
+    }
+
+
+def _json(data: Any) -> HTTPResponse:
+    return HTTPResponse(json.dumps(data), content_type="application/json")
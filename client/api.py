@@ -1,15 +1,103 @@
 import asyncio
-from typing import Any, Dict, Literal, Optional
+import time
+from typing import TYPE_CHECKING, Any, Dict, Literal, Optional
 
 import niquests
 from loguru import logger
 
+from client.cache import DEFAULT_CACHE_TTLS, ResponseCache
+from client.checkpoint import CheckpointMarker, LongPollCheckpoint
+from client.coalescer import RequestCoalescer
+from client.decoder import JSONDecoder, get_json_decoder, get_long_poll_decoder
+from client.errors import VKAPIError
+from client.execute import build_execute_code, parse_execute_response
+from client.latency import HEDGED_METHODS, LatencyTracker, backoff_delay
+from client.ratelimit import (
+    GROUP_RATE_LIMIT,
+    THROTTLING_ERRORS,
+    TOO_MANY_REQUESTS,
+    USER_RATE_LIMIT,
+    TokenBucket,
+)
+from client.tokens import TokenPool, describes_caller
 from config.logger import setup_logger
+from utils.metrics import REGISTRY, SIZE_BUCKETS
+
+if TYPE_CHECKING:
+    from core.message_queue.worker import MessageSender
 
 setup_logger()
 
+_REQUEST_SECONDS = REGISTRY.histogram(
+    "nique_api_request_seconds", "Latency of VK API method calls", ("method",)
+)
+_REQUEST_ERRORS = REGISTRY.counter(
+    "nique_api_errors_total",
+    "Failed VK API method calls by VK error code, http_<status>, timeout, "
+    "transport or decode",
+    ("method", "code"),
+)
+_LONG_POLL_SECONDS = REGISTRY.histogram(
+    "nique_longpoll_request_seconds", "Duration of long poll requests"
+)
+_LONG_POLL_BATCH = REGISTRY.histogram(
+    "nique_longpoll_batch_size", "Updates per long poll response", buckets=SIZE_BUCKETS
+)
+
 
 class API:
+    """
+    Asynchronous VK API client.
+
+    :param access_token: Group or user access token
+    :param session: HTTP session for method calls, by default a multiplexed
+        session sized by `pool_size` and `keepalive` is created
+    :param api_version: VK API version
+    :param max_retries: How many times a call is attempted on network errors
+    :param timeout_seconds: Timeout of a single request; with
+        `adaptive_timeouts` it is the upper bound of the derived timeout
+    :param rate_limit: Requests per second allowed for the token; by default
+        the VK limit for the detected token type is used
+    :param max_throttle_retries: How many times a call is delayed and repeated
+        after VK error 6 or 9 before it fails
+    :param flood_delay: Base delay in seconds before repeating a call that hit
+        flood control (error 9)
+    :param json_decoder: Function decoding response bodies; by default orjson
+        or msgspec is used when installed, otherwise the standard library
+    :param typed_long_poll: Decode long poll responses straight into the
+        structs from `models.longpoll` (requires msgspec)
+    :param coalesce_window: Concurrent `users.get`, `groups.getById` and
+        `messages.getById` lookups arriving within this many seconds are merged
+        into one request; None disables merging
+    :param cache_ttls: Read-only methods whose responses are cached, mapped to
+        their time to live in seconds; defaults to `DEFAULT_CACHE_TTLS`, an
+        empty dict disables caching
+    :param cache_size: The maximum number of cached responses
+    :param long_poll_session: HTTP session used only for long poll requests,
+        so method calls never wait behind a hanging long poll
+    :param pool_size: Connections kept per host by the method call session
+    :param keepalive: Seconds an idle connection of the method call session
+        is kept alive
+    :param multiplexed: Multiplex concurrent method calls over HTTP/2
+        connections of the method call session
+    :param long_poll_wait: The `wait` parameter of long poll requests
+    :param long_poll_timeout_margin: Seconds added to `long_poll_wait` for the
+        timeout of a long poll request
+    :param adaptive_timeouts: Derive the timeout of every method from the p99
+        of its recent latencies
+    :param hedging: Send idempotent read methods a second time when they have
+        not answered within their p95 latency, the first answer wins
+    :param backoff_base: Base of the exponential backoff between retries
+    :param backoff_max: The maximum delay between retries
+    :param base_url: Base URL of the API methods, e.g. of a local fake server
+    :param long_poll_checkpoint: Where the long poll state is stored once
+        a batch is processed and resumed from after a restart
+    :param token_pool: Additional tokens the routed read methods are spread
+        over; calls describing the calling account (e.g. `users.get` without
+        `user_ids`) always use `access_token`, as do routed calls when no
+        pooled token is available
+    """
+
     def __init__(
         self,
         access_token: str,
@@ -17,23 +105,84 @@ class API:
         api_version: str = "5.199",
         max_retries: int = 3,
         timeout_seconds: float = 10.0,
+        rate_limit: Optional[float] = None,
+        max_throttle_retries: int = 5,
+        flood_delay: float = 1.0,
+        json_decoder: Optional[JSONDecoder] = None,
+        typed_long_poll: bool = False,
+        coalesce_window: Optional[float] = 0.005,
+        cache_ttls: Optional[dict[str, float]] = None,
+        cache_size: int = 1024,
+        long_poll_session: Optional[niquests.AsyncSession] = None,
+        pool_size: int = 10,
+        keepalive: float = 600.0,
+        multiplexed: bool = True,
+        long_poll_wait: int = 25,
+        long_poll_timeout_margin: float = 10.0,
+        adaptive_timeouts: bool = True,
+        hedging: bool = False,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        base_url: str = "https://api.vk.com/method",
+        long_poll_checkpoint: Optional[LongPollCheckpoint] = None,
+        token_pool: Optional[TokenPool] = None,
     ):
         self.access_token = access_token
         self.max_retries = max_retries
         self.timeout_seconds = timeout_seconds
-        self.session = session or niquests.AsyncSession()
+        self.max_throttle_retries = max_throttle_retries
+        self.flood_delay = flood_delay
+        self.session = session or niquests.AsyncSession(
+            multiplexed=multiplexed,
+            pool_maxsize=pool_size,
+            keepalive_delay=keepalive,
+        )
+        self.long_poll_session = long_poll_session or niquests.AsyncSession(
+            pool_connections=1, pool_maxsize=1
+        )
+        self.long_poll_wait = long_poll_wait
+        self.long_poll_timeout_margin = long_poll_timeout_margin
+        self.adaptive_timeouts = adaptive_timeouts
+        self.hedging = hedging
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency = LatencyTracker()
+        self.json_decoder = json_decoder or get_json_decoder()
+        self.typed_long_poll = typed_long_poll
+
+        self.coalescer = (
+            RequestCoalescer(self._request, window=coalesce_window)
+            if coalesce_window
+            else None
+        )
+
+        if cache_ttls is None:
+            cache_ttls = DEFAULT_CACHE_TTLS
+        self.cache = ResponseCache(cache_ttls, cache_size) if cache_ttls else None
+
+        # until the token type is detected the stricter user limit is used
+        self._auto_rate_limit = rate_limit is None
+        self.rate_limiter = TokenBucket(rate_limit or USER_RATE_LIMIT)
+        self.token_pool = token_pool
+
+        # background sender used by `EventContext.answer`/`reply`, attached by `Module`
+        self.sender: Optional["MessageSender"] = None
 
         self._is_group_token: Optional[bool] = None
         self._lp_data: Optional[dict] = None
+        self._lp_resumed = False
+        self.long_poll_checkpoint = long_poll_checkpoint
+        self._lp_decoder: JSONDecoder = self.json_decoder
 
-        self._base_url = "https://api.vk.com/method"
+        self._base_url = base_url.rstrip("/")
         self._api_version = api_version
 
     async def __aenter__(self) -> "API":
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
-        await self.session.aclose()
+        await self.session.close()
+        await self.long_poll_session.close()
 
     async def request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -44,42 +193,199 @@ class API:
         :return: Response of the request
         :raises Exception: If the request failed after max retries
         """
+        if self.cache is not None:
+            token = self.access_token if describes_caller(method, params) else None
+            key = self.cache.key(method, params, token)
+            if key is not None:
+                return await self.cache.get_or_fetch(
+                    key, method, lambda: self._fetch_response(method, params)
+                )
+
+        return await self._fetch_response(method, params)
+
+    async def _fetch_response(
+        self, method: str, params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if self.coalescer is not None:
+            merged = self.coalescer.submit(method, params)
+            if merged is not None:
+                return await merged
+
+        data = await self._request(method, params)
+        return data.get("response", {})
+
+    async def execute(self, calls: list[tuple[str, Dict[str, Any]]]) -> list[Any]:
+        """
+        Performs up to 25 api calls in a single `execute` request.
+
+        :param calls: A list of (method, params) pairs
+        :return: A list with the result of every call in the same order;
+            failed calls are represented by a `VKAPIError` instance
+        :raises Exception: If the `execute` request itself failed
+        """
+        data = await self._request("execute", {"code": build_execute_code(calls)})
+        return parse_execute_response(calls, data)
+
+    async def _request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Performs a request to api and returns the whole response body.
+
+        :param method: Method name
+        :param params: Parameters for the request
+        :return: Response body of the request
+        :raises Exception: If the request failed after max retries
+        """
         copied_params = params.copy()
         copied_params["access_token"] = self.access_token
         copied_params["v"] = self._api_version
+        pooled = self.token_pool is not None and self.token_pool.routes_call(
+            method, params
+        )
 
-        for attempt in range(1, self.max_retries + 1):
+        attempt = 0
+        throttled = 0
+        while True:
             try:
-                async with asyncio.timeout(self.timeout_seconds):
-                    response = await self.session.post(
-                        f"{self._base_url}/{method}", data=copied_params
-                    )
-
-                    if not response.ok:
-                        raise Exception(
-                            f"HTTP error {response.status}: {response.reason}"
-                        )
-
-                    data = response.json()
-
-                if "error" in data:
-                    error = data["error"]
-                    raise Exception(
-                        f"[VK API] error {error.get('error_code')}: {error.get('error_msg')} | {method}"
-                    )
-
-                return data.get("response", {})
+                return await self._attempt(method, copied_params, pooled)
+
+            except VKAPIError as e:
+                if (
+                    e.code not in THROTTLING_ERRORS
+                    or throttled >= self.max_throttle_retries
+                ):
+                    logger.error(str(e))
+                    raise
 
+                throttled += 1
+                if e.code == TOO_MANY_REQUESTS:
+                    delay = self.rate_limiter.on_throttled()
+                else:
+                    delay = self.flood_delay * throttled
+                logger.warning(f"{e}, repeating in {delay:.2f}s")
+                await asyncio.sleep(delay)
             except (asyncio.TimeoutError, niquests.exceptions.Timeout) as e:
+                attempt += 1
                 logger.warning(f"Attempt {attempt} failed due to network error: {e}")
                 if attempt == self.max_retries:
                     logger.error(f"Max retries reached for method {method}")
                     raise
-                await asyncio.sleep(1 * attempt)
+                await asyncio.sleep(
+                    backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                )
             except Exception as e:
-                logger.error(e, exc_info=True)
+                logger.opt(exception=e).error(f"Request to {method} failed: {e}")
                 raise
 
+    async def _attempt(
+        self, method: str, params: Dict[str, Any], pooled: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Performs a single attempt of a request.
+
+        With hedging enabled, an idempotent read method that has not answered
+        within its p95 latency is sent a second time and the first answer wins.
+        """
+        hedge_after = None
+        if self.hedging and method in HEDGED_METHODS:
+            hedge_after = self.latency.percentile(method, 0.95)
+        if hedge_after is None:
+            return await self._send(method, params, pooled)
+
+        tasks = [asyncio.create_task(self._send(method, params, pooled))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return tasks[0].result()
+
+            tasks.append(asyncio.create_task(self._send(method, params, pooled)))
+            error: Optional[BaseException] = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            # also reached when the caller is cancelled while waiting
+            for task in tasks:
+                task.cancel()
+
+    async def _send(
+        self, method: str, params: Dict[str, Any], pooled: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Sends one request with the own token or, if `pooled`, with the least
+        loaded token of the pool, moving on to the next token when one is
+        evicted. Only the limiter of the token the request was sent with is
+        adjusted.
+        """
+        if pooled:
+            while (token := self.token_pool.choose(method)) is not None:
+                token.active += 1
+                try:
+                    await token.limiter.acquire()
+                    if token.is_evicted(method, time.monotonic()):
+                        # evicted while this call was waiting for the limiter
+                        continue
+                    data = await self._post(
+                        method, {**params, "access_token": token.access_token}
+                    )
+                    token.limiter.on_success()
+                    return data
+                except VKAPIError as e:
+                    if not self.token_pool.evict(token, e.code, method):
+                        raise
+                finally:
+                    token.active -= 1
+
+        await self.rate_limiter.acquire()
+        data = await self._post(method, params)
+        self.rate_limiter.on_success()
+        return data
+
+    async def _post(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends one HTTP request and decodes the response body."""
+        timeout = self.timeout_seconds
+        if self.adaptive_timeouts:
+            timeout = self.latency.timeout_for(method, self.timeout_seconds)
+
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                response = await self.session.post(
+                    f"{self._base_url}/{method}", data=params
+                )
+                if response.lazy:
+                    # multiplexed responses are resolved on demand
+                    await self.session.gather(response)
+
+                if not response.ok:
+                    _REQUEST_ERRORS.labels(method, f"http_{response.status_code}").inc()
+                    raise Exception(
+                        f"HTTP error {response.status_code}: {response.reason}"
+                    )
+
+                data = self.json_decoder(response.content)
+        except (asyncio.TimeoutError, niquests.exceptions.Timeout):
+            _REQUEST_ERRORS.labels(method, "timeout").inc()
+            raise
+        except niquests.exceptions.RequestException:
+            _REQUEST_ERRORS.labels(method, "transport").inc()
+            raise
+        except ValueError:
+            _REQUEST_ERRORS.labels(method, "decode").inc()
+            raise
+        elapsed = time.monotonic() - started
+        self.latency.record(method, elapsed)
+        _REQUEST_SECONDS.labels(method).observe(elapsed)
+
+        if "error" in data:
+            error = data["error"]
+            _REQUEST_ERRORS.labels(method, str(error.get("error_code"))).inc()
+            raise VKAPIError(error.get("error_code"), error.get("error_msg"), method)
+
+        return data
+
     # TODO: потом перенести в другой модуль
     async def get_message_by_id(
         self,
@@ -92,10 +398,12 @@ class API:
             "extended": str(extended),
         }
 
+        # lookups by the global id alone are merged by the coalescer across
+        # conversations; group chat messages have no global id (0) and are
+        # looked up by their conversation message id
         if message_id:
             params["message_ids"] = message_id
-
-        if self._is_group_token:
+        elif self._is_group_token:
             params["peer_id"] = peer_id
             params["cmids"] = cmids
 
@@ -127,70 +435,185 @@ class API:
         except Exception:
             self._is_group_token = False
 
+        if self._auto_rate_limit:
+            self.rate_limiter.set_rate(
+                GROUP_RATE_LIMIT if self._is_group_token else USER_RATE_LIMIT
+            )
+
         return "group" if self._is_group_token else "user"
 
-    async def init_long_poll(self):
+    async def init_long_poll(self, keep_ts: bool = False):
         """
         Initializes long poll server data for the token.
 
+        On the first call the state stored in `long_poll_checkpoint` is used
+        if there is one, so polling resumes where the previous process
+        stopped.
+
+        :param keep_ts: Only fetch a new server and key, e.g. after the key
+            expired, and keep polling from the current `ts`
         :return: None
         """
         token_type = await self.detect_token_type()
 
+        if self.typed_long_poll and self._lp_decoder is self.json_decoder:
+            decoder = get_long_poll_decoder(is_group=token_type == "group")
+            if decoder is None:
+                logger.warning("msgspec is not installed, typed long poll is disabled")
+            self._lp_decoder = decoder or self.json_decoder
+
+        if self._lp_data is None and not self._lp_resumed:
+            self._lp_resumed = True
+            if self.long_poll_checkpoint is not None:
+                saved = self.long_poll_checkpoint.load(token_type)
+                if saved is not None:
+                    logger.info(f"Resuming long poll from ts {saved['ts']}")
+                    self._lp_data = saved
+                    return
+
         if token_type == "group":
             group_id = (await self.request("groups.getById", {}))["groups"][0]["id"]
             data = await self.request(
                 "groups.getLongPollServer", {"group_id": group_id}
             )
         else:
-            data = await self.request("messages.getLongPollServer", {"lp_version": 3})
+            data = await self.request(
+                "messages.getLongPollServer", {"lp_version": 3, "need_pts": 1}
+            )
 
+        previous = self._lp_data
         self._lp_data = {
             "server": data["server"],
             "key": data["key"],
-            "ts": data["ts"],
+            "ts": previous["ts"] if keep_ts and previous else data["ts"],
         }
+        if token_type == "user":
+            pts = previous.get("pts") if keep_ts and previous else None
+            self._lp_data["pts"] = pts or data.get("pts")
 
     async def get_long_poll_events(self) -> list[dict] | list[list]:
         """Retrieves long poll events from the long poll server.
 
         If the long poll server data has not been initialized yet, it is
-        initialized before retrieving events. If the initialization fails,
-        the function will retry until the server data is initialized.
+        initialized (or resumed from `long_poll_checkpoint`) first. The state
+        is not stored here: see `checkpoint_marker`.
 
-        If the server returns a failed response, the function will retry if
-        the failure is due to an outdated timestamp (failed == 1). Otherwise,
-        the function will retry until the server data is reinitialized.
+        Failed responses are handled as VK describes them: with `failed` 1
+        polling continues from the new `ts`, with 2 a new key is fetched and
+        the `ts` is kept, with 3 the state is fetched again. For user tokens
+        the events missed with 1 and 3 are loaded with
+        `messages.getLongPollHistory`. Requests that time out or fail in
+        transport are repeated with the same state. Consecutive failures are
+        retried with a growing delay.
 
         :return: A list of long poll events. The format of each event depends
             on the type of token used.
         """
-        if not self._lp_data:
-            await self.init_long_poll()
+        failures = 0
+        while True:
+            if failures > 1:
+                await asyncio.sleep(
+                    backoff_delay(failures - 1, self.backoff_base, self.backoff_max)
+                )
+
+            if not self._lp_data:
+                await self.init_long_poll()
+
+            try:
+                data = await self._poll_long_poll_server()
+            except (TimeoutError, niquests.exceptions.RequestException) as e:
+                failures += 1
+                logger.warning(f"Long poll request failed, repeating it: {e!r}")
+                continue
+
+            failed = data.get("failed")
+            if failed is None:
+                self._lp_data["ts"] = data["ts"]
+                if data.get("pts"):
+                    self._lp_data["pts"] = data["pts"]
+                _LONG_POLL_BATCH.observe(len(data["updates"]))
+                return data["updates"]
+
+            failures += 1
+            missed_from = dict(self._lp_data)
+            if failed == 1:
+                self._lp_data["ts"] = data["ts"]
+            elif failed == 2:
+                await self.init_long_poll(keep_ts=True)
+                continue
+            else:
+                self._lp_data = None
+                await self.init_long_poll()
+
+            history = await self._get_missed_events(missed_from)
+            if history:
+                return history
 
+    async def _poll_long_poll_server(self) -> Any:
         params = {
             "act": "a_check",
             "key": self._lp_data["key"],
             "ts": self._lp_data["ts"],
-            "wait": 25,
+            "wait": self.long_poll_wait,
         }
 
-        url = (
-            self._lp_data["server"]
-            if self._is_group_token
-            else f"https://{self._lp_data['server']}"
+        if self._is_group_token:
+            url = self._lp_data["server"]
+        else:
+            url = f"https://{self._lp_data['server']}"
+            # makes the server report `pts`, needed to load missed events
+            params["mode"] = 32
+
+        timeout = self.long_poll_wait + self.long_poll_timeout_margin
+        started = time.monotonic()
+        async with asyncio.timeout(timeout):
+            response = await self.long_poll_session.get(
+                url, params=params, timeout=timeout
+            )
+        _LONG_POLL_SECONDS.observe(time.monotonic() - started)
+
+        return self._lp_decoder(response.content)
+
+    async def _get_missed_events(self, missed_from: dict[str, Any]) -> list[list]:
+        """
+        Loads the events between a lost long poll state and the current one.
+
+        Only user tokens have `messages.getLongPollHistory`; for group tokens
+        the missed events cannot be recovered.
+        """
+        if self._is_group_token or not missed_from.get("pts"):
+            logger.warning(
+                f"Long poll events after ts {missed_from['ts']} were lost "
+                "and cannot be loaded again"
+            )
+            return []
+
+        response = await self.request(
+            "messages.getLongPollHistory",
+            {
+                "ts": missed_from["ts"],
+                "pts": missed_from["pts"],
+                "lp_version": 3,
+            },
         )
+        if self._lp_data is not None and response.get("new_pts"):
+            self._lp_data["pts"] = response["new_pts"]
+        return [update for update in response.get("history", []) if update[0] == 4]
 
-        response = await self.session.get(url, params=params)
+    def checkpoint_marker(self) -> Optional[CheckpointMarker]:
+        """
+        Captures the current long poll state, i.e. the state right after the
+        batch last returned by `get_long_poll_events`.
 
-        data = response.json()
+        Providers yield the marker after the events of the batch, and the
+        runner commits it once those events have been processed.
 
-        if "failed" in data:
-            if data["failed"] == 1:
-                self._lp_data["ts"] = data["ts"]
-            else:
-                self._lp_data = None
-                return await self.get_long_poll_events()  # retry
-        else:
-            self._lp_data["ts"] = data["ts"]
-            return data["updates"]
+        :return: The marker, or None without `long_poll_checkpoint`
+        """
+        if self.long_poll_checkpoint is None or not self._lp_data:
+            return None
+        return CheckpointMarker(
+            self.long_poll_checkpoint,
+            "group" if self._is_group_token else "user",
+            dict(self._lp_data),
+        )
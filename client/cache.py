@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# seconds a response of a read-only method stays cached
+DEFAULT_CACHE_TTLS: dict[str, float] = {
+    "groups.getById": 300.0,
+    "users.get": 60.0,
+    "utils.resolveScreenName": 600.0,
+}
+
+
+class ResponseCache:
+    """
+    TTL and LRU bounded cache of api responses with single-flight loading.
+
+    Only methods listed in `ttls` are cached. When several callers miss the
+    same key at once, only one request is performed and all of them wait for
+    its result; the request keeps running when any of the callers is
+    cancelled. Errors are never cached. Cached responses are shared
+    between callers and must not be modified.
+
+    :param ttls: Time to live in seconds for every cacheable method
+    :param maxsize: The maximum number of cached responses
+    """
+
+    def __init__(self, ttls: dict[str, float], maxsize: int = 1024):
+        self.ttls = ttls
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    def key(
+        self, method: str, params: dict[str, Any], token: Optional[str] = None
+    ) -> Optional[Hashable]:
+        """
+        Builds the cache key of a request.
+
+        :param method: Method name
+        :param params: Parameters for the request
+        :param token: Identity of the token for responses that depend on it,
+            e.g. `users.get` without `user_ids`
+        :return: The key, or None if the method is not cacheable
+        """
+        if method not in self.ttls:
+            return None
+        return method, token, tuple(sorted((k, str(v)) for k, v in params.items()))
+
+    async def get_or_fetch(
+        self, key: Hashable, method: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Returns the cached response, loading it with `fetch` on a miss.
+
+        :param key: The key built by `key`
+        :param method: Method name, used to look up the TTL
+        :param fetch: Coroutine function performing the request
+        :return: The response
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.joined += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        # the request runs in its own task, so cancelling the caller that
+        # started it does not cancel the callers that joined it
+        task = asyncio.create_task(self._load(key, method, fetch))
+        task.add_done_callback(_consume_exception)
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(
+        self, key: Hashable, method: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        try:
+            value = await fetch()
+        finally:
+            del self._in_flight[key]
+        self._store(key, method, value)
+        return value
+
+    def stats(self) -> dict[str, int]:
+        """Returns the hit/miss counters and the current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "joined": self.joined,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def clear(self) -> None:
+        """Drops every cached response."""
+        self._entries.clear()
+
+    def _store(self, key: Hashable, method: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttls[method], value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # errors are delivered to the waiting callers, not to the loop
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,95 @@
+import json
+import os
+from typing import Any, Optional
+
+from loguru import logger
+
+
+class LongPollCheckpoint:
+    """
+    Stores the long poll state (`server`, `key`, `ts` and, for user tokens,
+    `pts`) in a local JSON file.
+
+    The file is replaced atomically and only written when the state changed,
+    so saving after every batch costs one small write. The state is saved by
+    the runner through a `CheckpointMarker` once every event of a batch has
+    been processed, not when the batch is received.
+
+    :param path: The file the state is stored in
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._saved: Optional[dict[str, Any]] = None
+
+    def load(self, token_type: str) -> Optional[dict[str, Any]]:
+        """
+        Reads the stored state.
+
+        :param token_type: "group" or "user", a state saved for the other
+            token type is ignored
+        :return: The state, or None if there is no usable checkpoint
+        """
+        try:
+            with open(self.path, "rb") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable long poll checkpoint {self.path}: {e}")
+            return None
+
+        if not isinstance(state, dict) or state.get("type") != token_type:
+            return None
+        if not all(state.get(field) for field in ("server", "key", "ts")):
+            return None
+
+        self._saved = state
+        return {k: v for k, v in state.items() if k != "type"}
+
+    def save(self, token_type: str, state: dict[str, Any]) -> None:
+        """
+        Stores the state if it differs from the last stored one.
+
+        :param token_type: "group" or "user"
+        :param state: The long poll state of `API`
+        """
+        state = {"type": token_type, **state}
+        if state == self._saved:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write long poll checkpoint {self.path}: {e}")
+            return
+        self._saved = state
+
+
+class CheckpointMarker:
+    """
+    Passed through the event stream after the events of one long poll batch.
+
+    Whoever processes the events calls `commit` once every event before the
+    marker is processed, so a restart resumes right after them.
+
+    :param checkpoint: Where the state is stored
+    :param token_type: "group" or "user"
+    :param state: The long poll state after the batch
+    """
+
+    __slots__ = ("checkpoint", "token_type", "state")
+
+    def __init__(
+        self, checkpoint: LongPollCheckpoint, token_type: str, state: dict[str, Any]
+    ):
+        self.checkpoint = checkpoint
+        self.token_type = token_type
+        self.state = state
+
+    def commit(self) -> None:
+        """Stores the state of the batch."""
+        self.checkpoint.save(self.token_type, self.state)
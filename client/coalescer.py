@@ -0,0 +1,202 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from loguru import logger
+
+Fetch = Callable[[str, dict[str, Any]], Awaitable[dict[str, Any]]]
+
+
+class CoalesceRule:
+    """
+    Describes how lookups of one method are merged.
+
+    :param id_param: The request parameter holding comma-separated ids
+    :param id_field: The field of a returned object that holds its id
+    :param limit: The maximum number of ids accepted by the method
+    :param items_key: The key of the returned objects in the response, or
+        None if the response is the list of objects itself
+    """
+
+    __slots__ = ("id_param", "id_field", "limit", "items_key")
+
+    def __init__(
+        self, id_param: str, id_field: str, limit: int, items_key: Optional[str]
+    ) -> None:
+        self.id_param = id_param
+        self.id_field = id_field
+        self.limit = limit
+        self.items_key = items_key
+
+
+COALESCE_RULES: dict[str, tuple[CoalesceRule, ...]] = {
+    "users.get": (CoalesceRule("user_ids", "id", 1000, None),),
+    "groups.getById": (CoalesceRule("group_ids", "id", 500, "groups"),),
+    "messages.getById": (
+        CoalesceRule("message_ids", "id", 100, "items"),
+        # group tokens look messages up by conversation message ids
+        CoalesceRule("cmids", "conversation_message_id", 100, "items"),
+    ),
+}
+
+
+class _Batch:
+    __slots__ = ("method", "rule", "params", "ids", "waiters", "timer")
+
+    def __init__(self, method: str, rule: CoalesceRule, params: dict[str, Any]):
+        self.method = method
+        self.rule = rule
+        self.params = params
+        self.ids: dict[str, None] = {}
+        self.waiters: list[tuple[list[str], dict[str, Any], asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class RequestCoalescer:
+    """
+    Merges concurrent id lookups into bulk requests.
+
+    Lookups of the same method with the same other parameters that arrive
+    within `window` seconds are sent as one request with all their ids, and
+    every caller receives a response containing only the objects it asked
+    for. Lookups that cannot be merged (no ids, non-numeric ids) are not
+    touched.
+
+    :param fetch: Coroutine function performing a request and returning the
+        whole response body
+    :param window: How long a lookup waits for others to join, in seconds
+    :param rules: Methods that may be merged, see `COALESCE_RULES`
+    """
+
+    def __init__(
+        self,
+        fetch: Fetch,
+        window: float = 0.005,
+        rules: Optional[dict[str, tuple[CoalesceRule, ...]]] = None,
+    ):
+        self.fetch = fetch
+        self.window = window
+        self.rules = COALESCE_RULES if rules is None else rules
+
+        self._batches: dict[tuple, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, method: str, params: dict[str, Any]) -> Optional[asyncio.Future]:
+        """
+        Adds a lookup to the pending batch of its method.
+
+        :param method: Method name
+        :param params: Parameters for the request
+        :return: A future resolving with the response for this lookup, or None
+            if the lookup cannot be merged and must be sent as is
+        """
+        rules = self.rules.get(method)
+        if not rules:
+            return None
+
+        for rule in rules:
+            if rule.id_param in params:
+                break
+        else:
+            return None
+
+        ids = _split_ids(params[rule.id_param])
+        if not ids or len(ids) > rule.limit:
+            return None
+
+        other = {k: v for k, v in params.items() if k != rule.id_param}
+        try:
+            key = (method, rule.id_param, frozenset(other.items()))
+        except TypeError:
+            return None
+
+        batch = self._batches.get(key)
+        if batch is not None and len(batch.ids.keys() | ids) > rule.limit:
+            self._flush(key)
+            batch = None
+
+        if batch is None:
+            batch = self._batches[key] = _Batch(method, rule, other)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush, key
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        batch.ids.update(dict.fromkeys(ids))
+        batch.waiters.append((ids, params, future))
+
+        if len(batch.ids) >= rule.limit:
+            self._flush(key)
+        return future
+
+    def _flush(self, key: tuple) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: _Batch) -> None:
+        rule = batch.rule
+        params = {**batch.params, rule.id_param: ",".join(batch.ids)}
+
+        try:
+            data = await self.fetch(batch.method, params)
+        except Exception as e:
+            if len(batch.waiters) == 1:
+                _set_exception(batch.waiters[0][2], e)
+                return
+            # one bad id fails the whole bulk request, so retry every lookup on its own
+            logger.warning(
+                f"Bulk {batch.method} failed, repeating lookups one by one: {e}"
+            )
+            await asyncio.gather(
+                *(self._send_single(batch.method, p, f) for _, p, f in batch.waiters)
+            )
+            return
+
+        response = data.get("response", {})
+        items = response if rule.items_key is None else response.get(rule.items_key)
+        by_id = {str(item.get(rule.id_field)): item for item in items or []}
+
+        for ids, _, future in batch.waiters:
+            found = [by_id[i] for i in ids if i in by_id]
+            if future.done():
+                continue
+            if rule.items_key is None:
+                future.set_result(found)
+            elif rule.items_key == "items":
+                future.set_result({**response, "count": len(found), "items": found})
+            else:
+                future.set_result({**response, rule.items_key: found})
+
+    async def _send_single(
+        self, method: str, params: dict[str, Any], future: asyncio.Future
+    ) -> None:
+        try:
+            data = await self.fetch(method, params)
+        except Exception as e:
+            _set_exception(future, e)
+        else:
+            if not future.done():
+                future.set_result(data.get("response", {}))
+
+
+def _split_ids(value: Any) -> list[str]:
+    if isinstance(value, int):
+        value = str(value)
+    if isinstance(value, (list, tuple)):
+        ids = [str(i).strip() for i in value]
+    elif isinstance(value, str):
+        ids = [i.strip() for i in value.split(",") if i.strip()]
+    else:
+        return []
+    return ids if all(i.isdigit() for i in ids) else []
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,65 @@
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSONDecoder = Callable[[Union[bytes, str]], Any]
+JSONEncoder = Callable[[Any], bytes]
+
+
+def get_json_decoder() -> JSONDecoder:
+    """
+    Returns the fastest available JSON decoder.
+
+    `orjson` is preferred, then `msgspec`, then the standard library.
+
+    :return: A function decoding JSON bytes or str
+    """
+    if orjson is not None:
+        return orjson.loads
+    if msgspec is not None:
+        return msgspec.json.decode
+    return json.loads
+
+
+def get_json_encoder() -> JSONEncoder:
+    """
+    Returns the fastest available compact JSON encoder.
+
+    `msgspec` is preferred because it also encodes the typed long poll
+    structs, then `orjson`, then the standard library.
+
+    :return: A function encoding an object to JSON bytes
+    """
+    if msgspec is not None:
+        return msgspec.json.encode
+    if orjson is not None:
+        return orjson.dumps
+    return lambda obj: json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def get_long_poll_decoder(is_group: bool) -> Optional[JSONDecoder]:
+    """
+    Returns a decoder turning a long poll response straight into typed structs
+    from `models.longpoll`.
+
+    :param is_group: Whether the response comes from the group long poll
+    :return: The decoder, or None if `msgspec` is not installed
+    """
+    if msgspec is None:
+        return None
+
+    from models.longpoll import GroupLongPollResponse, UserLongPollResponse
+
+    response_type = GroupLongPollResponse if is_group else UserLongPollResponse
+    return msgspec.json.Decoder(response_type).decode
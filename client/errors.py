@@ -0,0 +1,17 @@
+from typing import Optional
+
+
+class VKAPIError(Exception):
+    """
+    Error returned by the VK API in response to a method call.
+
+    :param code: VK error code (e.g. 6 for "Too many requests per second")
+    :param message: Error message returned by VK
+    :param method: Name of the method that failed
+    """
+
+    def __init__(self, code: Optional[int], message: Optional[str], method: str):
+        self.code = code
+        self.message = message
+        self.method = method
+        super().__init__(f"[VK API] error {code}: {message} | {method}")
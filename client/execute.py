@@ -0,0 +1,60 @@
+import json
+from typing import Any
+
+from client.errors import VKAPIError
+
+# VK allows at most 25 API calls inside a single `execute` request
+EXECUTE_MAX_CALLS = 25
+
+
+def build_execute_code(calls: list[tuple[str, dict[str, Any]]]) -> str:
+    """
+    Builds VKScript code that performs the given calls and returns their
+    results as an array in the same order.
+
+    :param calls: A list of (method, params) pairs
+    :return: VKScript code for the `execute` method
+    """
+    if len(calls) > EXECUTE_MAX_CALLS:
+        raise ValueError(f"execute supports at most {EXECUTE_MAX_CALLS} calls")
+
+    body = ",".join(
+        f"API.{method}({json.dumps(params, ensure_ascii=False)})"
+        for method, params in calls
+    )
+    return f"return [{body}];"
+
+
+def parse_execute_response(
+    calls: list[tuple[str, dict[str, Any]]], data: dict[str, Any]
+) -> list[Any]:
+    """
+    Maps the response of an `execute` request back to the calls it was built from.
+
+    VK returns `false` in place of every failed call and lists the errors in
+    `execute_errors` in the same order, so the n-th `false` belongs to the
+    n-th error.
+
+    :param calls: The calls passed to `build_execute_code`
+    :param data: Full response body of the `execute` request
+    :return: A list with the result of every call; failed calls are
+        represented by a `VKAPIError` instance
+    """
+    results = data.get("response") or []
+    errors = iter(data.get("execute_errors") or [])
+
+    mapped: list[Any] = []
+    for index, (method, _) in enumerate(calls):
+        result = results[index] if index < len(results) else False
+        if result is False:
+            error = next(errors, {})
+            mapped.append(
+                VKAPIError(
+                    error.get("error_code"),
+                    error.get("error_msg", "call failed inside execute"),
+                    error.get("method", method),
+                )
+            )
+        else:
+            mapped.append(result)
+    return mapped
@@ -0,0 +1,116 @@
+import random
+from collections import deque
+from typing import Optional
+
+# idempotent read methods that may be sent twice when hedging is enabled
+HEDGED_METHODS = frozenset(
+    {
+        "users.get",
+        "groups.getById",
+        "messages.getById",
+        "messages.getConversationsById",
+        "utils.resolveScreenName",
+    }
+)
+
+
+class LatencyTracker:
+    """
+    Keeps recent latencies of every api method and derives timeouts from them.
+
+    Percentiles are computed over the last `window` successful calls of a
+    method and recomputed every 16 new samples, so recording stays cheap.
+
+    :param window: The number of recent latencies kept per method
+    :param min_samples: Samples needed before percentiles are reported
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+
+        self._samples: dict[str, deque[float]] = {}
+        self._pending: dict[str, int] = {}
+        self._percentiles: dict[str, tuple[float, float, float]] = {}
+
+    def record(self, method: str, seconds: float) -> None:
+        """
+        Records the latency of a call.
+
+        :param method: Method name
+        :param seconds: How long the call took
+        """
+        samples = self._samples.get(method)
+        if samples is None:
+            samples = self._samples[method] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+        pending = self._pending.get(method, 0) + 1
+        if pending >= 16 or method not in self._percentiles:
+            pending = 0
+            if len(samples) >= self.min_samples:
+                ordered = sorted(samples)
+                self._percentiles[method] = (
+                    _pick(ordered, 0.50),
+                    _pick(ordered, 0.95),
+                    _pick(ordered, 0.99),
+                )
+        self._pending[method] = pending
+
+    def percentile(self, method: str, q: float) -> Optional[float]:
+        """
+        Returns the p50, p95 or p99 latency of a method.
+
+        :param method: Method name
+        :param q: 0.5, 0.95 or 0.99
+        :return: The latency in seconds, or None if there are too few samples
+        """
+        percentiles = self._percentiles.get(method)
+        if percentiles is None:
+            return None
+        return percentiles[{0.5: 0, 0.95: 1, 0.99: 2}[q]]
+
+    def timeout_for(
+        self,
+        method: str,
+        default: float,
+        multiplier: float = 3.0,
+        floor: float = 1.0,
+    ) -> float:
+        """
+        Derives the timeout of a call from the p99 latency of its method.
+
+        :param method: Method name
+        :param default: The timeout used without enough samples, also the
+            upper bound of the derived timeout
+        :param multiplier: How many times the p99 latency a call may take
+        :param floor: The lower bound of the derived timeout
+        :return: The timeout in seconds
+        """
+        p99 = self.percentile(method, 0.99)
+        if p99 is None:
+            return default
+        return min(default, max(floor, p99 * multiplier))
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Returns p50/p95/p99 latencies of every method with enough samples."""
+        return {
+            method: {"p50": p50, "p95": p95, "p99": p99}
+            for method, (p50, p95, p99) in self._percentiles.items()
+        }
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """
+    Exponential backoff with full jitter.
+
+    :param attempt: The number of the failed attempt, starting from 1
+    :param base: The delay cap after the first attempt
+    :param cap: The maximum delay
+    :return: A random delay in seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _pick(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Optional
+
+# VK limits for requests per second per access token
+GROUP_RATE_LIMIT = 20.0
+USER_RATE_LIMIT = 3.0
+
+# "Too many requests per second" and "Flood control"
+TOO_MANY_REQUESTS = 6
+FLOOD_CONTROL = 9
+THROTTLING_ERRORS = frozenset({TOO_MANY_REQUESTS, FLOOD_CONTROL})
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for api requests.
+
+    Every request takes one token, tokens are refilled at `rate` per second up
+    to `capacity`. Waiters are served in FIFO order. When VK reports that the
+    limit is exceeded the rate is halved, then it slowly recovers back to
+    `max_rate` with every successful request.
+
+    :param rate: Allowed requests per second
+    :param capacity: Maximum burst size, defaults to `rate`
+    :param min_rate: The lowest rate the bucket may adapt down to
+    """
+
+    def __init__(
+        self, rate: float, capacity: Optional[float] = None, min_rate: float = 1.0
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.min_rate = min(min_rate, rate)
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Changes the allowed rate, e.g. once the token type is known.
+
+        :param rate: Allowed requests per second
+        :param capacity: Maximum burst size, defaults to `rate`
+        """
+        self._refill()
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.min_rate = min(self.min_rate, rate)
+        self._tokens = min(self._tokens, self.capacity)
+
+    async def acquire(self) -> None:
+        """Waits until a request is allowed to be sent."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def available(self) -> float:
+        """Returns how many requests may be sent right now without waiting."""
+        self._refill()
+        return self._tokens
+
+    def on_success(self) -> None:
+        """Additively recovers the rate after a successful request."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    def on_throttled(self) -> float:
+        """
+        Halves the rate and empties the bucket after VK reported error 6.
+
+        :return: The delay in seconds before the request should be repeated
+        """
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+        return 1 / self.rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
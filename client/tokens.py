@@ -0,0 +1,194 @@
+import time
+from typing import Any, Optional, Union
+
+from loguru import logger
+
+from client.ratelimit import TOO_MANY_REQUESTS, USER_RATE_LIMIT, TokenBucket
+from utils.metrics import REGISTRY
+
+# "User authorization failed" and "Rate limit reached"
+AUTHORIZATION_FAILED = 5
+RATE_LIMIT_REACHED = 29
+
+# seconds a token is left out of the pool after VK returned the error
+DEFAULT_EVICTION_SECONDS: dict[int, float] = {
+    AUTHORIZATION_FAILED: 3600.0,
+    TOO_MANY_REQUESTS: 1.0,
+    RATE_LIMIT_REACHED: 3600.0,
+}
+
+# methods spread over every token of the pool unless other routes are given;
+# `messages.getById` is not included because messages are only visible to
+# tokens with access to the conversation
+DEFAULT_POOL_ROUTES: dict[str, Optional[list[str]]] = {
+    "users.get": None,
+    "groups.getById": None,
+    "utils.resolveScreenName": None,
+}
+
+# parameters naming the objects these methods describe; without them the
+# methods describe the account owning the token
+ID_PARAMS: dict[str, tuple[str, ...]] = {
+    "users.get": ("user_ids",),
+    "groups.getById": ("group_ids", "group_id"),
+    "utils.resolveScreenName": ("screen_name",),
+}
+
+_EVICTIONS = REGISTRY.counter(
+    "nique_token_evictions_total", "Tokens evicted from the pool", ("token", "code")
+)
+
+
+def describes_caller(method: str, params: dict[str, Any]) -> bool:
+    """
+    Whether a call describes the account owning the token, e.g. `users.get`
+    without `user_ids`, so its response depends on the token it is sent with.
+
+    :param method: Method name
+    :param params: Parameters of the call
+    """
+    names = ID_PARAMS.get(method)
+    return names is not None and not any(params.get(name) for name in names)
+
+
+class PooledToken:
+    """
+    An access token of a `TokenPool` with its own rate limiter.
+
+    :param name: Name of the token used in routes, logs and metrics
+    :param access_token: The access token
+    :param rate_limit: Requests per second allowed for the token
+    """
+
+    def __init__(self, name: str, access_token: str, rate_limit: float):
+        self.name = name
+        self.access_token = access_token
+        self.limiter = TokenBucket(rate_limit)
+        # calls waiting for the limiter or being sent with this token
+        self.active = 0
+        # method (None for every method) -> monotonic time the eviction ends
+        self._evicted: dict[Optional[str], float] = {}
+
+    @property
+    def load(self) -> float:
+        """Calls in progress minus the requests the token may send right now."""
+        return self.active - self.limiter.available()
+
+    def is_evicted(self, method: str, now: float) -> bool:
+        """Whether the token must not be used for `method` at `now`."""
+        return (
+            self._evicted.get(None, 0.0) > now or self._evicted.get(method, 0.0) > now
+        )
+
+    def evict(self, method: Optional[str], seconds: float) -> None:
+        """Leaves the token out for `method`, or for every method if None."""
+        self._evicted[method] = time.monotonic() + seconds
+
+
+class TokenPool:
+    """
+    Spreads calls of read methods over several access tokens.
+
+    VK limits requests per second per token, so routing read-heavy methods
+    through a pool multiplies their throughput by the number of tokens. Every
+    call goes to the least loaded token allowed for the method. A token that
+    hit error 5, 6 or 29 is left out for a while (error 29 only for the method
+    that reached its quota) and the call is repeated with another token.
+
+    Calls describing the calling account (see `describes_caller`) are never
+    sent through the pool, neither are routed calls without parameters.
+
+    :param tokens: Access tokens, either a list or a dict mapping names used
+        in `routes` to tokens
+    :param routes: Methods sent through the pool, mapped to the names of the
+        tokens allowed for them (None allows every token); defaults to
+        `DEFAULT_POOL_ROUTES`
+    :param rate_limit: Requests per second allowed for every token
+    :param eviction_seconds: How long a token is left out after every
+        evicting error code; defaults to `DEFAULT_EVICTION_SECONDS`
+    """
+
+    def __init__(
+        self,
+        tokens: Union[list[str], dict[str, str]],
+        routes: Optional[dict[str, Optional[list[str]]]] = None,
+        rate_limit: float = USER_RATE_LIMIT,
+        eviction_seconds: Optional[dict[int, float]] = None,
+    ):
+        if not isinstance(tokens, dict):
+            tokens = {str(number): token for number, token in enumerate(tokens)}
+
+        self.tokens = [
+            PooledToken(name, token, rate_limit) for name, token in tokens.items()
+        ]
+        self.routes = DEFAULT_POOL_ROUTES if routes is None else routes
+        self.eviction_seconds = (
+            DEFAULT_EVICTION_SECONDS if eviction_seconds is None else eviction_seconds
+        )
+
+        names = {token.name for token in self.tokens}
+        for method, allowed in self.routes.items():
+            unknown = set(allowed or ()) - names
+            if unknown:
+                raise ValueError(
+                    f"Route of {method} uses unknown tokens: {', '.join(unknown)}"
+                )
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def routes_call(self, method: str, params: dict[str, Any]) -> bool:
+        """
+        Whether a call is sent through the pool.
+
+        :param method: Method name
+        :param params: Parameters of the call
+        """
+        if method not in self.routes or not params:
+            return False
+        return not describes_caller(method, params)
+
+    def choose(self, method: str) -> Optional[PooledToken]:
+        """
+        Picks the token for the next call of `method`.
+
+        :param method: Method name
+        :return: The least loaded token allowed for the method that is not
+            evicted, or None if there is none
+        """
+        allowed = self.routes.get(method)
+        now = time.monotonic()
+        best: Optional[PooledToken] = None
+        best_load = 0.0
+        for token in self.tokens:
+            if allowed is not None and token.name not in allowed:
+                continue
+            if token.is_evicted(method, now):
+                continue
+            load = token.load
+            if best is None or load < best_load:
+                best, best_load = token, load
+        return best
+
+    def evict(self, token: PooledToken, code: Optional[int], method: str) -> bool:
+        """
+        Leaves the token out of the pool if `code` is an evicting error.
+
+        :param token: The token the call was sent with
+        :param code: VK error code of the call
+        :param method: Method name of the call
+        :return: Whether the token was evicted and the call may be repeated
+            with another token
+        """
+        seconds = self.eviction_seconds.get(code)
+        if seconds is None:
+            return False
+
+        scope = method if code == RATE_LIMIT_REACHED else None
+        token.evict(scope, seconds)
+        _EVICTIONS.labels(token.name, str(code)).inc()
+        logger.warning(
+            f"Token {token.name} got error {code} for {method}, "
+            f"evicted from the pool for {seconds:.0f}s"
+        )
+        return True
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import asyncio
+import re
 from typing import TYPE_CHECKING, Any, Optional
 
-from core.message_queue.worker import enqueue_message
+from core.filters import split_first_word
+from core.message_queue.worker import get_sender
 from models.events import NormalizedMessageEvent
 from utils.random_id import generate_random_id
 
@@ -11,18 +14,54 @@ if TYPE_CHECKING:
 
 
 class EventContext:
-    __slots__ = ("event", "_client", "_full_message", "_raw_event")
-
-    def __init__(
-        self,
-        event: NormalizedMessageEvent,
-        client: API,
-        raw_event: Optional[dict[str, Any]] = None,
-    ) -> None:
+    __slots__ = (
+        "event",
+        "command",
+        "args",
+        "match",
+        "_client",
+        "_full_message",
+        "_split",
+    )
+
+    def __init__(self, event: NormalizedMessageEvent, client: API) -> None:
         self.event = event
         self._client = client
         self._full_message: Optional[dict] = None
-        self._raw_event = raw_event or {}
+        self._split: Optional[tuple[str, str]] = None
+
+        # values captured by the filters of the handler being called
+        self.command: Optional[str] = None
+        self.args: tuple[Any, ...] = ()
+        self.match: Optional[re.Match] = None
+
+    def set_captures(self, captures: dict[str, Any]) -> None:
+        """Sets `command`, `args` and `match` captured by the filters of a handler."""
+        self.command = captures.get("command")
+        self.args = captures.get("args", ())
+        self.match = captures.get("match")
+
+    def copy(self, captures: dict[str, Any]) -> EventContext:
+        """
+        Returns a context of the same event with other captured values, e.g.
+        for handlers running concurrently.
+        """
+        ctx = EventContext(self.event, self._client)
+        ctx._full_message = self._full_message
+        ctx._split = self._split
+        ctx.set_captures(captures)
+        return ctx
+
+    def split_text(self) -> tuple[str, str]:
+        """
+        Splits the text into the first word and the rest, once per event.
+
+        Returns:
+            The first word and the rest of the text without leading whitespace.
+        """
+        if self._split is None:
+            self._split = split_first_word(self.text)
+        return self._split
 
     @property
     def full_message(self) -> dict[str, Any]:
@@ -57,7 +96,7 @@ class EventContext:
     @property
     def raw(self) -> dict[str, Any]:
         """Returns the raw event data as a dictionary."""
-        return self._raw_event
+        return self.event.raw
 
     @property
     def is_group(self) -> bool:
@@ -117,31 +156,53 @@ class EventContext:
         """
         if not self.client or not hasattr(self.event, "message_id"):
             return
-        self._full_message = await self.client.get_message_by_id(self.event.message_id)
+        self._full_message = await self._fetch_message()
 
-    async def get_full_message(self) -> dict:
+    async def get_full_message(self, *fields: str) -> dict:
         """
         Lazy-loads full message object from `vk api` using messages.getById.
+
+        If `fields` are given and the received message already contains all of
+        them, it is returned as is without an api call.
         """
         if self._full_message is not None:
             return self._full_message
 
-        response = await self._client.get_message_by_id(self.event.message_id)
+        raw = self.event.raw
+        if fields and all(field in raw for field in fields):
+            return raw
+
+        response = await self._fetch_message()
         self._full_message = response
         return self._full_message
 
-    async def answer(self, text: str) -> None:
-        """Send a text reply to the message sender"""
+    async def _fetch_message(self) -> dict:
+        return await self._client.get_message_by_id(
+            self.event.message_id,
+            peer_id=self.event.peer_id,
+            cmids=self.event.conversation_message_id,
+        )
+
+    async def answer(self, text: str) -> asyncio.Future:
+        """
+        Send a text reply to the message sender.
+
+        Returns a future that resolves with the id of the sent message.
+        """
         payload = {
             "peer_id": self.peer_id,
             "message": text,
             "random_id": generate_random_id(),
         }
 
-        await enqueue_message("messages.send", payload)
+        return await get_sender(self._client).enqueue("messages.send", payload)
+
+    async def reply(self, text: str) -> asyncio.Future:
+        """
+        Send a text reply to the message sender.
 
-    async def reply(self, text: str) -> None:
-        """Send a text reply to the message sender"""
+        Returns a future that resolves with the id of the sent message.
+        """
         payload = {
             "peer_id": self.peer_id,
             "message": text,
@@ -149,7 +210,7 @@ class EventContext:
             "reply_to": self.message_id,
         }
 
-        await enqueue_message("messages.send", payload)
+        return await get_sender(self._client).enqueue("messages.send", payload)
 
     async def send_sticker(self, sticker_id: int) -> None:
         """Send a sticker to the message sender"""
@@ -1,6 +1,54 @@
-from typing import Any, Awaitable, Callable, Optional
+from __future__ import annotations
+
+import asyncio
+import time
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+)
 
 from core.context.event_context import EventContext
+from core.filters import CompiledFilter, compile_filters, index_values
+from utils.metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from core.routers.router import Router
+
+_HANDLER_SECONDS = REGISTRY.histogram(
+    "nique_handler_seconds", "Duration of message handler calls", ("handler",)
+)
+_HANDLER_ERRORS = REGISTRY.counter(
+    "nique_handler_errors_total", "Message handler calls that raised", ("handler",)
+)
+_HANDLER_TIMEOUTS = REGISTRY.counter(
+    "nique_handler_timeouts_total", "Message handler calls that timed out", ("handler",)
+)
+
+# "sequential": every matching handler in order until one raises
+#     `StopPropagation`; "first": only the first matching handler;
+# "concurrent": all matching handlers at once
+DispatchPolicy = Literal["sequential", "first", "concurrent"]
+DISPATCH_POLICIES: tuple[DispatchPolicy, ...] = ("sequential", "first", "concurrent")
+
+# (registration order, handler, compiled filters left after the index lookup)
+IndexEntry = tuple[int, "MessageHandler", CompiledFilter]
+# a matching handler and the values its filters captured
+Match = tuple["MessageHandler", dict[str, Any]]
+
+
+class StopPropagation(Exception):
+    """
+    Raised by a handler to keep the event from the handlers registered after
+    it. Only the "sequential" dispatch policy has handlers left to skip.
+    """
 
 
 class MessageHandler:
@@ -8,9 +56,22 @@ class MessageHandler:
         self,
         func: Callable[[EventContext], Awaitable[None]],
         filters: Optional[dict[str, Any]] = None,
+        checks: Sequence[Any] = (),
+        timeout: Optional[float] = None,
     ):
         self.func = func
         self.filters = filters
+        self.checks = tuple(checks)
+        self.timeout = timeout
+        self.check = compile_filters(filters, self.checks)
+        self.name = f"{func.__module__}.{getattr(func, '__qualname__', repr(func))}"
+        self.bind_metrics()
+
+    def bind_metrics(self) -> None:
+        """Looks up the metric children of `name` once instead of on every call."""
+        self.seconds_metric = _HANDLER_SECONDS.labels(self.name)
+        self.errors_metric = _HANDLER_ERRORS.labels(self.name)
+        self.timeouts_metric = _HANDLER_TIMEOUTS.labels(self.name)
 
     def matches(self, ctx: EventContext) -> bool:
         """
@@ -23,30 +84,181 @@ class MessageHandler:
             A boolean indicating whether the event in the context matches
             all the filter criteria specified in the handler.
         """
-
-        if not self.filters:
-            return True
-
-        for key, value in self.filters.items():
-            attr = getattr(ctx, key, None)
-            if attr != value:
-                return False
-        return True
+        return self.check(ctx) is not None
 
     async def __call__(self, ctx: EventContext):
         await self.func(ctx)
 
 
+class DispatchIndex:
+    """
+    Handlers of the given routers compiled into a lookup table.
+
+    Every handler with an equality filter on a hashable value is indexed by
+    that value (`text` is preferred when a handler has several filters), and
+    a handler with a membership filter by each of its values, so for an event
+    only the handlers whose indexed value equals the event's are checked.
+    Handlers without such filters stay on a small catch-all list. The other
+    filters of a handler are compiled into one predicate. Matching handlers
+    are returned in their registration order.
+
+    The index is a snapshot: build a new one after adding routers or handlers.
+
+    :param routers: Router instances containing the registered handlers.
+    """
+
+    def __init__(self, routers: Iterable[Router]):
+        self._catch_all: list[IndexEntry] = []
+        self._index: dict[str, dict[Any, list[IndexEntry]]] = {}
+
+        order = 0
+        for router in routers:
+            for handler in router.get_handlers():
+                self._add(order, handler)
+                order += 1
+
+        self._keys = tuple(self._index.items())
+
+    def _add(self, order: int, handler: MessageHandler) -> None:
+        filters = handler.filters or {}
+        key, values = self._index_key(filters)
+
+        if key is None:
+            self._catch_all.append((order, handler, handler.check))
+            return
+
+        residual = compile_filters(
+            {k: v for k, v in filters.items() if k != key}, handler.checks
+        )
+        by_value = self._index.setdefault(key, {})
+        for value in values:
+            by_value.setdefault(value, []).append((order, handler, residual))
+
+    @staticmethod
+    def _index_key(
+        filters: dict[str, Any],
+    ) -> tuple[Optional[str], tuple[Any, ...]]:
+        keys = sorted(filters, key=lambda k: k != "text")
+        for key in keys:
+            values = index_values(filters[key])
+            if values is not None:
+                return key, values
+        return None, ()
+
+    def match(self, ctx: EventContext, first: bool = False) -> list[Match]:
+        """
+        Finds the handlers matching the given event.
+
+        :param ctx: An EventContext containing the event.
+        :param first: Stop at the first matching handler.
+        :return: Matching handlers in registration order, each with the
+            values captured by its filters.
+        """
+        candidates = self._catch_all
+        merged = False
+
+        for key, by_value in self._keys:
+            try:
+                hits = by_value.get(getattr(ctx, key, None))
+            except TypeError:
+                continue
+            if hits:
+                candidates = [*candidates, *hits]
+                merged = True
+
+        if merged:
+            candidates.sort(key=itemgetter(0))
+
+        matches = []
+        for _, handler, residual in candidates:
+            captures = residual(ctx)
+            if captures is not None:
+                matches.append((handler, captures))
+                if first:
+                    break
+        return matches
+
+
 #  пока пусть будет здесь, потом разделю
-async def dispatch_event(ctx: EventContext, routers):
+async def dispatch_event(
+    ctx: EventContext,
+    routers: Union[DispatchIndex, Iterable[Router]],
+    policy: DispatchPolicy = "sequential",
+    timeout: Optional[float] = None,
+):
     """
     Dispatches an event to the registered message handlers.
 
+    With the "concurrent" policy every handler gets its own copy of the
+    context, and the first error is raised once all handlers finished.
+
     :param ctx: An EventContext containing the event to be dispatched.
-    :param client: The BaseClient instance used to access the VK API.
-    :param routers: A list of Router instances containing the registered handlers.
+    :param routers: A `DispatchIndex` compiled from the routers, or a list of
+        Router instances containing the registered handlers.
+    :param policy: How matching handlers are run, see `DispatchPolicy`.
+    :param timeout: Seconds a handler may run before it is cancelled with
+        `TimeoutError`, unless the handler has its own timeout.
+    :raises TimeoutError: If a handler timed out.
     """
-    for router in routers:
-        for handler in router.get_handlers():
-            if handler.matches(ctx):
-                await handler(ctx)
+    index = routers if isinstance(routers, DispatchIndex) else DispatchIndex(routers)
+    matches = index.match(ctx, first=policy == "first")
+
+    if policy == "concurrent" and len(matches) > 1:
+        await _fan_out(ctx, matches, timeout)
+        return
+
+    for handler, captures in matches:
+        ctx.set_captures(captures)
+        try:
+            await _call_handler(handler, ctx, timeout)
+        except StopPropagation:
+            return
+
+
+async def _fan_out(
+    ctx: EventContext, matches: list[Match], timeout: Optional[float]
+) -> None:
+    errors: list[Exception] = []
+
+    async def call(handler: MessageHandler, captures: dict[str, Any]) -> None:
+        try:
+            await _call_handler(handler, ctx.copy(captures), timeout)
+        except StopPropagation:
+            pass
+        except Exception as e:
+            # keep the other handlers running, the task group would cancel them
+            errors.append(e)
+
+    async with asyncio.TaskGroup() as group:
+        for handler, captures in matches:
+            group.create_task(call(handler, captures))
+
+    if len(errors) == 1:
+        raise errors[0]
+    if errors:
+        raise ExceptionGroup("Several message handlers failed", errors)
+
+
+async def _call_handler(
+    handler: MessageHandler, ctx: EventContext, timeout: Optional[float]
+) -> None:
+    if handler.timeout is not None:
+        timeout = handler.timeout
+
+    deadline = asyncio.timeout(timeout)
+    started = time.perf_counter()
+    try:
+        async with deadline:
+            await handler(ctx)
+    except StopPropagation:
+        raise
+    except Exception as e:
+        handler.errors_metric.inc()
+        if isinstance(e, TimeoutError) and deadline.expired():
+            handler.timeouts_metric.inc()
+            raise TimeoutError(
+                f"Handler {handler.name} timed out after {timeout:g}s"
+            ) from None
+        raise
+    finally:
+        handler.seconds_metric.observe(time.perf_counter() - started)
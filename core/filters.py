@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import re
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Sequence, Union
+
+if TYPE_CHECKING:
+    from core.context.event_context import EventContext
+
+# compiled check of one filter: falsy if the event does not match, True if it
+# matches, or a dict of values captured for the handler (e.g. command args)
+Check = Callable[["EventContext"], Any]
+# compiled filters of a handler: None if the event does not match, otherwise
+# the captured values to set on the context before calling the handler
+CompiledFilter = Callable[["EventContext"], Optional[dict[str, Any]]]
+
+NO_CAPTURES: dict[str, Any] = {}
+
+
+class Filter(ABC):
+    """
+    Base class of filters that do more than an equality check.
+
+    Filters are compiled once, when the handler is registered. Checks with a
+    lower `cost` run first, so an event is rejected by the cheapest check
+    that fails.
+    """
+
+    cost = 10
+    # the context attribute checked when the filter is passed positionally
+    default_key: Optional[str] = "text"
+
+    @abstractmethod
+    def compile(self, key: Optional[str]) -> Check:
+        """
+        Builds the check of the filter.
+
+        Args:
+            key: The context attribute to check, or None to pass the whole
+                context.
+
+        Returns:
+            A function returning a falsy value if the event does not match,
+            True if it does, or a dict of values captured for the handler.
+        """
+
+
+class Equals(Filter):
+    """Matches if the attribute equals `value`. Plain filter values mean this."""
+
+    cost = 0
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def compile(self, key: Optional[str]) -> Check:
+        value = self.value
+        return lambda ctx: getattr(ctx, key, None) == value
+
+
+class OneOf(Filter):
+    """
+    Matches if the attribute is one of `values`. A set or frozenset given as
+    a filter value means this.
+    """
+
+    cost = 1
+
+    def __init__(self, values: Iterable[Any]):
+        self.values = frozenset(values)
+
+    def compile(self, key: Optional[str]) -> Check:
+        values = self.values
+
+        def check(ctx: EventContext) -> bool:
+            try:
+                return getattr(ctx, key, None) in values
+            except TypeError:
+                return False
+
+        return check
+
+
+class StartsWith(Filter):
+    """
+    Matches text starting with one of the prefixes.
+
+    Args:
+        *prefixes: The accepted prefixes.
+        ignore_case: Compare case-insensitively.
+    """
+
+    cost = 2
+
+    def __init__(self, *prefixes: str, ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.prefixes = tuple(p.lower() for p in prefixes) if ignore_case else prefixes
+
+    def compile(self, key: Optional[str]) -> Check:
+        prefixes, ignore_case = self.prefixes, self.ignore_case
+
+        def check(ctx: EventContext) -> bool:
+            text = getattr(ctx, key, None)
+            if not isinstance(text, str):
+                return False
+            if ignore_case:
+                text = text.lower()
+            return text.startswith(prefixes)
+
+        return check
+
+
+class Command(Filter):
+    """
+    Matches commands like `/ban 123` and captures their arguments.
+
+    The matched name is set as `ctx.command` and the arguments as
+    `ctx.args`. With `args`, the command must have exactly that many
+    arguments and each one is converted by the corresponding function, e.g.
+    `Command("ban", args=(int,))`; a failed conversion means no match.
+    Without `args`, `ctx.args` is a tuple of all words after the name.
+
+    The text is split once per event and the split is shared by all command
+    filters.
+
+    Args:
+        *names: The command names, without the prefix.
+        prefixes: The accepted prefixes.
+        args: Converters of the arguments.
+        ignore_case: Match the name case-insensitively.
+    """
+
+    cost = 3
+
+    def __init__(
+        self,
+        *names: str,
+        prefixes: Union[str, Sequence[str]] = "/",
+        args: Optional[Sequence[Callable[[str], Any]]] = None,
+        ignore_case: bool = True,
+    ):
+        if not names:
+            raise ValueError("Command needs at least one name")
+        self.ignore_case = ignore_case
+        self.names = frozenset(n.lower() for n in names) if ignore_case else names
+        self.prefixes = (prefixes,) if isinstance(prefixes, str) else tuple(prefixes)
+        self.args = tuple(args) if args is not None else None
+
+    def compile(self, key: Optional[str]) -> Check:
+        names, prefixes, converters = self.names, self.prefixes, self.args
+        ignore_case = self.ignore_case
+
+        def check(ctx: EventContext) -> Union[bool, dict[str, Any]]:
+            text = getattr(ctx, key, None)
+            if not isinstance(text, str) or not text.startswith(prefixes):
+                return False
+
+            head, rest = ctx.split_text() if key == "text" else split_first_word(text)
+            for prefix in prefixes:
+                if head.startswith(prefix):
+                    name = head[len(prefix) :]
+                    if (name.lower() if ignore_case else name) in names:
+                        break
+            else:
+                return False
+
+            words = tuple(rest.split())
+            if converters is None:
+                return {"command": name, "args": words}
+            if len(words) != len(converters):
+                return False
+            try:
+                args = tuple(convert(w) for convert, w in zip(converters, words))
+            except (TypeError, ValueError):
+                return False
+            return {"command": name, "args": args}
+
+        return check
+
+
+class Regex(Filter):
+    """
+    Matches if the precompiled pattern is found in the attribute. The match
+    object is set as `ctx.match`.
+
+    Args:
+        pattern: A regular expression or a compiled pattern.
+        flags: Flags of `re.compile`.
+    """
+
+    cost = 4
+
+    def __init__(self, pattern: Union[str, re.Pattern], flags: int = 0):
+        self.pattern = re.compile(pattern, flags)
+
+    def compile(self, key: Optional[str]) -> Check:
+        search = self.pattern.search
+
+        def check(ctx: EventContext) -> Union[bool, dict[str, Any]]:
+            value = getattr(ctx, key, None)
+            if not isinstance(value, str):
+                return False
+            match = search(value)
+            return {"match": match} if match else False
+
+        return check
+
+
+class Predicate(Filter):
+    """
+    Matches if `func` returns a truthy value. A callable given as a filter
+    value or passed positionally means this: positional predicates get the
+    context, keyword ones get the value of the attribute.
+    """
+
+    default_key = None
+
+    def __init__(self, func: Callable[[Any], Any], cost: int = 10):
+        self.func = func
+        self.cost = cost
+
+    def compile(self, key: Optional[str]) -> Check:
+        func = self.func
+        if key is None:
+            return lambda ctx: bool(func(ctx))
+        return lambda ctx: bool(func(getattr(ctx, key, None)))
+
+
+def as_filter(value: Any) -> Filter:
+    """
+    Converts a filter value given to `Router.on_message` into a `Filter`.
+
+    Filters are kept, sets become `OneOf`, callables become `Predicate` and
+    anything else becomes `Equals`.
+    """
+    if isinstance(value, Filter):
+        return value
+    if isinstance(value, (set, frozenset)):
+        return OneOf(value)
+    if callable(value) and not isinstance(value, type):
+        return Predicate(value)
+    return Equals(value)
+
+
+def index_values(value: Any) -> Optional[tuple[Any, ...]]:
+    """
+    Returns the values a handler can be looked up by for a filter value, or
+    None if the filter cannot be indexed.
+    """
+    value = as_filter(value)
+    values: tuple[Any, ...]
+    if isinstance(value, Equals):
+        values = (value.value,)
+    elif isinstance(value, OneOf):
+        values = tuple(value.values)
+    else:
+        return None
+
+    try:
+        for v in values:
+            hash(v)
+    except TypeError:
+        return None
+    return values
+
+
+def compile_filters(
+    filters: Optional[dict[str, Any]] = None, checks: Sequence[Any] = ()
+) -> CompiledFilter:
+    """
+    Compiles the filters of a handler into one function.
+
+    Args:
+        filters: Context attributes mapped to filter values.
+        checks: Positional filters, `Filter` instances or callables getting
+            the context.
+
+    Returns:
+        A function returning None if the event does not match, otherwise the
+        values captured by the filters.
+    """
+    compiled: list[tuple[int, Check]] = []
+    for key, value in (filters or {}).items():
+        value = as_filter(value)
+        compiled.append((value.cost, value.compile(key)))
+    for value in checks:
+        value = as_filter(value)
+        compiled.append((value.cost, value.compile(value.default_key)))
+
+    if not compiled:
+        return _match_all
+
+    compiled.sort(key=lambda item: item[0])
+    tests = tuple(test for _, test in compiled)
+
+    def predicate(ctx: EventContext) -> Optional[dict[str, Any]]:
+        captures = NO_CAPTURES
+        for test in tests:
+            result = test(ctx)
+            if not result:
+                return None
+            if result is not True:
+                if captures is NO_CAPTURES:
+                    captures = {}
+                captures.update(result)
+        return captures
+
+    return predicate
+
+
+def _match_all(ctx: EventContext) -> dict[str, Any]:
+    return NO_CAPTURES
+
+
+def split_first_word(text: str) -> tuple[str, str]:
+    """Splits text into the first word and the rest without leading whitespace."""
+    parts = text.split(maxsplit=1)
+    if not parts:
+        return "", ""
+    return parts[0], parts[1] if len(parts) > 1 else ""
@@ -1,40 +1,165 @@
 import asyncio
+from typing import Any
 
 from loguru import logger
 
 from client.api import API
+from client.execute import EXECUTE_MAX_CALLS
+from utils.metrics import REGISTRY, SIZE_BUCKETS
 
-_send_queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue()
+QueueItem = tuple[str, dict, asyncio.Future]
 
+_QUEUE_DEPTH = REGISTRY.gauge("nique_sender_queue_depth", "Calls waiting to be sent")
+_BATCH_SIZE = REGISTRY.histogram(
+    "nique_sender_batch_size", "Calls sent per request", buckets=SIZE_BUCKETS
+)
 
-async def enqueue_message(method: str, payload: dict) -> None:
+
+class MessageSender:
     """
-    Asynchronously enqueue a message to be sent to the VK API.
+    Sends queued API calls to the VK API in the background.
+
+    Calls are sharded between `workers` sender coroutines by `peer_id`, so
+    messages to one conversation keep their order while different
+    conversations are sent concurrently. Every sender wakes up as soon as a
+    call is queued and drains up to `batch_size` calls into a single
+    `execute` request.
 
-    :param method: The method to call on the VK API
-    :param payload: The payload to pass to the VK API
+    :param api: The API instance to use for sending messages
+    :param workers: The number of concurrent sender coroutines
+    :param batch_size: The maximum number of calls sent in one request (1-25)
     """
-    await _send_queue.put((method, payload))
 
+    def __init__(
+        self, api: API, workers: int = 4, batch_size: int = EXECUTE_MAX_CALLS
+    ):
+        self.api = api
+        self.workers = max(1, workers)
+        self.batch_size = max(1, min(batch_size, EXECUTE_MAX_CALLS))
+
+        self._queues: list[asyncio.Queue[QueueItem]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        """Whether the sender coroutines are running."""
+        return bool(self._tasks)
+
+    def qsize(self) -> int:
+        """The number of calls waiting to be sent."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def start(self) -> None:
+        """
+        Starts the sender coroutines. Does nothing if they are already running.
+
+        The queues are created here, inside the running event loop.
+        """
+        if self.running:
+            return
+
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue)) for queue in self._queues
+        ]
+
+    async def stop(self, drain: bool = True) -> None:
+        """
+        Stops the sender coroutines.
+
+        :param drain: Wait until every queued call is sent before stopping
+        """
+        if drain:
+            await asyncio.gather(*(queue.join() for queue in self._queues))
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, method: str, payload: dict) -> asyncio.Future:
+        """
+        Asynchronously enqueue a call to be sent to the VK API.
+
+        :param method: The method to call on the VK API
+        :param payload: The payload to pass to the VK API
+        :return: A future that resolves with the result of the call once it is sent
+        """
+        if not self.running:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        # the result is optional for callers, so never complain about unretrieved errors
+        future.add_done_callback(_consume_exception)
+
+        queue = self._queues[hash(payload.get("peer_id")) % len(self._queues)]
+        await queue.put((method, payload, future))
+        _QUEUE_DEPTH.inc()
+        return future
 
-async def start_message_sender_worker(api: API, interval: float = 0.1) -> None:
+    async def _worker(self, queue: asyncio.Queue[QueueItem]) -> None:
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            _QUEUE_DEPTH.dec(len(batch))
+            _BATCH_SIZE.observe(len(batch))
+
+            try:
+                await _send_batch(self.api, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+def get_sender(api: API) -> MessageSender:
     """
-    Starts a worker that will send messages to the VK API.
+    Returns the sender attached to the given API instance, attaching a new one
+    with default settings if there is none.
+
+    :param api: The API instance
+    :return: The `MessageSender` owned by the API instance
+    """
+    if api.sender is None:
+        api.sender = MessageSender(api)
+    return api.sender
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+def _resolve(future: asyncio.Future, result: Any) -> None:
+    if future.done():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+async def _send_batch(api: API, batch: list[QueueItem]) -> None:
+    """
+    Sends a batch of queued calls, using a single `execute` request when the
+    batch holds more than one call, and resolves the futures of their callers.
 
     :param api: The API instance to use for sending messages
-    :param interval: The interval in seconds between checks for new messages to send
+    :param batch: Queued (method, payload, future) items
     """
+    calls = [(method, payload) for method, payload, _ in batch]
 
-    async def worker():
-        while True:
-            if not _send_queue.empty():
-                method, payload = await _send_queue.get()
-                try:
-                    await api.request(method, payload)
-                except Exception as e:
-                    logger.error(
-                        f"Failed to send message: ({method}, {payload}) | Error: {e}"
-                    )
-            await asyncio.sleep(interval)
-
-    asyncio.create_task(worker())
+    try:
+        if len(calls) == 1:
+            results = [await api.request(*calls[0])]
+        else:
+            results = await api.execute(calls)
+    except Exception as e:
+        results = [e] * len(calls)
+
+    for (method, payload, future), result in zip(batch, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Failed to send message: ({method}, {payload}) | Error: {result}"
+            )
+        _resolve(future, result)
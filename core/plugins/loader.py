@@ -1,16 +1,40 @@
+import hashlib
 import importlib.util
 import os
+import re
+import sys
+import time
 from pathlib import Path
 from types import ModuleType
 from typing import Generator, Optional
 
+from loguru import logger
+
+from core.plugins.manifest import (
+    LazyPlugin,
+    NamedRouters,
+    PluginManifest,
+    describe_module,
+)
 from core.routers.router import Router
+from utils.metrics import REGISTRY
+
+# plugin modules are registered in `sys.modules` under this prefix
+PLUGIN_PACKAGE = "nique_plugins"
+MANIFEST_NAME = "nique_manifest.json"
+
+_LOAD_SECONDS = REGISTRY.gauge(
+    "nique_plugin_load_seconds", "Time spent loading a plugin directory", ("directory",)
+)
+_PLUGIN_FILES = REGISTRY.gauge(
+    "nique_plugin_files", "Plugin files by load mode", ("directory", "mode")
+)
 
 
 def discover_py_files(directory: str) -> Generator[Path, None, None]:
     """
     Walks through the given directory and yields all .py files that do not start
-    with double underscore (__).
+    with double underscore (__), in a stable order.
 
     Args:
         directory: The directory to walk in.
@@ -18,28 +42,90 @@ def discover_py_files(directory: str) -> Generator[Path, None, None]:
     Yields:
         Path: The path to the discovered .py file.
     """
-    for root, _, files in os.walk(directory):
-        for file in files:
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for file in sorted(files):
             if file.endswith(".py") and not file.startswith("__"):
                 yield Path(root) / file
 
 
-def import_module_from_path(path: Path) -> Optional[ModuleType]:
+def module_name_for(path: Path) -> str:
+    """
+    Builds a module name for a plugin file that is the same in every process.
+
+    Characters that are not valid in identifiers are replaced, so a short hash
+    of the path is appended whenever that happens, e.g. to keep `a-b.py` and
+    `a_b.py` apart.
+
+    Args:
+        path: The path to the .py file.
+
+    Returns:
+        A dotted name under `PLUGIN_PACKAGE` derived from the path.
+    """
+    path = path.resolve()
+    try:
+        parts = path.relative_to(Path.cwd()).with_suffix("").parts
+    except ValueError:
+        parts = path.with_suffix("").parts[1:]
+
+    names = [re.sub(r"\W", "_", part) for part in parts]
+    names = [f"_{name}" if name[:1].isdigit() else name for name in names]
+    if names != list(parts):
+        digest = hashlib.sha1("/".join(parts).encode()).hexdigest()[:8]
+        names[-1] = f"{names[-1]}_{digest}"
+    return ".".join([PLUGIN_PACKAGE, *names])
+
+
+def import_module_from_path(
+    path: Path, module_name: Optional[str] = None, reload: bool = False
+) -> Optional[ModuleType]:
     """
     Imports a Python module from the given path.
 
+    The module is registered in `sys.modules` under a stable name, so
+    importing the same file again returns the already imported module.
+
     Args:
         path: The path to the .py file to import.
+        module_name: The name to import the module under, defaults to
+            `module_name_for(path)`.
+        reload: Execute the file again into a new module even if it is
+            already imported. The previous module stays registered if this
+            fails.
 
     Returns:
         The imported module, or None if the import failed.
+
+    Raises:
+        ImportError: If another file is already imported under the name.
     """
-    module_name = path.stem + "_" + str(abs(hash(path)))
+    module_name = module_name or module_name_for(path)
+    previous = sys.modules.get(module_name)
+    if previous is not None:
+        imported_from = getattr(previous, "__file__", None)
+        if imported_from is None or Path(imported_from).resolve() != path.resolve():
+            raise ImportError(
+                f"Cannot import {path} as {module_name}, "
+                f"the name is already used by {imported_from}",
+                name=module_name,
+            )
+        if not reload:
+            return previous
+
     spec = importlib.util.spec_from_file_location(module_name, path)
     if not spec or not spec.loader:
         return None
     module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        if previous is not None:
+            sys.modules[module_name] = previous
+        else:
+            del sys.modules[module_name]
+        raise
     return module
 
 
@@ -53,9 +139,125 @@ def find_routers_in_module(module: ModuleType) -> list[Router]:
     Returns:
         A list of all Router instances found in the module.
     """
-    routers = []
-    for attr in dir(module):
-        obj = getattr(module, attr)
-        if isinstance(obj, Router):
-            routers.append(obj)
-    return routers
+    return [router for _, router in _named_routers(module)]
+
+
+def load_plugins(
+    directory: str, lazy: bool = False, manifest_path: Optional[Path] = None
+) -> list[Router]:
+    """
+    Loads the routers of all plugin files in the given directory.
+
+    See `load_plugin_files`.
+
+    Returns:
+        The routers of the plugins, in a stable order.
+    """
+    files = load_plugin_files(directory, lazy=lazy, manifest_path=manifest_path)
+    return [router for routers in files.values() for router in routers]
+
+
+def load_plugin_files(
+    directory: str, lazy: bool = False, manifest_path: Optional[Path] = None
+) -> dict[Path, list[Router]]:
+    """
+    Loads the routers of all plugin files in the given directory.
+
+    Files described by an up-to-date manifest entry are not imported: their
+    routers are replaced with placeholders that import the file when one of
+    its handlers first matches. Other files are imported and their entries
+    are written back to the manifest. Files with startup handlers are always
+    imported.
+
+    Args:
+        directory: The directory with plugins.
+        lazy: Defer imports using the manifest. Module-level code of a
+            deferred plugin (e.g. connecting to a database) only runs when
+            one of its handlers first matches.
+        manifest_path: Where the manifest is stored, defaults to
+            `__pycache__/nique_manifest.json` inside the directory.
+
+    Returns:
+        The routers of every plugin file, in a stable order.
+    """
+    started = time.perf_counter()
+    manifest = PluginManifest(manifest_path or _manifest_path(directory))
+
+    files: dict[Path, list[Router]] = {}
+    names: set[str] = set()
+    imported = deferred = 0
+    for path in discover_py_files(directory):
+        name = path.relative_to(directory).as_posix()
+        names.add(name)
+        stat = path.stat()
+
+        entry = manifest.get(name, stat) if lazy else None
+        if entry is not None and not entry.get("eager"):
+            files[path] = LazyPlugin(path, entry, import_module_from_path).routers()
+            deferred += 1
+            continue
+
+        module = import_module_from_path(path)
+        if module is None:
+            continue
+        named = _named_routers(module)
+        manifest.store(name, stat, describe_module(module.__name__, named, path))
+        files[path] = [router for _, router in named]
+        imported += 1
+
+    manifest.prune(names)
+    manifest.save()
+
+    elapsed = time.perf_counter() - started
+    _LOAD_SECONDS.labels(directory).set(elapsed)
+    _PLUGIN_FILES.labels(directory, "imported").set(imported)
+    _PLUGIN_FILES.labels(directory, "deferred").set(deferred)
+    logger.info(
+        f"Loaded plugins from {directory} in {elapsed * 1000:.1f} ms: "
+        f"{imported} imported, {deferred} deferred"
+    )
+    return files
+
+
+def reload_plugin_file(
+    directory: str, path: Path, manifest_path: Optional[Path] = None
+) -> list[Router]:
+    """
+    Imports a plugin file again into a new module and updates its manifest entry.
+
+    Args:
+        directory: The plugin directory containing the file.
+        path: The path to the changed .py file.
+        manifest_path: See `load_plugin_files`.
+
+    Returns:
+        The routers of the new module.
+
+    Raises:
+        Exception: Whatever the plugin raised while being imported.
+    """
+    module = import_module_from_path(path, reload=True)
+    if module is None:
+        return []
+    named = _named_routers(module)
+
+    manifest = PluginManifest(manifest_path or _manifest_path(directory))
+    manifest.store(
+        path.relative_to(directory).as_posix(),
+        path.stat(),
+        describe_module(module.__name__, named, path),
+    )
+    manifest.save()
+    return [router for _, router in named]
+
+
+def _manifest_path(directory: str) -> Path:
+    return Path(directory) / "__pycache__" / MANIFEST_NAME
+
+
+def _named_routers(module: ModuleType) -> NamedRouters:
+    return [
+        (name, value)
+        for name, value in vars(module).items()
+        if isinstance(value, Router)
+    ]
@@ -0,0 +1,270 @@
+import ast
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from core.context.event_context import EventContext
+from core.dispatcher import MessageHandler
+from core.filters import compile_filters
+from core.routers.router import Router
+
+# bumped whenever the entry format changes, older manifests are discarded
+MANIFEST_VERSION = 2
+
+# (attribute name, router) pairs found in a plugin module
+NamedRouters = list[tuple[str, Router]]
+
+
+class PluginManifest:
+    """
+    Persistent description of the routers and handlers of plugin files.
+
+    An entry is valid while the modification time and size of its file are
+    unchanged. Files whose routers have startup handlers, positional filters,
+    filters that cannot be stored as JSON (e.g. `Command`) or filters that are
+    not written as literals in the source (e.g. `text=os.getenv(...)` or an
+    imported constant, which may change without the file changing) are
+    marked `eager`: they must be imported at startup.
+
+    Args:
+        path: The JSON file the manifest is stored in.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._files: dict[str, dict[str, Any]] = {}
+        self._dirty = False
+
+        try:
+            with open(path, "rb") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self._files = data["files"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable plugin manifest {path}: {e}")
+
+    def get(self, name: str, stat: os.stat_result) -> Optional[dict[str, Any]]:
+        """
+        Returns the entry of a file if the file has not changed since.
+
+        Args:
+            name: The path of the file relative to the plugin directory.
+            stat: The current `os.stat` result of the file.
+        """
+        entry = self._files.get(name)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns:
+            if entry["size"] == stat.st_size:
+                return entry
+        return None
+
+    def store(self, name: str, stat: os.stat_result, entry: dict[str, Any]) -> None:
+        """Stores the entry of a file together with its current mtime and size."""
+        entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, **entry}
+        if self._files.get(name) != entry:
+            self._files[name] = entry
+            self._dirty = True
+
+    def prune(self, names: set[str]) -> None:
+        """Drops the entries of files that are not in `names` anymore."""
+        for name in self._files.keys() - names:
+            del self._files[name]
+            self._dirty = True
+
+    def save(self) -> None:
+        """Writes the manifest if it changed, replacing the file atomically."""
+        if not self._dirty:
+            return
+
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "files": self._files}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Could not write plugin manifest {self.path}: {e}")
+
+
+def describe_module(
+    module_name: str, routers: NamedRouters, path: Path
+) -> dict[str, Any]:
+    """
+    Builds the manifest entry of an imported plugin module.
+
+    Args:
+        module_name: The name the module was imported under.
+        routers: The routers found in the module.
+        path: The path to the plugin file.
+
+    Returns:
+        The entry with the routers and handler filters of the module.
+    """
+    described = []
+    eager = not _has_literal_filters(path)
+    for attr, router in routers:
+        if router.get_startup_handlers():
+            eager = True
+
+        handlers = []
+        for handler in router.get_handlers():
+            filters = handler.filters or {}
+            if handler.checks or not _is_json(filters):
+                eager = True
+            handlers.append(
+                {"name": handler.name, "filters": filters, "timeout": handler.timeout}
+            )
+        described.append({"attr": attr, "handlers": handlers})
+
+    if eager:
+        return {"module": module_name, "eager": True}
+    return {"module": module_name, "routers": described}
+
+
+class LazyPlugin:
+    """
+    A plugin file that is imported the first time one of its handlers matches.
+
+    Args:
+        path: The path to the plugin file.
+        entry: The manifest entry of the file.
+        importer: Function importing the file under the given module name.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        entry: dict[str, Any],
+        importer: Callable[[Path, str], Any],
+    ):
+        self.path = path
+        self.entry = entry
+        self.importer = importer
+        self._routers: Optional[dict[str, Router]] = None
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the plugin module has been imported."""
+        return self._routers is not None
+
+    def routers(self) -> list[Router]:
+        """
+        Builds placeholder routers whose handlers import the plugin on demand.
+
+        Returns:
+            Routers with the same handlers and filters as the plugin routers.
+        """
+        placeholders = []
+        for described in self.entry["routers"]:
+            router = Router()
+            for position, handler in enumerate(described["handlers"]):
+                router.get_handlers().append(
+                    LazyHandler(
+                        self,
+                        described["attr"],
+                        position,
+                        handler["name"],
+                        handler["filters"],
+                        handler.get("timeout"),
+                    )
+                )
+            placeholders.append(router)
+        return placeholders
+
+    def resolve(self, attr: str, position: int) -> MessageHandler:
+        """
+        Returns the real handler, importing the plugin if needed.
+
+        Raises:
+            Exception: If the plugin no longer defines the handler.
+        """
+        if self._routers is None:
+            module = self.importer(self.path, self.entry["module"])
+            if module is None:
+                raise Exception(f"Could not import plugin {self.path}")
+            self._routers = {
+                name: value
+                for name, value in vars(module).items()
+                if isinstance(value, Router)
+            }
+
+        router = self._routers.get(attr)
+        handlers = router.get_handlers() if router else []
+        if position >= len(handlers):
+            raise Exception(f"Plugin {self.path} no longer defines {attr}[{position}]")
+        return handlers[position]
+
+
+class LazyHandler(MessageHandler):
+    """
+    Stands in for a handler of a plugin that has not been imported yet.
+
+    The filters come from the manifest, so the handler is indexed and matched
+    like any other. The plugin is imported when the handler is first called.
+    """
+
+    def __init__(
+        self,
+        plugin: LazyPlugin,
+        attr: str,
+        position: int,
+        name: str,
+        filters: dict[str, Any],
+        timeout: Optional[float] = None,
+    ):
+        self.plugin = plugin
+        self.attr = attr
+        self.position = position
+        self.name = name
+        self.filters = filters
+        self.checks = ()
+        self.check = compile_filters(filters)
+        self.timeout = timeout
+        self._handler: Optional[MessageHandler] = None
+        self.bind_metrics()
+
+    @property
+    def func(self) -> Callable[[EventContext], Any]:
+        return self._resolve().func
+
+    def _resolve(self) -> MessageHandler:
+        if self._handler is None:
+            self._handler = self.plugin.resolve(self.attr, self.position)
+        return self._handler
+
+    async def __call__(self, ctx: EventContext):
+        await self._resolve()(ctx)
+
+
+def _has_literal_filters(path: Path) -> bool:
+    """Whether every `on_message(...)` call in the file only has literal arguments."""
+    try:
+        tree = ast.parse(path.read_bytes(), str(path))
+    except (OSError, SyntaxError, ValueError):
+        return False
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")
+        if name != "on_message":
+            continue
+        for value in [*node.args, *(keyword.value for keyword in node.keywords)]:
+            try:
+                ast.literal_eval(value)
+            except ValueError:
+                return False
+    return True
+
+
+def _is_json(value: Any) -> bool:
+    try:
+        return json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        return False
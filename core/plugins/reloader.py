@@ -0,0 +1,162 @@
+import asyncio
+from pathlib import Path
+from typing import Callable
+
+from loguru import logger
+
+from core.plugins.loader import discover_py_files, reload_plugin_file
+from core.routers.loader import get_all_routers
+from core.routers.router import Router
+
+
+class _PluginFile:
+    __slots__ = ("directory", "routers", "mtime_ns")
+
+    def __init__(self, directory: str, routers: list[Router], mtime_ns: int):
+        self.directory = directory
+        self.routers = routers
+        self.mtime_ns = mtime_ns
+
+
+class PluginReloader:
+    """
+    Watches plugin directories and swaps the routers of changed files.
+
+    Changed and new files are imported again into fresh modules, the startup
+    handlers of their routers are run, and then the old routers are replaced
+    in `routers` and in the registered routers in one step, without awaiting
+    in between. Events already being dispatched finish on the old handlers.
+    A file that fails to import keeps its old routers until it changes again.
+
+    Args:
+        routers: The live router list to update in place, e.g. `Module.routers`.
+        interval: How often the directories are scanned, in seconds.
+    """
+
+    def __init__(self, routers: list[Router], interval: float = 1.0):
+        self.routers = routers
+        self.interval = interval
+        self._directories: set[str] = set()
+        self._files: dict[Path, _PluginFile] = {}
+        self._listeners: list[Callable[[], None]] = []
+
+    def track(self, directory: str, files: dict[Path, list[Router]]) -> None:
+        """
+        Starts watching loaded plugin files.
+
+        Args:
+            directory: The plugin directory the files were loaded from.
+            files: The routers of every loaded file.
+        """
+        self._directories.add(directory)
+        for path, routers in files.items():
+            self._files[path] = _PluginFile(directory, routers, _mtime(path))
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Registers a function called right after routers were swapped."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        """Unregisters a function added with `add_listener`."""
+        self._listeners.remove(callback)
+
+    async def watch(self) -> None:
+        """Checks the directories every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.exception(f"Error while reloading plugins: {e}")
+
+    async def check(self) -> list[Path]:
+        """
+        Reloads the files changed since the last check.
+
+        Returns:
+            The paths of the files whose routers were swapped or removed.
+        """
+        current = await asyncio.to_thread(_scan, set(self._directories))
+
+        swaps: list[tuple[list[Router], list[Router]]] = []
+        changed: list[Path] = []
+        for path, (directory, mtime_ns) in current.items():
+            tracked = self._files.get(path)
+            if tracked is not None and tracked.mtime_ns == mtime_ns:
+                continue
+
+            try:
+                routers = reload_plugin_file(directory, path)
+            except Exception as e:
+                logger.exception(f"Could not reload plugin {path}: {e}")
+                if tracked is not None:
+                    tracked.mtime_ns = mtime_ns
+                else:
+                    self._files[path] = _PluginFile(directory, [], mtime_ns)
+                continue
+
+            await _run_startup_handlers(routers)
+            swaps.append((tracked.routers if tracked else [], routers))
+            self._files[path] = _PluginFile(directory, routers, mtime_ns)
+            changed.append(path)
+
+        for path in self._files.keys() - current.keys():
+            swaps.append((self._files.pop(path).routers, []))
+            changed.append(path)
+
+        if swaps:
+            self._swap(swaps)
+            logger.info(f"Reloaded plugins: {', '.join(map(str, changed))}")
+        return changed
+
+    def _swap(self, swaps: list[tuple[list[Router], list[Router]]]) -> None:
+        routers = self.routers
+        registered = get_all_routers()
+        new_routers, new_registered = list(routers), list(registered)
+        for old, new in swaps:
+            new_routers = _replace(new_routers, old, new)
+            new_registered = _replace(new_registered, old, new)
+
+        routers[:] = new_routers
+        registered[:] = new_registered
+        for callback in self._listeners:
+            callback()
+
+
+def _scan(directories: set[str]) -> dict[Path, tuple[str, int]]:
+    return {
+        path: (directory, _mtime(path))
+        for directory in directories
+        for path in discover_py_files(directory)
+    }
+
+
+def _mtime(path: Path) -> int:
+    return path.stat().st_mtime_ns
+
+
+def _replace(
+    routers: list[Router], old: list[Router], new: list[Router]
+) -> list[Router]:
+    """Puts `new` where the first router of `old` was and drops the rest of `old`."""
+    old_ids = {id(router) for router in old}
+    result: list[Router] = []
+    inserted = False
+    for router in routers:
+        if id(router) not in old_ids:
+            result.append(router)
+        elif not inserted:
+            result.extend(new)
+            inserted = True
+    if not inserted:
+        result.extend(new)
+    return result
+
+
+async def _run_startup_handlers(routers: list[Router]) -> None:
+    for router in routers:
+        for handler in router.get_startup_handlers():
+            try:
+                await handler()
+            except Exception as e:
+                logger.exception(f"Error in on_startup handler: {e}")
@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Any, AsyncGenerator, Dict
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, Optional
+
+if TYPE_CHECKING:
+    from client.api import API
+    from client.checkpoint import CheckpointMarker
 
 
 class LongPollProvider(ABC):
@@ -10,8 +14,59 @@ class LongPollProvider(ABC):
 
         This is an asynchronous generator method that continuously listens for
         incoming events from the long poll server. Each event is yielded as a
-        dictionary containing event data.
+        dictionary containing event data. With a `long_poll_checkpoint` on the
+        API, a `CheckpointMarker` is yielded after the events of every batch
+        and must be passed on to the runner, which commits it once those
+        events are processed.
 
         :return: An asynchronous generator yielding event data dictionaries.
         """
         pass
+
+
+class UpdatesProvider(LongPollProvider):
+    """
+    Long poll provider that turns batches of raw long poll updates into
+    message objects.
+
+    Polling (`batches`) and the conversion of a batch (`messages`) are
+    separate, so the raw updates can be recorded and replayed through the
+    same conversion.
+
+    :param client: The API instance to poll with
+    """
+
+    def __init__(self, client: "API"):
+        self.client = client
+
+    async def listen(self) -> AsyncGenerator[Dict[str, Any], None]:
+        async for updates, marker in self.batches():
+            async for message in self.messages(updates):
+                yield message
+            if marker is not None:
+                yield marker
+
+    async def batches(
+        self,
+    ) -> AsyncGenerator[tuple[list[Any], Optional["CheckpointMarker"]], None]:
+        """
+        Polls the long poll server.
+
+        :return: An asynchronous generator yielding the raw updates of every
+            response with the checkpoint marker of the state after them
+        """
+        while True:
+            updates = await self.client.get_long_poll_events()
+            yield updates, self.client.checkpoint_marker()
+
+    @abstractmethod
+    async def messages(
+        self, updates: list[Any]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Converts a batch of raw long poll updates into message objects.
+
+        :param updates: The `updates` of one long poll response
+        :return: An asynchronous generator yielding the message objects
+        """
+        yield {}
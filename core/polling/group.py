@@ -1,20 +1,38 @@
 from typing import Any, AsyncGenerator, Dict
 
 from client.api import API
-from core.polling.base import LongPollProvider
-
-
-class GroupLongPollProvider(LongPollProvider):
-    def __init__(self, client: API):
-        self.client = client
-
-    async def listen(self) -> AsyncGenerator[Dict[str, Any], None]:
-        while True:
-            events = await self.client.get_long_poll_events()
-            for event in events:
-                if event.get("type") == "message_new":
-                    full_message = await self.client.get_message_by_id(
-                        peer_id=event["object"]["message"]["peer_id"],
-                        cmids=event["object"]["message"]["conversation_message_id"],
-                    )
-                    yield full_message
+from core.polling.base import UpdatesProvider
+
+
+class GroupLongPollProvider(UpdatesProvider):
+    """
+    Long poll provider for group tokens.
+
+    The group long poll already delivers the whole message object in
+    `message_new` events, so it is yielded as is. Fields missing from the
+    payload can be loaded on demand with `EventContext.get_full_message`.
+
+    :param client: API instance with a group token
+    :param hydrate: Reload every message with `messages.getById` before
+        yielding it (one extra api call per event)
+    """
+
+    def __init__(self, client: API, hydrate: bool = False):
+        super().__init__(client)
+        self.hydrate = hydrate
+
+    async def messages(
+        self, updates: list[Any]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        for event in updates:
+            if event.get("type") == "message_new":
+                message = event["object"]["message"]
+                if not self.hydrate:
+                    yield message
+                    continue
+
+                full_message = await self.client.get_message_by_id(
+                    peer_id=message["peer_id"],
+                    cmids=message["conversation_message_id"],
+                )
+                yield full_message
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+from loguru import logger
+
+Job = Callable[[], Awaitable[None]]
+
+
+class PeerTaskPool:
+    """
+    Runs jobs concurrently while keeping jobs with the same key in order.
+
+    Every key (usually `peer_id`) gets its own lane that is drained by a single
+    task, so events of one conversation are processed one after another while
+    different conversations run in parallel. At most `max_in_flight` jobs may
+    be queued or running at once; `submit` waits for a free slot, which gives
+    backpressure to the caller.
+
+    :param max_in_flight: The maximum number of queued and running jobs
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._in_flight = 0
+        self._lanes: dict[Hashable, deque[Job]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        """The number of queued and running jobs."""
+        return self._in_flight
+
+    async def submit(self, key: Hashable, job: Job) -> None:
+        """
+        Schedules a job after all previously submitted jobs with the same key.
+
+        Waits while the pool is full.
+
+        :param key: The ordering key, e.g. `peer_id`
+        :param job: A coroutine function without arguments
+        """
+        await self._slots.acquire()
+        self._in_flight += 1
+
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(job)
+            return
+
+        self._lanes[key] = deque([job])
+        task = asyncio.create_task(self._run_lane(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def join(self) -> None:
+        """Waits until every submitted job is finished."""
+        while self._tasks:
+            tasks = list(self._tasks)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # the done callbacks may not have run yet, e.g. for cancelled lanes
+            self._tasks.difference_update(tasks)
+
+    async def _run_lane(self, key: Hashable) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                job = lane.popleft()
+                try:
+                    await job()
+                except Exception as e:
+                    logger.exception(f"Error while processing event: {e}")
+                finally:
+                    self._in_flight -= 1
+                    self._slots.release()
+        finally:
+            del self._lanes[key]
@@ -0,0 +1,82 @@
+import asyncio
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from core.polling.base import LongPollProvider
+
+
+class PrefetchingProvider(LongPollProvider):
+    """
+    Runs another long poll provider in a background task and buffers its events.
+
+    The next long poll request is issued while the previous batch is still
+    being dispatched. When the buffer reaches `high_watermark` events the
+    background task stops polling until the consumer drains it down to
+    `low_watermark`, so memory stays bounded when dispatch is slow.
+
+    :param provider: The provider to prefetch events from
+    :param high_watermark: Buffer size at which polling is paused
+    :param low_watermark: Buffer size at which polling is resumed, defaults to
+        a quarter of `high_watermark`
+    """
+
+    def __init__(
+        self,
+        provider: LongPollProvider,
+        high_watermark: int = 1000,
+        low_watermark: Optional[int] = None,
+    ):
+        if low_watermark is None:
+            low_watermark = high_watermark // 4
+        if not 0 <= low_watermark < high_watermark:
+            raise ValueError("low_watermark must be lower than high_watermark")
+
+        self.provider = provider
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+
+        self._buffer: deque[Dict[str, Any]] = deque()
+        self._not_empty = asyncio.Event()
+        self._resume = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._finished = False
+
+    @property
+    def buffered(self) -> int:
+        """The number of prefetched events waiting to be consumed."""
+        return len(self._buffer)
+
+    async def listen(self) -> AsyncGenerator[Dict[str, Any], None]:
+        task = asyncio.create_task(self._prefetch())
+        try:
+            while True:
+                if not self._buffer:
+                    if self._finished:
+                        if self._error:
+                            raise self._error
+                        return
+                    self._not_empty.clear()
+                    await self._not_empty.wait()
+                    continue
+
+                event = self._buffer.popleft()
+                if len(self._buffer) <= self.low_watermark:
+                    self._resume.set()
+                yield event
+        finally:
+            task.cancel()
+
+    async def _prefetch(self) -> None:
+        try:
+            async for event in self.provider.listen():
+                self._buffer.append(event)
+                self._not_empty.set()
+
+                if len(self._buffer) >= self.high_watermark:
+                    self._resume.clear()
+                    await self._resume.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._finished = True
+            self._not_empty.set()
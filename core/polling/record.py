@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from loguru import logger
+
+from client.decoder import get_json_decoder, get_json_encoder
+from core.polling.base import LongPollProvider, UpdatesProvider
+
+
+class RecordingProvider(LongPollProvider):
+    """
+    Appends the raw long poll updates of another provider to a file and yields
+    the messages converted from them.
+
+    Every long poll response is written as one JSON line `[unix_time, updates]`
+    before it is normalized or hydrated, so a capture can be appended to across
+    restarts and replayed with :class:`ReplayProvider` through the same
+    conversion. Writes are buffered and flushed every `flush_interval` seconds
+    and when listening stops, so responses of the last interval may be lost if
+    the process is killed. Checkpoint markers are passed through without being
+    recorded.
+
+    :param provider: The provider to record
+    :param path: The file to append the updates to
+    :param flush_interval: How often buffered updates are flushed, in seconds
+    """
+
+    def __init__(
+        self, provider: UpdatesProvider, path: str, flush_interval: float = 1.0
+    ):
+        self.provider = provider
+        self.path = path
+        self.flush_interval = flush_interval
+        self.recorded = 0
+
+    async def listen(self) -> AsyncGenerator[Dict[str, Any], None]:
+        encode = get_json_encoder()
+
+        with open(self.path, "ab") as file:
+            last_flush = time.monotonic()
+            try:
+                async for updates, marker in self.provider.batches():
+                    if updates:
+                        file.write(encode([round(time.time(), 3), updates]) + b"\n")
+                        self.recorded += 1
+
+                        now = time.monotonic()
+                        if now - last_flush >= self.flush_interval:
+                            file.flush()
+                            last_flush = now
+
+                    async for message in self.provider.messages(updates):
+                        yield message
+                    if marker is not None:
+                        yield marker
+            finally:
+                file.flush()
+
+
+class ReplayProvider(LongPollProvider):
+    """
+    Yields the messages of the updates captured by :class:`RecordingProvider`.
+
+    Every recorded batch is converted by `provider`, the same kind of provider
+    that recorded it, so normalization and hydration run again on replay. User
+    long poll updates only carry message ids, so replaying them loads the
+    messages through the provider's API instance.
+
+    The file is read line by line, so captures larger than memory can be
+    replayed. With `speed` the original gaps between batches are kept (divided
+    by `speed`), without it batches are yielded as fast as they are consumed.
+    Listening ends after the last batch.
+
+    :param path: The capture file
+    :param provider: Converts the recorded updates into messages, e.g.
+        `GroupLongPollProvider(api)`
+    :param speed: Replay pace relative to the recording, None for no delays
+    :param max_delay: The longest pause between two batches, in seconds, e.g.
+        to skip the downtime between two recording sessions
+    """
+
+    def __init__(
+        self,
+        path: str,
+        provider: UpdatesProvider,
+        speed: Optional[float] = 1.0,
+        max_delay: Optional[float] = None,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive")
+
+        self.path = path
+        self.provider = provider
+        self.speed = speed
+        self.max_delay = max_delay
+        self.replayed = 0
+
+    async def listen(self) -> AsyncGenerator[Dict[str, Any], None]:
+        decode = get_json_decoder()
+
+        with open(self.path, "rb") as file:
+            started: Optional[float] = None
+            first: Optional[float] = None
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    recorded_at, updates = decode(line)
+                except Exception:
+                    # a partially written last line of a killed recording
+                    logger.warning(f"Skipping malformed line {number} of {self.path}")
+                    continue
+
+                if self.speed is not None:
+                    if first is None:
+                        first, started = recorded_at, time.monotonic()
+                    delay = (recorded_at - first) / self.speed - (
+                        time.monotonic() - started
+                    )
+                    if self.max_delay is not None and delay > self.max_delay:
+                        # shift the timeline so the long gap is not waited again
+                        first += (delay - self.max_delay) * self.speed
+                        delay = self.max_delay
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                self.replayed += 1
+                async for message in self.provider.messages(updates):
+                    yield message
@@ -1,38 +1,127 @@
-from typing import List
+from collections import deque
+from functools import partial
+from typing import Any, List, Optional, Union
 
 from loguru import logger
 
 from client.api import API
+from client.checkpoint import CheckpointMarker
 from core.context.event_context import EventContext
-from core.dispatcher import dispatch_event
+from core.dispatcher import (
+    DISPATCH_POLICIES,
+    DispatchIndex,
+    DispatchPolicy,
+    dispatch_event,
+)
 from core.polling.adapter import normalize_event
+from core.polling.base import LongPollProvider, UpdatesProvider
 from core.polling.group import GroupLongPollProvider
+from core.polling.pool import PeerTaskPool
+from core.polling.prefetch import PrefetchingProvider
+from core.polling.record import RecordingProvider
 from core.polling.user import UserLongPollProvider
 from core.routers.router import Router
 
 
 class PollingRunner:
-    def __init__(self, api: API, routers: List[Router]):
+    """
+    Listens to the long poll server and dispatches events to the routers.
+
+    :param api: an instance of API
+    :param routers: a list of Router instances
+    :param max_concurrency: if set, events are dispatched concurrently with at
+        most this many events in flight; events with the same `peer_id` are
+        still processed in order. By default events are dispatched one by one.
+    :param hydrate: reload every group long poll message with
+        `messages.getById` instead of using the long poll payload as is
+    :param prefetch: poll in a background task that fetches the next batch
+        while the current one is dispatched
+    :param high_watermark: with `prefetch`, the number of buffered events at
+        which polling is paused
+    :param low_watermark: with `prefetch`, the number of buffered events at
+        which polling is resumed, defaults to a quarter of `high_watermark`
+    :param record: append the raw updates of every long poll response to this
+        file, see `RecordingProvider`
+    :param dispatch_policy: how the handlers matching an event are run, see
+        `DispatchPolicy`
+    :param handler_timeout: seconds a handler may run before it is
+        cancelled, unless the handler has its own timeout
+
+    With a `long_poll_checkpoint` on the API, the state after a batch is
+    stored only once every event of the batch and of the batches before it
+    has been dispatched, including events buffered by `prefetch` or queued
+    in the `max_concurrency` pool, so a restart never skips an event that
+    was received but not processed. Events may be processed twice instead.
+    """
+
+    def __init__(
+        self,
+        api: API,
+        routers: List[Router],
+        max_concurrency: Optional[int] = None,
+        hydrate: bool = False,
+        prefetch: bool = False,
+        high_watermark: int = 1000,
+        low_watermark: Optional[int] = None,
+        record: Optional[str] = None,
+        dispatch_policy: DispatchPolicy = "sequential",
+        handler_timeout: Optional[float] = None,
+    ):
+        if dispatch_policy not in DISPATCH_POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {dispatch_policy}")
+
         self.api = api
         self.routers = routers
+        self.max_concurrency = max_concurrency
+        self.hydrate = hydrate
+        self.prefetch = prefetch
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.record = record
+        self.dispatch_policy = dispatch_policy
+        self.handler_timeout = handler_timeout
+        self.index = DispatchIndex(routers)
+        self._pool: Optional[PeerTaskPool] = None
+
+        # events are numbered in the order they are received; a checkpoint is
+        # committed once no event numbered before it is still outstanding.
+        # `_first_outstanding` only moves forward, so finding it again after
+        # an event is processed is amortized O(1)
+        self._received = 0
+        self._outstanding: set[int] = set()
+        self._first_outstanding = 0
+        self._checkpoints: deque[tuple[int, CheckpointMarker]] = deque()
 
     async def start(self):
         """
         Start longpolling for the given client and routers.
 
-        :param client: an instance of BaseClient
-        :param routers: a list of Router instances
-        :param load_full: if True, will load the full message before dispatching, defaults to True
-
         :return: None
         """
         token_type = await self.api.detect_token_type()
+        await self.run(self.create_provider(token_type), is_user=token_type == "user")
 
-        if token_type == "user":
-            poller = UserLongPollProvider(self.api)
-        else:
-            poller = GroupLongPollProvider(self.api)
+    async def run(self, provider: LongPollProvider, is_user: bool) -> None:
+        """
+        Dispatches the events of the given provider until it is exhausted.
+
+        :param provider: The provider to listen to, e.g. a `ReplayProvider`
+        :param is_user: Whether the events were received with a user token
+        """
+        await self.prepare()
+        try:
+            async for raw_event in provider.listen():
+                # waits while the pool is full, so the poller is paused
+                await self.handle(raw_event, is_user=is_user)
+        finally:
+            await self.close()
+
+    async def prepare(self) -> None:
+        """
+        Runs startup handlers and compiles the routers for dispatching.
 
+        Must be called before events are passed to `handle`.
+        """
         for router in self.routers:
             for handler in router.get_startup_handlers():
                 try:
@@ -40,15 +129,154 @@ class PollingRunner:
                 except Exception as e:
                     logger.exception(f"Error in on_startup handler: {e}")
 
-        async for raw_event in poller.listen():
-            try:
-                event = normalize_event(raw_event, is_user=token_type == "user")
+        # handlers are compiled after startup handlers had a chance to register more
+        self.index = DispatchIndex(self.routers)
+        if self.max_concurrency:
+            self._pool = PeerTaskPool(self.max_concurrency)
+
+    def refresh(self) -> None:
+        """
+        Recompiles the dispatch index after `routers` was changed in place.
+
+        Events that are already being dispatched keep their handlers.
+        """
+        self.index = DispatchIndex(self.routers)
+
+    async def handle(
+        self,
+        raw_event: Union[dict[str, Any], CheckpointMarker],
+        is_user: bool,
+        api: Optional[API] = None,
+    ) -> None:
+        """
+        Normalizes a raw message object and dispatches it to the routers.
+
+        With `max_concurrency` the event is only scheduled, and the call waits
+        while the maximum number of events is already in flight. A checkpoint
+        marker is committed once every event passed before it is processed.
+
+        :param raw_event: Raw message object or checkpoint marker
+        :param is_user: Whether the event was received with a user token
+        :param api: The API instance the event was received with, defaults
+            to `self.api`
+        """
+        if isinstance(raw_event, CheckpointMarker):
+            self._checkpoints.append((self._received, raw_event))
+            self._commit_checkpoints()
+            return
+
+        number = self._received
+        self._received += 1
+        self._outstanding.add(number)
+        try:
+            ctx = self.build_context(raw_event, is_user=is_user, api=api)
 
-                if not event:
-                    continue
+            if not ctx:
+                self._processed(number)
+                return
 
-                ctx = EventContext(event, self.api)
-                await dispatch_event(ctx, self.routers)
+            if self._pool:
+                # conversations of different tokens are different conversations
+                key = ctx.peer_id if api is None else (id(api), ctx.peer_id)
+                await self._pool.submit(key, partial(self._dispatch, ctx, number))
+            else:
+                await self._dispatch(ctx, number)
 
-            except Exception as e:
-                logger.exception(f"Error while processing event: {e}")
+        except Exception as e:
+            logger.exception(f"Error while processing event: {e}")
+            self._processed(number)
+
+    async def close(self) -> None:
+        """Waits until every scheduled event is processed."""
+        if self._pool:
+            await self._pool.join()
+
+    def create_provider(
+        self, token_type: str, api: Optional[API] = None
+    ) -> LongPollProvider:
+        """
+        Creates the long poll provider for the given token type.
+
+        :param token_type: "group" or "user"
+        :param api: The API instance to poll with, defaults to `self.api`
+        :return: The provider to listen to
+        """
+        api = api or self.api
+        updates: UpdatesProvider
+        if token_type == "user":
+            updates = UserLongPollProvider(api)
+        else:
+            updates = GroupLongPollProvider(api, hydrate=self.hydrate)
+
+        poller: LongPollProvider = updates
+        if self.record:
+            poller = RecordingProvider(updates, self.record)
+
+        if self.prefetch:
+            poller = PrefetchingProvider(
+                poller,
+                high_watermark=self.high_watermark,
+                low_watermark=self.low_watermark,
+            )
+        return poller
+
+    def build_context(
+        self, raw_event: dict[str, Any], is_user: bool, api: Optional[API] = None
+    ) -> Optional[EventContext]:
+        """
+        Normalizes a raw event and wraps it into an `EventContext`.
+
+        :param raw_event: Raw message object
+        :param is_user: Whether the event was received with a user token
+        :param api: The API instance handlers reply with, defaults to `self.api`
+        :return: The context, or None if the event is not a message
+        """
+        event = normalize_event(raw_event, is_user=is_user)
+
+        if not event:
+            return None
+
+        return EventContext(event, api or self.api)
+
+    async def _dispatch(self, ctx: EventContext, number: int) -> None:
+        # a cancelled event is not marked as processed, so no later checkpoint
+        # is committed and the event is received again after a restart
+        await self.dispatch(ctx)
+        self._processed(number)
+
+    def _processed(self, number: int) -> None:
+        self._outstanding.discard(number)
+        if number != self._first_outstanding:
+            return
+
+        first = number + 1
+        while first < self._received and first not in self._outstanding:
+            first += 1
+        self._first_outstanding = first
+        self._commit_checkpoints()
+
+    def _commit_checkpoints(self) -> None:
+        if not self._checkpoints:
+            return
+
+        # only the latest marker of every token has to be stored
+        latest: dict[int, CheckpointMarker] = {}
+        first_outstanding = self._first_outstanding
+        while self._checkpoints and self._checkpoints[0][0] <= first_outstanding:
+            marker = self._checkpoints.popleft()[1]
+            latest[id(marker.checkpoint)] = marker
+        for marker in latest.values():
+            marker.commit()
+
+    async def dispatch(self, ctx: EventContext) -> None:
+        """
+        Dispatches a single event to the routers, logging any error.
+
+        :param ctx: The context of the event
+        """
+        try:
+            await dispatch_event(
+                ctx, self.index, self.dispatch_policy, self.handler_timeout
+            )
+        except Exception as e:
+            logger.exception(f"Error while processing event: {e}")
@@ -0,0 +1,216 @@
+import asyncio
+import multiprocessing
+import queue
+from multiprocessing.process import BaseProcess
+from typing import Any, Optional
+
+from loguru import logger
+
+from client.api import API
+from core.dispatcher import DispatchPolicy
+from core.polling.group import GroupLongPollProvider
+from core.polling.runner import PollingRunner
+from core.polling.user import UserLongPollProvider
+
+# put into a shard queue to stop the worker process
+_STOP = None
+
+
+class ShardedRunner:
+    """
+    Polls in the current process and dispatches events in worker processes.
+
+    Events are sharded by `peer_id`, so every conversation is always handled
+    by the same worker and keeps its order, while CPU-heavy handlers of
+    different conversations run on different cores. Every worker loads the
+    same plugin directories and sends messages through its own `API`
+    instance; the rate limit of the token is split between the workers.
+
+    Routers added with `Module.add_router` are not available in the workers,
+    only routers found in the plugin directories are.
+
+    Long poll checkpoints are not supported: events are acknowledged once
+    they are queued for a worker, so a stored state could skip events that
+    were still waiting in a queue.
+
+    :param api: The API instance used for polling
+    :param plugins: Plugin directories loaded by every worker
+    :param processes: The number of worker processes, defaults to the number
+        of CPU cores
+    :param max_concurrency: Per-worker limit of events in flight, see
+        `PollingRunner`
+    :param queue_size: The maximum number of events waiting for a worker;
+        polling is paused while the queue of a worker is full
+    :param sender_workers: The number of sender coroutines in every worker
+    :param dispatch_policy: See `PollingRunner`
+    :param handler_timeout: See `PollingRunner`
+    """
+
+    def __init__(
+        self,
+        api: API,
+        plugins: list[str],
+        processes: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        queue_size: int = 1000,
+        sender_workers: int = 4,
+        dispatch_policy: DispatchPolicy = "sequential",
+        handler_timeout: Optional[float] = None,
+    ):
+        self.api = api
+        self.plugins = plugins
+        self.processes = max(1, processes or multiprocessing.cpu_count())
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.sender_workers = sender_workers
+        self.dispatch_policy = dispatch_policy
+        self.handler_timeout = handler_timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: list[multiprocessing.Queue] = []
+        self._workers: list[BaseProcess] = []
+
+    async def start(self) -> None:
+        """
+        Starts the worker processes and polls until cancelled.
+
+        :return: None
+        """
+        if self.api.long_poll_checkpoint is not None:
+            raise ValueError("ShardedRunner does not support long poll checkpoints")
+
+        token_type = await self.api.detect_token_type()
+        is_user = token_type == "user"
+        rate_limit = self.api.rate_limiter.max_rate / self.processes
+
+        for shard in range(self.processes):
+            shard_queue = self._context.Queue(maxsize=self.queue_size)
+            worker = self._context.Process(
+                target=_run_worker,
+                args=(
+                    shard,
+                    shard_queue,
+                    self.api.access_token,
+                    self.plugins,
+                    rate_limit,
+                    self.max_concurrency,
+                    self.sender_workers,
+                    self.dispatch_policy,
+                    self.handler_timeout,
+                ),
+                name=f"nique-shard-{shard}",
+                daemon=True,
+            )
+            worker.start()
+            self._queues.append(shard_queue)
+            self._workers.append(worker)
+
+        logger.info(f"Started {self.processes} dispatch worker processes")
+
+        poller = (
+            UserLongPollProvider(self.api)
+            if is_user
+            else GroupLongPollProvider(self.api)
+        )
+        try:
+            async for raw_event in poller.listen():
+                await self.submit(raw_event)
+        finally:
+            await self.stop()
+
+    async def submit(self, raw_event: dict[str, Any]) -> None:
+        """
+        Sends a raw message object to the worker owning its conversation.
+
+        Waits while the queue of that worker is full.
+
+        :param raw_event: Raw message object
+        """
+        shard_queue = self._queues[hash(raw_event.get("peer_id")) % self.processes]
+        try:
+            shard_queue.put_nowait(raw_event)
+        except queue.Full:
+            await asyncio.to_thread(shard_queue.put, raw_event)
+
+    async def stop(self) -> None:
+        """Lets the workers finish queued events and waits for them to exit."""
+        for shard_queue in self._queues:
+            await asyncio.to_thread(shard_queue.put, _STOP)
+        for worker in self._workers:
+            await asyncio.to_thread(worker.join)
+
+        self._queues = []
+        self._workers = []
+
+
+def _run_worker(
+    shard: int,
+    shard_queue: multiprocessing.Queue,
+    access_token: str,
+    plugins: list[str],
+    rate_limit: float,
+    max_concurrency: Optional[int],
+    sender_workers: int,
+    dispatch_policy: DispatchPolicy,
+    handler_timeout: Optional[float],
+) -> None:
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(
+            _serve_shard(
+                shard,
+                shard_queue,
+                access_token,
+                plugins,
+                rate_limit,
+                max_concurrency,
+                sender_workers,
+                dispatch_policy,
+                handler_timeout,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve_shard(
+    shard: int,
+    shard_queue: multiprocessing.Queue,
+    access_token: str,
+    plugins: list[str],
+    rate_limit: float,
+    max_concurrency: Optional[int],
+    sender_workers: int,
+    dispatch_policy: DispatchPolicy,
+    handler_timeout: Optional[float],
+) -> None:
+    # imported here, `module` imports this module
+    from module import Module
+
+    module = Module(
+        api=API(access_token=access_token, rate_limit=rate_limit),
+        plugins=plugins,
+        sender_workers=sender_workers,
+    )
+    is_user = await module.api.detect_token_type() == "user"
+
+    runner = PollingRunner(
+        module.api,
+        module.routers,
+        max_concurrency=max_concurrency,
+        dispatch_policy=dispatch_policy,
+        handler_timeout=handler_timeout,
+    )
+    await module.sender.start()
+    await runner.prepare()
+    logger.info(f"Dispatch worker {shard} is ready")
+
+    try:
+        while True:
+            raw_event = await asyncio.to_thread(shard_queue.get)
+            if raw_event is _STOP:
+                break
+            await runner.handle(raw_event, is_user=is_user)
+    finally:
+        await runner.close()
+        await module.sender.stop()
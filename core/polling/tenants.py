@@ -0,0 +1,140 @@
+import asyncio
+from typing import Any, List, Optional
+
+import niquests
+from loguru import logger
+
+from client.api import API
+from client.latency import backoff_delay
+from core.dispatcher import DispatchPolicy
+from core.message_queue.worker import MessageSender
+from core.polling.runner import PollingRunner
+from core.routers.router import Router
+
+
+class TenantRunner:
+    """
+    Runs many bot tokens in one event loop.
+
+    All tokens share the HTTP session for method calls, one session for
+    long poll requests and one dispatch engine (a single `PollingRunner`
+    with one compiled index, one set of startup handlers and one
+    concurrency limit). Every token keeps its own `API` instance with its
+    own rate limiter, long poll state, cache and `MessageSender`, and
+    handlers reply through the token that received the event.
+
+    A token that fails (e.g. a revoked token) is retried with a growing
+    delay without affecting the other tokens.
+
+    :param routers: Router instances shared by all tokens
+    :param session: HTTP session for method calls; a multiplexed session is
+        created if not given. A given session is not closed by `close`
+    :param max_concurrency: Limit of events processed at once over all
+        tokens; events of one conversation are processed in order
+    :param sender_workers: Sender coroutines per token
+    :param long_poll_pool_size: Long poll connections kept open, at least
+        one per token is needed
+    :param dispatch_policy: See `PollingRunner`
+    :param handler_timeout: See `PollingRunner`
+    :param api_options: Default keyword arguments of every `API` instance
+    """
+
+    def __init__(
+        self,
+        routers: List[Router],
+        session: Optional[niquests.AsyncSession] = None,
+        max_concurrency: Optional[int] = None,
+        sender_workers: int = 1,
+        long_poll_pool_size: int = 100,
+        dispatch_policy: DispatchPolicy = "sequential",
+        handler_timeout: Optional[float] = None,
+        **api_options: Any,
+    ):
+        self.routers = routers
+        self._owns_session = session is None
+        self.session = session or niquests.AsyncSession(multiplexed=True)
+        self.long_poll_session = niquests.AsyncSession(
+            pool_connections=10, pool_maxsize=long_poll_pool_size
+        )
+        self.max_concurrency = max_concurrency
+        self.sender_workers = sender_workers
+        self.dispatch_policy = dispatch_policy
+        self.handler_timeout = handler_timeout
+        self.api_options = api_options
+
+        self.apis: list[API] = []
+        self.engine: Optional[PollingRunner] = None
+
+    def add_token(self, access_token: str, **api_options: Any) -> API:
+        """
+        Adds a bot token. Must be called before `run`.
+
+        :param access_token: Group or user access token
+        :param api_options: `API` keyword arguments overriding the defaults,
+            e.g. `long_poll_checkpoint`
+        :return: The API instance of the token
+        """
+        api = API(
+            access_token,
+            session=self.session,
+            long_poll_session=self.long_poll_session,
+            **{**self.api_options, **api_options},
+        )
+        api.sender = MessageSender(api, workers=self.sender_workers)
+        self.apis.append(api)
+        return api
+
+    def refresh(self) -> None:
+        """Recompiles the dispatch index after `routers` was changed in place."""
+        if self.engine is not None:
+            self.engine.refresh()
+
+    async def run(self) -> None:
+        """Polls every token until cancelled."""
+        if not self.apis:
+            raise ValueError("add at least one token before running")
+
+        self.engine = PollingRunner(
+            self.apis[0],
+            self.routers,
+            max_concurrency=self.max_concurrency,
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+        )
+        await self.engine.prepare()
+        for api in self.apis:
+            await api.sender.start()
+
+        try:
+            await asyncio.gather(
+                *(self._poll(number, api) for number, api in enumerate(self.apis))
+            )
+        finally:
+            await self.engine.close()
+            for api in self.apis:
+                await api.sender.stop()
+
+    async def close(self) -> None:
+        """Closes the HTTP sessions created by the runner."""
+        if self._owns_session:
+            await self.session.close()
+        await self.long_poll_session.close()
+
+    async def _poll(self, number: int, api: API) -> None:
+        failures = 0
+        while True:
+            try:
+                token_type = await api.detect_token_type()
+                provider = self.engine.create_provider(token_type, api)
+                async for raw_event in provider.listen():
+                    failures = 0
+                    await self.engine.handle(
+                        raw_event, is_user=token_type == "user", api=api
+                    )
+            except Exception as e:
+                failures += 1
+                delay = backoff_delay(failures, base=1.0, cap=60.0)
+                logger.exception(
+                    f"Polling of token #{number} failed, retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
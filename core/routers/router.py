@@ -17,6 +17,10 @@ class Router:
     @router.on_message(text="hello")
     async def greet(ctx: MessageContext):
         await ctx.answer("zdarova.")
+
+    @router.on_message(Command("ban", args=(int,)), from_id=ADMINS)
+    async def ban(ctx: MessageContext):
+        user_id, = ctx.args
     ```
     """
 
@@ -25,12 +29,22 @@ class Router:
         self._startup_handlers: list[Callable[[], Awaitable[None]]] = []
 
     def on_message(
-        self, **filters: Optional[Any]
+        self, *checks: Any, timeout: Optional[float] = None, **filters: Optional[Any]
     ) -> Callable[[HandlerFunc], HandlerFunc]:
         """
         Register a new message handler with optional filters.
 
+        Filter values are compared for equality with the context attribute of
+        the same name, except for sets (membership), callables (predicates
+        getting the attribute value) and `core.filters` filters like
+        `Command`, `StartsWith` and `Regex`. All filters are compiled into one
+        predicate at registration, cheapest checks first.
+
         Args:
+            *checks: Filters applied to the message text, or predicates
+                getting the context.
+            timeout: Seconds the handler may run before it is cancelled,
+                overrides the default timeout of the runner.
             **filters: Keyword arguments used to filter incoming message events.
 
         Returns:
@@ -38,7 +52,7 @@ class Router:
         """
 
         def decorator(func: HandlerFunc) -> HandlerFunc:
-            handler = MessageHandler(func, filters)
+            handler = MessageHandler(func, filters, checks, timeout=timeout)
             self._message_handlers.append(handler)
             return func
 
@@ -0,0 +1,169 @@
+import asyncio
+import hmac
+import json
+from collections import OrderedDict
+from typing import Any, Optional
+
+from loguru import logger
+
+from core.polling.runner import PollingRunner
+from utils.http import HTTPRequest, HTTPResponse, start_http_server
+from utils.metrics import REGISTRY
+
+# how many recent event ids are remembered to skip events redelivered by VK
+_SEEN_EVENTS_LIMIT = 1024
+
+_RETRIES = REGISTRY.counter(
+    "nique_webhook_retries_total",
+    "Callback API requests redelivered by VK, by whether the event was new",
+    ("outcome",),
+)
+
+
+class CallbackServer:
+    """
+    Serves VK Callback API requests and feeds the events into the runner.
+
+    Answers the `confirmation` request with the confirmation code, rejects
+    requests with a wrong secret and acknowledges every other request with
+    `ok` as soon as the event is scheduled. Events redelivered by VK (e.g.
+    when the first answer was late) are recognized by their `event_id` and
+    only acknowledged. `message_new` events go through
+    the same normalize -> `EventContext` -> `dispatch_event` pipeline as long
+    poll events.
+
+    With `max_concurrency` on the runner an event is scheduled on its pool
+    (waiting while the pool is full), otherwise it is dispatched in a
+    background task, so the answer never waits for the handlers.
+
+    :param runner: The runner whose pipeline processes the events
+    :param confirmation_code: The string returned for the `confirmation` request
+    :param secret: The secret key set in the Callback API settings
+    :param path: The URL path VK sends requests to
+    :param group_id: If set, requests for other groups are rejected
+    """
+
+    def __init__(
+        self,
+        runner: PollingRunner,
+        confirmation_code: str,
+        secret: Optional[str] = None,
+        path: str = "/",
+        group_id: Optional[int] = None,
+    ):
+        self.runner = runner
+        self.confirmation_code = confirmation_code
+        self.secret = secret
+        self.path = path
+        self.group_id = group_id
+
+        self._seen_events: OrderedDict[str, None] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.Server:
+        """
+        Starts listening for Callback API requests.
+
+        :param host: The interface to listen on
+        :param port: The port to listen on, 0 picks a free one
+        :return: The started server
+        """
+        server = await start_http_server(self.handle_request, host, port)
+        logger.info(f"Callback API server is listening on {host}:{port}{self.path}")
+        return server
+
+    async def handle_request(self, request: HTTPRequest) -> HTTPResponse:
+        """
+        Handles a single HTTP request from VK.
+
+        :param request: The parsed request
+        :return: The response for VK
+        """
+        if request.path != self.path:
+            return HTTPResponse("not found", status=404)
+        if request.method != "POST":
+            return HTTPResponse("method not allowed", status=405)
+
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return HTTPResponse("bad request", status=400)
+        if not isinstance(payload, dict):
+            return HTTPResponse("bad request", status=400)
+
+        try:
+            retry = int(request.headers.get("x-retry-counter", 0))
+        except ValueError:
+            retry = 0
+
+        return await self.handle_payload(payload, retry=retry)
+
+    async def handle_payload(
+        self, payload: dict[str, Any], retry: int = 0
+    ) -> HTTPResponse:
+        """
+        Handles a decoded Callback API payload.
+
+        :param payload: The request body sent by VK
+        :param retry: The `X-Retry-Counter` header of the request, how many
+            times VK has sent the event before
+        :return: The response for VK
+        """
+        if self.group_id is not None and payload.get("group_id") != self.group_id:
+            return HTTPResponse("forbidden", status=403)
+
+        if payload.get("type") == "confirmation":
+            return HTTPResponse(self.confirmation_code)
+
+        if self.secret is not None and not _secret_matches(
+            payload.get("secret"), self.secret
+        ):
+            logger.warning("Callback API request with a wrong secret was rejected")
+            return HTTPResponse("forbidden", status=403)
+
+        redelivery = self._is_redelivery(payload.get("event_id"))
+        if retry:
+            _RETRIES.labels("duplicate" if redelivery else "new").inc()
+        if redelivery:
+            return HTTPResponse("ok")
+
+        if payload.get("type") == "message_new":
+            message = (payload.get("object") or {}).get("message")
+            if message:
+                await self._schedule(message)
+
+        return HTTPResponse("ok")
+
+    async def close(self) -> None:
+        """Waits until the events dispatched in background tasks are processed."""
+        while self._tasks:
+            tasks = list(self._tasks)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._tasks.difference_update(tasks)
+
+    async def _schedule(self, message: dict[str, Any]) -> None:
+        if self.runner.max_concurrency:
+            # only waits for a free slot of the pool, not for the handlers
+            await self.runner.handle(message, is_user=False)
+            return
+
+        task = asyncio.create_task(self.runner.handle(message, is_user=False))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _is_redelivery(self, event_id: Optional[str]) -> bool:
+        if not event_id:
+            return False
+        if event_id in self._seen_events:
+            return True
+
+        self._seen_events[event_id] = None
+        if len(self._seen_events) > _SEEN_EVENTS_LIMIT:
+            self._seen_events.popitem(last=False)
+        return False
+
+
+def _secret_matches(received: Any, secret: str) -> bool:
+    if not isinstance(received, str):
+        return False
+    return hmac.compare_digest(received.encode(), secret.encode())
@@ -0,0 +1,30 @@
+import os
+
+from core.context.event_context import EventContext
+from core.filters import Command
+from core.routers.router import Router
+
+router = Router()
+
+ADMINS = {int(i) for i in os.getenv("ADMINS", "").split(",") if i}
+BANNED: set[int] = set()
+
+
+@router.on_message(Command("ban", args=(int,)), from_id=ADMINS)
+async def ban(ctx: EventContext):
+    (user_id,) = ctx.args
+    BANNED.add(user_id)
+    await ctx.reply(f"🔨 Пользователь {user_id} забанен")
+
+
+@router.on_message(Command("unban", args=(int,)), from_id=ADMINS)
+async def unban(ctx: EventContext):
+    (user_id,) = ctx.args
+    BANNED.discard(user_id)
+    await ctx.reply(f"✅ Пользователь {user_id} разбанен")
+
+
+@router.on_message(Command("ban", "unban"), from_id=ADMINS)
+async def usage(ctx: EventContext):
+    if len(ctx.args) != 1 or not ctx.args[0].lstrip("-").isdigit():
+        await ctx.reply(f"❗ Использование: /{ctx.command} <id>")
@@ -3,16 +3,102 @@ from typing import Any
 from pydantic import BaseModel
 
 
-class NormalizedMessageEvent(BaseModel):
+class MessageEventModel(BaseModel):
+    """Validation schema of a message event, used by `NormalizedMessageEvent.validate`."""
+
     message_id: int
     peer_id: int
     text: str
     from_id: int
     is_group: bool
-    raw: dict
     date: int
     out: int
     conversation_message_id: int
     random_id: int
     attachments: list[Any]
     fwd_messages: list[Any]
+
+
+class NormalizedMessageEvent:
+    """
+    Lightweight view of a message event.
+
+    Only a reference to the raw message object is stored, fields are read
+    from it on access. Nothing is validated unless `validate` is called.
+
+    :param raw: Raw message object returned by VK
+    :param is_group: Whether the event was received with a group token
+    """
+
+    __slots__ = ("raw", "is_group")
+
+    def __init__(self, raw: dict[str, Any], is_group: bool) -> None:
+        self.raw = raw
+        self.is_group = is_group
+
+    @property
+    def message_id(self) -> int:
+        return self.raw.get("id")
+
+    @property
+    def peer_id(self) -> int:
+        return self.raw.get("peer_id")
+
+    @property
+    def text(self) -> str:
+        return self.raw.get("text") or ""
+
+    @property
+    def from_id(self) -> int:
+        return self.raw.get("from_id")
+
+    @property
+    def date(self) -> int:
+        return self.raw.get("date")
+
+    @property
+    def out(self) -> int:
+        return self.raw.get("out")
+
+    @property
+    def conversation_message_id(self) -> int:
+        return self.raw.get("conversation_message_id")
+
+    @property
+    def random_id(self) -> int:
+        return self.raw.get("random_id")
+
+    @property
+    def attachments(self) -> list[Any]:
+        return self.raw.get("attachments") or []
+
+    @property
+    def fwd_messages(self) -> list[Any]:
+        return self.raw.get("fwd_messages") or []
+
+    def validate(self) -> MessageEventModel:
+        """
+        Validates the event fields.
+
+        :return: The validated fields as a `MessageEventModel`
+        :raises pydantic.ValidationError: If a field is missing or has a wrong type
+        """
+        return MessageEventModel(
+            message_id=self.message_id,
+            peer_id=self.peer_id,
+            text=self.text,
+            from_id=self.from_id,
+            is_group=self.is_group,
+            date=self.date,
+            out=self.out,
+            conversation_message_id=self.conversation_message_id,
+            random_id=self.random_id,
+            attachments=self.attachments,
+            fwd_messages=self.fwd_messages,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<NormalizedMessageEvent message_id={self.message_id} "
+            f"peer_id={self.peer_id} text={self.text!r}>"
+        )
@@ -0,0 +1,79 @@
+"""
+Typed long poll structures decoded directly from JSON with `msgspec`.
+
+Unknown fields of the envelope are skipped while decoding, so only the
+parts of a payload the framework uses are materialized. Message objects are
+decoded into plain dicts with all their fields, because handlers receive
+them as `EventContext.raw`. The structs support read-only mapping
+access (`get`, `[]`, `in`), so they can be used wherever a raw long poll
+dict is expected. This module requires `msgspec` to be installed.
+"""
+
+from typing import Any, Optional, Union
+
+import msgspec
+
+
+class _MappingStruct(msgspec.Struct):
+    def get(self, key: Union[str, int], default: Any = None) -> Any:
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __getitem__(self, key: Union[str, int]) -> Any:
+        if isinstance(key, int):
+            key = self.__struct_fields__[key]
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return getattr(self, key, None) is not None
+
+
+class GroupEventObject(_MappingStruct):
+    # kept a plain dict with every field VK sent: it becomes `EventContext.raw`
+    message: Optional[dict[str, Any]] = None
+    client_info: Optional[dict[str, Any]] = None
+
+
+class GroupUpdate(_MappingStruct):
+    """A single update of the group long poll."""
+
+    type: str
+    object: GroupEventObject = msgspec.field(default_factory=GroupEventObject)
+    group_id: Optional[int] = None
+    event_id: Optional[str] = None
+
+
+class UserUpdate(_MappingStruct, array_like=True):
+    """
+    A single update of the user long poll (version 3).
+
+    Fields are named after the layout of the message events (code 4); for
+    other codes they hold whatever VK sent at that position.
+    """
+
+    code: int
+    message_id: Any = None
+    flags: Any = None
+    peer_id: Any = None
+    timestamp: Any = None
+    text: Any = None
+    extra: Any = None
+    attachments: Any = None
+
+
+class GroupLongPollResponse(_MappingStruct):
+    ts: Optional[Union[str, int]] = None
+    updates: Optional[list[GroupUpdate]] = None
+    failed: Optional[int] = None
+
+
+class UserLongPollResponse(_MappingStruct):
+    ts: Optional[Union[str, int]] = None
+    pts: Optional[int] = None
+    updates: Optional[list[UserUpdate]] = None
+    failed: Optional[int] = None
@@ -1,15 +1,24 @@
-from typing import Optional
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Union
 
 from client.api import API
-from core.message_queue.worker import start_message_sender_worker
-from core.plugins.loader import (
-    discover_py_files,
-    find_routers_in_module,
-    import_module_from_path,
-)
+from client.checkpoint import LongPollCheckpoint
+from core.dispatcher import DispatchPolicy
+from core.message_queue.worker import MessageSender
+from core.plugins.loader import load_plugin_files
+from core.plugins.reloader import PluginReloader
+from core.polling.group import GroupLongPollProvider
+from core.polling.record import ReplayProvider
 from core.polling.runner import PollingRunner
+from core.polling.sharded import ShardedRunner
+from core.polling.tenants import TenantRunner
+from core.polling.user import UserLongPollProvider
 from core.routers.loader import load_routers
 from core.routers.router import Router
+from core.webhook.server import CallbackServer
+from utils.metrics import start_metrics_server
 
 
 class Module:
@@ -19,9 +28,23 @@ class Module:
         access_token: Optional[str] = None,
         routers: Optional[list[Router]] = None,
         plugins: Optional[list[str]] = None,
+        sender_workers: int = 4,
+        lazy_plugins: bool = False,
+        dispatch_policy: DispatchPolicy = "sequential",
+        handler_timeout: Optional[float] = None,
     ):
         self.api = api or API(access_token=access_token)
         self.routers = routers or []
+        self.plugins = plugins or []
+        self.lazy_plugins = lazy_plugins
+        # how matching handlers are run and how long each may take, see
+        # `dispatch_event`; used by every run_* method
+        self.dispatch_policy = dispatch_policy
+        self.handler_timeout = handler_timeout
+        self.reloader = PluginReloader(self.routers)
+
+        self.sender = MessageSender(self.api, workers=sender_workers)
+        self.api.sender = self.sender
 
         if plugins:
             for directory in plugins:
@@ -31,13 +54,26 @@ class Module:
         """
         Load all plugins from the given directory.
 
+        With `lazy_plugins`, files already described by the plugin manifest
+        are imported only when one of their handlers first matches.
+
         :param directory: The path to the directory with plugins
         """
-        for file_path in discover_py_files(directory):
-            module = import_module_from_path(file_path)
-            if module:
-                routers = find_routers_in_module(module)
-                self.add_routers(*routers)
+        if directory not in self.plugins:
+            self.plugins.append(directory)
+
+        files = load_plugin_files(directory, lazy=self.lazy_plugins)
+        self.reloader.track(directory, files)
+        self.add_routers(*(router for routers in files.values() for router in routers))
+
+    async def reload_plugins(self) -> list[Path]:
+        """
+        Re-imports the plugin files changed since they were loaded and swaps
+        their routers without stopping a running poller or webhook server.
+
+        :return: The paths of the reloaded or removed files
+        """
+        return await self.reloader.check()
 
     def add_router(self, router: Router):
         """
@@ -57,7 +93,14 @@ class Module:
         self.routers.extend(routers)
         load_routers(routers)
 
-    async def run_polling(self):
+    async def run_polling(
+        self,
+        max_concurrency: Optional[int] = None,
+        prefetch: bool = False,
+        record: Optional[str] = None,
+        reload_interval: Optional[float] = None,
+        checkpoint: Optional[str] = None,
+    ):
         """
         Starts the longpolling worker.
 
@@ -65,13 +108,237 @@ class Module:
         API instance and routers. The worker will listen to the longpolling
         server and pass the events to the routers.
 
+        :param max_concurrency: If set, events of different conversations are
+            processed concurrently with at most this many events in flight
+        :param prefetch: If True, the next long poll batch is fetched while the
+            current one is dispatched
+        :param record: If set, the raw updates of every long poll response are
+            appended to this file, which can later be replayed with
+            :meth:`run_replay`
+        :param reload_interval: If set, the plugin directories are checked for
+            changes this often (in seconds) and changed plugins are reloaded
+            while polling continues
+        :param checkpoint: If set, the long poll state is stored in this file
+            after every batch, and polling resumes from it after a restart
+            instead of skipping the events received in between
         :return: None
         """
-        await start_message_sender_worker(self.api)
+        if checkpoint:
+            self.api.long_poll_checkpoint = LongPollCheckpoint(checkpoint)
+
+        await self.sender.start()
+
+        runner = PollingRunner(
+            self.api,
+            self.routers,
+            max_concurrency=max_concurrency,
+            prefetch=prefetch,
+            record=record,
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+        )
+        try:
+            async with self._watching_plugins(runner, reload_interval):
+                await runner.start()
+        finally:
+            await self.sender.stop()
 
-        runner = PollingRunner(self.api, self.routers)
+    async def run_tenants(
+        self,
+        tokens: list[str],
+        max_concurrency: Optional[int] = None,
+        sender_workers: int = 1,
+        reload_interval: Optional[float] = None,
+        **api_options: Any,
+    ):
+        """
+        Runs many bot tokens in this process with the routers of this module.
+
+        The tokens share the HTTP session of :attr:`api` and one dispatch
+        engine, while each of them polls and sends with its own `API`
+        instance (own rate limit, long poll state and send queue). See
+        :class:`TenantRunner`.
+
+        :param tokens: Group or user access tokens
+        :param max_concurrency: Limit of events processed at once over all tokens
+        :param sender_workers: Sender coroutines per token
+        :param reload_interval: See :meth:`run_polling`
+        :param api_options: Keyword arguments for every `API` instance
+        :return: None
+        """
+        runner = TenantRunner(
+            self.routers,
+            session=self.api.session,
+            max_concurrency=max_concurrency,
+            sender_workers=sender_workers,
+            long_poll_pool_size=max(10, len(tokens)),
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+            **api_options,
+        )
+        for token in tokens:
+            runner.add_token(token)
+
+        try:
+            async with self._watching_plugins(runner, reload_interval):
+                await runner.run()
+        finally:
+            await runner.close()
+
+    async def run_replay(
+        self,
+        path: str,
+        speed: Optional[float] = 1.0,
+        max_concurrency: Optional[int] = None,
+        is_user: bool = False,
+    ):
+        """
+        Dispatches events recorded with ``run_polling(record=...)`` instead of
+        listening to the longpolling server, and returns when they run out.
+
+        The recorded updates are converted into messages again, so replies of
+        the handlers and the ``messages.getById`` calls of user token captures
+        are sent through the API instance. Point it to a test server
+        (`API(base_url=...)`) to stay away from VK.
+
+        :param path: The file with the recorded events
+        :param speed: Replay pace relative to the recording, None replays as
+            fast as the handlers keep up
+        :param max_concurrency: See :meth:`run_polling`
+        :param is_user: Whether the events were recorded with a user token
+        :return: None
+        """
+        await self.sender.start()
+
+        runner = PollingRunner(
+            self.api,
+            self.routers,
+            max_concurrency=max_concurrency,
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+        )
+        try:
+            provider = ReplayProvider(
+                path,
+                (
+                    UserLongPollProvider(self.api)
+                    if is_user
+                    else GroupLongPollProvider(self.api)
+                ),
+                speed=speed,
+            )
+            await runner.run(provider, is_user=is_user)
+        finally:
+            await self.sender.stop()
+
+    async def run_webhook(
+        self,
+        confirmation_code: str,
+        secret: Optional[str] = None,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = "/",
+        max_concurrency: int = 100,
+        reload_interval: Optional[float] = None,
+    ):
+        """
+        Starts a Callback API (webhook) server instead of longpolling.
+
+        Events received from VK go through the same pipeline as in
+        :meth:`run_polling`. Every request is acknowledged as soon as its event
+        is scheduled, events of one conversation are still processed in order.
+
+        :param confirmation_code: The string VK expects for the confirmation request
+        :param secret: The secret key set in the Callback API settings
+        :param host: The interface to listen on
+        :param port: The port to listen on
+        :param path: The URL path VK sends requests to
+        :param max_concurrency: The maximum number of events processed at once
+        :param reload_interval: See :meth:`run_polling`
+        :return: None
+        """
+        await self.sender.start()
+        await self.api.detect_token_type()
+
+        runner = PollingRunner(
+            self.api,
+            self.routers,
+            max_concurrency=max_concurrency,
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+        )
+        await runner.prepare()
+
+        callback = CallbackServer(runner, confirmation_code, secret=secret, path=path)
+        server = await callback.start(host, port)
+        try:
+            async with server, self._watching_plugins(runner, reload_interval):
+                await server.serve_forever()
+        finally:
+            await callback.close()
+            await runner.close()
+            await self.sender.stop()
+
+    async def run_sharded(
+        self,
+        processes: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        """
+        Starts longpolling with dispatching spread over worker processes.
+
+        Events are sharded by `peer_id` between the processes, so every
+        conversation keeps its order. Every worker loads the plugin
+        directories of this module and sends messages through its own API
+        instance. Routers added with :meth:`add_router` are not used.
+
+        :param processes: The number of worker processes, defaults to the
+            number of CPU cores
+        :param max_concurrency: Per-worker limit of events processed at once
+        :return: None
+        """
+        runner = ShardedRunner(
+            self.api,
+            self.plugins,
+            processes=processes,
+            max_concurrency=max_concurrency,
+            sender_workers=self.sender.workers,
+            dispatch_policy=self.dispatch_policy,
+            handler_timeout=self.handler_timeout,
+        )
         await runner.start()
 
+    @asynccontextmanager
+    async def _watching_plugins(
+        self, runner: Union[PollingRunner, TenantRunner], interval: Optional[float]
+    ) -> AsyncIterator[None]:
+        if not interval:
+            yield
+            return
+
+        self.reloader.interval = interval
+        self.reloader.add_listener(runner.refresh)
+        watcher = asyncio.create_task(self.reloader.watch())
+        try:
+            yield
+        finally:
+            watcher.cancel()
+            self.reloader.remove_listener(runner.refresh)
+
+    async def start_metrics_server(self, host: str = "127.0.0.1", port: int = 9090):
+        """
+        Serves the framework metrics in the Prometheus text format on
+        `http://host:port/metrics`.
+
+        The same values are available programmatically through
+        `utils.metrics.REGISTRY.snapshot()`.
+
+        :param host: The interface to listen on
+        :param port: The port to listen on
+        :return: The started `asyncio.Server`
+        """
+        return await start_metrics_server(host, port)
+
     def method(self, name: str, params: dict):
         """
         Calls a VK API method with the given name and parameters.
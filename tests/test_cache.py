@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from client.cache import ResponseCache
+
+
+class Counter:
+    def __init__(self, delay: float = 0.0, error: Exception | None = None) -> None:
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def fetch(self) -> list[int]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [self.calls]
+
+
+def test_concurrent_misses_share_one_request():
+    cache = ResponseCache({"users.get": 60.0})
+    counter = Counter(delay=0.01)
+    key = cache.key("users.get", {"user_ids": 1})
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_fetch(key, "users.get", counter.fetch) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == [[1]] * 5
+    assert counter.calls == 1
+    assert cache.stats()["joined"] == 4
+
+
+def test_hits_until_the_ttl_expires():
+    cache = ResponseCache({"users.get": 0.05})
+    counter = Counter()
+    key = cache.key("users.get", {"user_ids": 1})
+
+    async def main():
+        first = await cache.get_or_fetch(key, "users.get", counter.fetch)
+        second = await cache.get_or_fetch(key, "users.get", counter.fetch)
+        await asyncio.sleep(0.06)
+        third = await cache.get_or_fetch(key, "users.get", counter.fetch)
+        return first, second, third
+
+    assert asyncio.run(main()) == ([1], [1], [2])
+    assert cache.hits == 1
+
+
+def test_errors_reach_joined_callers_and_are_not_cached():
+    cache = ResponseCache({"users.get": 60.0})
+    failing = Counter(delay=0.01, error=ValueError("boom"))
+    key = cache.key("users.get", {"user_ids": 1})
+
+    async def main():
+        results = await asyncio.gather(
+            cache.get_or_fetch(key, "users.get", failing.fetch),
+            cache.get_or_fetch(key, "users.get", failing.fetch),
+            return_exceptions=True,
+        )
+        retried = await cache.get_or_fetch(key, "users.get", Counter().fetch)
+        return results, retried
+
+    results, retried = asyncio.run(main())
+
+    assert all(isinstance(r, ValueError) for r in results)
+    assert failing.calls == 1
+    assert retried == [1]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache({"users.get": 60.0}, maxsize=2)
+
+    async def main():
+        for user_id in (1, 2, 1, 3):
+            key = cache.key("users.get", {"user_ids": user_id})
+            await cache.get_or_fetch(key, "users.get", Counter().fetch)
+
+    asyncio.run(main())
+
+    assert cache.evictions == 1
+    assert cache.key("users.get", {"user_ids": 1}) in cache._entries
+    assert cache.key("users.get", {"user_ids": 2}) not in cache._entries
+
+
+@pytest.mark.parametrize("method", ["messages.send", "messages.getById"])
+def test_uncached_methods_have_no_key(method):
+    assert ResponseCache({"users.get": 60.0}).key(method, {}) is None
+
+
+def test_cancelling_the_first_caller_does_not_cancel_joined_callers():
+    cache = ResponseCache({"users.get": 60.0})
+    counter = Counter(delay=0.02)
+    key = cache.key("users.get", {"user_ids": 1})
+
+    async def main():
+        leader = asyncio.create_task(
+            cache.get_or_fetch(key, "users.get", counter.fetch)
+        )
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(
+            cache.get_or_fetch(key, "users.get", counter.fetch)
+        )
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        result = await joiner
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return result
+
+    assert asyncio.run(main()) == [1]
+    assert counter.calls == 1
+    assert cache.stats()["size"] == 1
+
+
+def test_request_of_a_cancelled_caller_is_still_cached():
+    cache = ResponseCache({"users.get": 60.0})
+    counter = Counter(delay=0.01)
+    key = cache.key("users.get", {"user_ids": 1})
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.001):
+                await cache.get_or_fetch(key, "users.get", counter.fetch)
+        await asyncio.sleep(0.02)
+        return await cache.get_or_fetch(key, "users.get", counter.fetch)
+
+    assert asyncio.run(main()) == [1]
+    assert counter.calls == 1
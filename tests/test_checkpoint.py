@@ -0,0 +1,205 @@
+import asyncio
+import json
+from typing import Any
+
+from client.api import API
+from client.checkpoint import CheckpointMarker, LongPollCheckpoint
+from core.context.event_context import EventContext
+from core.polling.group import GroupLongPollProvider
+from core.polling.runner import PollingRunner
+
+STATE = {"server": "https://lp.vk.com/wh1", "key": "k", "ts": "10"}
+
+
+def message(message_id: int, peer_id: int) -> dict[str, Any]:
+    return {"id": message_id, "peer_id": peer_id, "from_id": peer_id, "text": "hi"}
+
+
+def stored_ts(checkpoint: LongPollCheckpoint) -> Any:
+    with open(checkpoint.path) as f:
+        return json.load(f)["ts"]
+
+
+class FakeLongPoll:
+    """Answers `a_check` with the given batches, then blocks."""
+
+    def __init__(self, batches: list[list[dict[str, Any]]]) -> None:
+        self.batches = batches
+        self.requested_ts: list[str] = []
+
+    async def poll(self) -> dict[str, Any]:
+        self.requested_ts.append(self.api._lp_data["ts"])
+        if not self.batches:
+            await asyncio.Event().wait()
+        updates = [
+            {"type": "message_new", "object": {"message": m}}
+            for m in self.batches.pop(0)
+        ]
+        return {"ts": str(int(self.api._lp_data["ts"]) + 1), "updates": updates}
+
+    def attach(self, api: API) -> None:
+        self.api = api
+        api._is_group_token = True
+        api._poll_long_poll_server = self.poll
+
+
+class GatedRunner(PollingRunner):
+    """Dispatches an event only once its `gates` entry is set."""
+
+    def __init__(self, **options: Any) -> None:
+        super().__init__(None, [], **options)
+        self.gates: dict[int, asyncio.Event] = {}
+        self.dispatched: list[int] = []
+
+    async def dispatch(self, ctx: EventContext) -> None:
+        gate = self.gates.setdefault(ctx.message_id, asyncio.Event())
+        await gate.wait()
+        self.dispatched.append(ctx.message_id)
+
+
+def test_state_is_saved_and_loaded(tmp_path):
+    checkpoint = LongPollCheckpoint(str(tmp_path / "lp.json"))
+
+    checkpoint.save("group", STATE)
+
+    assert LongPollCheckpoint(checkpoint.path).load("group") == STATE
+    assert LongPollCheckpoint(checkpoint.path).load("user") is None
+
+
+def test_unreadable_checkpoint_is_ignored(tmp_path):
+    path = tmp_path / "lp.json"
+    path.write_text("{broken")
+
+    assert LongPollCheckpoint(str(path)).load("group") is None
+
+
+def test_provider_yields_marker_after_each_batch(tmp_path):
+    checkpoint = LongPollCheckpoint(str(tmp_path / "lp.json"))
+    api = API("token", long_poll_checkpoint=checkpoint)
+    api._lp_data = dict(STATE)
+    FakeLongPoll([[message(1, 2), message(2, 3)], [message(3, 2)]]).attach(api)
+
+    async def main():
+        listener = GroupLongPollProvider(api).listen()
+        return [await anext(listener) for _ in range(5)]
+
+    events = asyncio.run(main())
+
+    assert [e["id"] for e in events[:2]] == [1, 2]
+    assert isinstance(events[2], CheckpointMarker)
+    assert events[2].state["ts"] == "11"
+    assert events[3]["id"] == 3
+    assert events[4].state["ts"] == "12"
+    # markers are only committed by the runner
+    assert not (tmp_path / "lp.json").exists()
+
+
+def test_checkpoint_waits_for_events_in_the_pool(tmp_path):
+    checkpoint = LongPollCheckpoint(str(tmp_path / "lp.json"))
+    first = CheckpointMarker(checkpoint, "group", {**STATE, "ts": "11"})
+    second = CheckpointMarker(checkpoint, "group", {**STATE, "ts": "12"})
+
+    async def main():
+        runner = GatedRunner(max_concurrency=4)
+        await runner.prepare()
+
+        await runner.handle(message(1, 2), is_user=False)
+        await runner.handle(message(2, 3), is_user=False)
+        await runner.handle(first, is_user=False)
+        await runner.handle(message(3, 4), is_user=False)
+        await runner.handle(second, is_user=False)
+        await asyncio.sleep(0)
+        assert not (tmp_path / "lp.json").exists()
+
+        # the last batch finishing first does not commit the first batch
+        runner.gates[3].set()
+        runner.gates[2].set()
+        await asyncio.sleep(0.01)
+        assert not (tmp_path / "lp.json").exists()
+
+        runner.gates[1].set()
+        await asyncio.sleep(0.01)
+        assert stored_ts(checkpoint) == "12"
+        await runner.close()
+        return runner.dispatched
+
+    assert asyncio.run(main()) == [3, 2, 1]
+
+
+def test_checkpoints_are_committed_as_earlier_batches_finish(tmp_path):
+    checkpoint = LongPollCheckpoint(str(tmp_path / "lp.json"))
+
+    async def main():
+        runner = GatedRunner(max_concurrency=4)
+        await runner.prepare()
+        for n in range(1, 4):
+            await runner.handle(message(n, n), is_user=False)
+            marker = CheckpointMarker(checkpoint, "group", {**STATE, "ts": str(10 + n)})
+            await runner.handle(marker, is_user=False)
+
+        stored = []
+        for n in (2, 1, 3):
+            runner.gates.setdefault(n, asyncio.Event()).set()
+            await asyncio.sleep(0.01)
+            path = tmp_path / "lp.json"
+            stored.append(stored_ts(checkpoint) if path.exists() else None)
+        await runner.close()
+        return stored
+
+    assert asyncio.run(main()) == [None, "12", "13"]
+
+
+def test_cancelled_event_blocks_later_checkpoints(tmp_path):
+    checkpoint = LongPollCheckpoint(str(tmp_path / "lp.json"))
+
+    async def main():
+        runner = GatedRunner(max_concurrency=4)
+        await runner.prepare()
+        await runner.handle(message(1, 2), is_user=False)
+        await runner.handle(
+            CheckpointMarker(checkpoint, "group", {**STATE, "ts": "11"}), False
+        )
+        await asyncio.sleep(0)
+        for task in list(runner._pool._tasks):
+            task.cancel()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+
+    assert not (tmp_path / "lp.json").exists()
+
+
+def test_polling_resumes_after_the_last_processed_batch(tmp_path):
+    path = str(tmp_path / "lp.json")
+    LongPollCheckpoint(path).save("group", STATE)
+
+    async def run_once(batches: list[list[dict[str, Any]]]) -> FakeLongPoll:
+        api = API("token", long_poll_checkpoint=LongPollCheckpoint(path))
+        server = FakeLongPoll(batches)
+        server.attach(api)
+        runner = GatedRunner(max_concurrency=2, prefetch=True)
+        runner.api = api
+        for message_id in (1, 2):
+            runner.gates[message_id] = asyncio.Event()
+            runner.gates[message_id].set()
+
+        provider = runner.create_provider("group", api)
+        task = asyncio.create_task(runner.run(provider, is_user=False))
+        # the third event never finishes and the process "crashes"
+        await asyncio.sleep(0.05)
+        if runner._pool:
+            for lane in list(runner._pool._tasks):
+                lane.cancel()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return server
+
+    first = asyncio.run(run_once([[message(1, 2), message(2, 3)], [message(3, 2)]]))
+    second = asyncio.run(run_once([]))
+
+    assert first.requested_ts[:3] == ["10", "11", "12"]
+    # resumed before the batch whose event was not processed
+    assert second.requested_ts == ["11"]
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from client.coalescer import RequestCoalescer
+from client.errors import VKAPIError
+
+
+class FakeUsers:
+    def __init__(self, bad_ids: frozenset[str] = frozenset()) -> None:
+        self.bad_ids = bad_ids
+        self.calls: list[dict[str, Any]] = []
+
+    async def fetch(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        self.calls.append(params)
+        await asyncio.sleep(0)
+        ids = str(params["user_ids"]).split(",")
+        if self.bad_ids & set(ids):
+            raise VKAPIError(113, "Invalid user id", method)
+        return {"response": [{"id": int(i), "name": f"user{i}"} for i in ids]}
+
+
+def lookup(coalescer: RequestCoalescer, params: dict[str, Any]) -> asyncio.Future:
+    future = coalescer.submit("users.get", params)
+    assert future is not None
+    return future
+
+
+def test_concurrent_lookups_are_merged():
+    users = FakeUsers()
+
+    async def main():
+        coalescer = RequestCoalescer(users.fetch, window=0.01)
+        return await asyncio.gather(
+            lookup(coalescer, {"user_ids": 1}),
+            lookup(coalescer, {"user_ids": "2,3"}),
+            lookup(coalescer, {"user_ids": [3, 1]}),
+        )
+
+    first, second, third = asyncio.run(main())
+
+    assert len(users.calls) == 1
+    assert users.calls[0]["user_ids"] == "1,2,3"
+    assert [u["id"] for u in first] == [1]
+    assert [u["id"] for u in second] == [2, 3]
+    assert [u["id"] for u in third] == [3, 1]
+
+
+def test_lookups_with_other_params_are_not_merged():
+    users = FakeUsers()
+
+    async def main():
+        coalescer = RequestCoalescer(users.fetch, window=0.01)
+        await asyncio.gather(
+            lookup(coalescer, {"user_ids": 1}),
+            lookup(coalescer, {"user_ids": 2, "fields": "city"}),
+        )
+
+    asyncio.run(main())
+
+    assert len(users.calls) == 2
+
+
+def test_batch_is_flushed_at_the_id_limit():
+    users = FakeUsers()
+
+    async def main():
+        coalescer = RequestCoalescer(users.fetch, window=10.0)
+        ids = ",".join(str(i) for i in range(1, 1001))
+        return await asyncio.wait_for(lookup(coalescer, {"user_ids": ids}), 1.0)
+
+    assert len(asyncio.run(main())) == 1000
+    assert len(users.calls) == 1
+
+
+def test_failed_bulk_request_is_repeated_per_lookup():
+    users = FakeUsers(bad_ids=frozenset({"2"}))
+
+    async def main():
+        coalescer = RequestCoalescer(users.fetch, window=0.01)
+        return await asyncio.gather(
+            lookup(coalescer, {"user_ids": 1}),
+            lookup(coalescer, {"user_ids": 2}),
+            return_exceptions=True,
+        )
+
+    good, bad = asyncio.run(main())
+
+    assert [u["id"] for u in good] == [1]
+    assert isinstance(bad, VKAPIError)
+    assert len(users.calls) == 3
+
+
+@pytest.mark.parametrize(
+    "method, params",
+    [
+        ("users.get", {"fields": "city"}),
+        ("users.get", {"user_ids": "durov"}),
+        ("messages.send", {"peer_id": 1}),
+    ],
+)
+def test_unmergeable_lookups_are_left_alone(method, params):
+    async def main():
+        coalescer = RequestCoalescer(FakeUsers().fetch)
+        return coalescer.submit(method, params)
+
+    assert asyncio.run(main()) is None
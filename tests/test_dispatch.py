@@ -0,0 +1,148 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from core.context.event_context import EventContext
+from core.dispatcher import StopPropagation, dispatch_event
+from core.filters import Command
+from core.routers.router import Router
+from models.events import NormalizedMessageEvent
+from utils.metrics import REGISTRY
+
+
+def context(text: str = "/go") -> EventContext:
+    raw = {"id": 1, "peer_id": 2, "from_id": 2, "text": text}
+    return EventContext(NormalizedMessageEvent(raw, is_group=True), None)
+
+
+def dispatch(router: Router, policy: str = "sequential", **options: Any) -> None:
+    asyncio.run(dispatch_event(context(), [router], policy, **options))
+
+
+def timeouts_of(name: str) -> float:
+    samples = REGISTRY.snapshot()["nique_handler_timeouts_total"]["samples"]
+    return sum(s["value"] for s in samples if s["labels"]["handler"].endswith(name))
+
+
+def test_sequential_runs_every_handler_until_stopped():
+    router, calls = Router(), []
+
+    @router.on_message()
+    async def first(ctx: EventContext):
+        calls.append("first")
+
+    @router.on_message(text="/go")
+    async def second(ctx: EventContext):
+        calls.append("second")
+        raise StopPropagation
+
+    @router.on_message()
+    async def third(ctx: EventContext):
+        calls.append("third")
+
+    dispatch(router)
+
+    assert calls == ["first", "second"]
+
+
+def test_first_runs_only_the_first_match():
+    router, calls = Router(), []
+
+    @router.on_message(text="/other")
+    async def other(ctx: EventContext):
+        calls.append("other")
+
+    @router.on_message(Command("go"))
+    async def go(ctx: EventContext):
+        calls.append(ctx.command)
+
+    @router.on_message()
+    async def fallback(ctx: EventContext):
+        calls.append("fallback")
+
+    dispatch(router, "first")
+
+    assert calls == ["go"]
+
+
+def test_concurrent_handlers_get_their_own_captures():
+    router, seen = Router(), []
+    both_started = asyncio.Barrier(2)
+
+    @router.on_message(Command("go", args=()))
+    async def command(ctx: EventContext):
+        await both_started.wait()
+        seen.append(("command", ctx.command))
+
+    @router.on_message()
+    async def plain(ctx: EventContext):
+        await both_started.wait()
+        seen.append(("plain", ctx.command))
+
+    async def main():
+        # the barrier only passes if both handlers run at the same time
+        async with asyncio.timeout(1):
+            await dispatch_event(context(), [router], "concurrent")
+
+    asyncio.run(main())
+
+    assert sorted(seen) == [("command", "go"), ("plain", None)]
+
+
+def test_concurrent_errors_do_not_cancel_other_handlers():
+    router, finished = Router(), []
+
+    @router.on_message()
+    async def failing(ctx: EventContext):
+        raise ValueError("boom")
+
+    @router.on_message()
+    async def slow(ctx: EventContext):
+        await asyncio.sleep(0.01)
+        finished.append("slow")
+
+    with pytest.raises(ValueError):
+        dispatch(router, "concurrent")
+    assert finished == ["slow"]
+
+
+def test_several_concurrent_errors_are_grouped():
+    router = Router()
+
+    @router.on_message()
+    async def one(ctx: EventContext):
+        raise ValueError("one")
+
+    @router.on_message()
+    async def two(ctx: EventContext):
+        raise KeyError("two")
+
+    with pytest.raises(ExceptionGroup) as info:
+        dispatch(router, "concurrent")
+    assert len(info.value.exceptions) == 2
+
+
+def test_handler_timeout_overrides_the_default():
+    router = Router()
+
+    @router.on_message(timeout=0.01)
+    async def stuck_handler(ctx: EventContext):
+        await asyncio.sleep(1)
+
+    before = timeouts_of("stuck_handler")
+    with pytest.raises(TimeoutError, match="timed out after 0.01s"):
+        dispatch(router, timeout=10)
+    assert timeouts_of("stuck_handler") == before + 1
+
+
+def test_timeout_error_of_the_handler_is_not_a_timeout():
+    router = Router()
+
+    @router.on_message()
+    async def raising_handler(ctx: EventContext):
+        raise TimeoutError("upstream")
+
+    with pytest.raises(TimeoutError, match="upstream"):
+        dispatch(router, timeout=10)
+    assert timeouts_of("raising_handler") == 0
@@ -0,0 +1,87 @@
+import json
+import re
+
+import pytest
+
+from client.errors import VKAPIError
+from client.execute import (
+    EXECUTE_MAX_CALLS,
+    build_execute_code,
+    parse_execute_response,
+)
+
+CALL = re.compile(r"API\.([\w.]+)\((.*?)\)(?=,API\.|\];$)")
+
+
+def call_args(code: str) -> list[tuple[str, dict]]:
+    assert code.startswith("return [") and code.endswith("];")
+    return [(method, json.loads(args)) for method, args in CALL.findall(code)]
+
+
+def test_calls_are_returned_in_order():
+    calls = [
+        ("messages.send", {"peer_id": 1, "message": "one", "random_id": 7}),
+        ("users.get", {"user_ids": "1,2"}),
+    ]
+
+    code = build_execute_code(calls)
+
+    assert code.startswith("return [API.messages.send(")
+    assert call_args(code) == calls
+
+
+def test_strings_are_escaped():
+    text = 'quote " backslash \\ newline \n ) ]; API.account.ban({}) привет'
+    calls = [("messages.send", {"peer_id": 1, "message": text})]
+
+    code = build_execute_code(calls)
+
+    assert "\n" not in code
+    assert call_args(code) == calls
+
+
+def test_too_many_calls_are_rejected():
+    calls = [("users.get", {"user_ids": i}) for i in range(EXECUTE_MAX_CALLS + 1)]
+
+    with pytest.raises(ValueError):
+        build_execute_code(calls)
+    build_execute_code(calls[:EXECUTE_MAX_CALLS])
+
+
+def test_results_and_errors_are_mapped_to_calls():
+    calls = [
+        ("messages.send", {"peer_id": 1}),
+        ("messages.send", {"peer_id": 2}),
+        ("messages.send", {"peer_id": 3}),
+        ("messages.send", {"peer_id": 4}),
+    ]
+    data = {
+        "response": [101, False, 103, False],
+        "execute_errors": [
+            {"method": "messages.send", "error_code": 901, "error_msg": "denied"},
+            {"method": "messages.send", "error_code": 7, "error_msg": "no access"},
+        ],
+    }
+
+    first, second, third, fourth = parse_execute_response(calls, data)
+
+    assert (first, third) == (101, 103)
+    assert isinstance(second, VKAPIError) and second.code == 901
+    assert isinstance(fourth, VKAPIError) and fourth.code == 7
+    assert fourth.message == "no access"
+
+
+def test_missing_results_and_errors_are_failures():
+    calls = [("users.get", {"user_ids": 1}), ("groups.getById", {"group_id": 1})]
+
+    first, second = parse_execute_response(calls, {"response": [False]})
+
+    assert isinstance(first, VKAPIError) and first.code is None
+    assert first.method == "users.get"
+    assert isinstance(second, VKAPIError) and second.method == "groups.getById"
+
+
+def test_falsy_results_other_than_false_are_kept():
+    calls = [("users.get", {}), ("users.get", {}), ("users.get", {})]
+
+    assert parse_execute_response(calls, {"response": [0, [], None]}) == [0, [], None]
@@ -0,0 +1,136 @@
+import re
+from typing import Any
+
+import pytest
+
+from core.context.event_context import EventContext
+from core.dispatcher import DispatchIndex
+from core.filters import Command, Filter, Regex, StartsWith, compile_filters
+from core.routers.router import Router
+from models.events import NormalizedMessageEvent
+
+
+def context(text: str = "", peer_id: int = 2, from_id: int = 2) -> EventContext:
+    raw = {"id": 1, "peer_id": peer_id, "from_id": from_id, "text": text}
+    return EventContext(NormalizedMessageEvent(raw, is_group=True), None)
+
+
+def handler_names(router: Router, ctx: EventContext, **options: Any) -> list[str]:
+    index = DispatchIndex([router])
+    return [handler.func.__name__ for handler, _ in index.match(ctx, **options)]
+
+
+def register(router: Router, name: str, *checks: Any, **filters: Any) -> None:
+    async def handler(ctx: EventContext) -> None:
+        pass
+
+    handler.__name__ = name
+    router.on_message(*checks, **filters)(handler)
+
+
+def test_index_keeps_registration_order():
+    router = Router()
+    register(router, "catch_all")
+    register(router, "hello", text="hello")
+    register(router, "peer", peer_id=2)
+    register(router, "other_text", text="bye")
+
+    assert handler_names(router, context("hello")) == ["catch_all", "hello", "peer"]
+    assert handler_names(router, context("bye", peer_id=3)) == [
+        "catch_all",
+        "other_text",
+    ]
+    assert handler_names(router, context("hello"), first=True) == ["catch_all"]
+
+
+def test_sets_match_each_member():
+    router = Router()
+    register(router, "admins", from_id={1, 2})
+
+    assert handler_names(router, context(from_id=2)) == ["admins"]
+    assert handler_names(router, context(from_id=3)) == []
+
+
+def test_residual_filters_are_checked_after_the_lookup():
+    router = Router()
+    register(router, "admin_hello", text="hello", from_id=1)
+
+    assert handler_names(router, context("hello", from_id=1)) == ["admin_hello"]
+    assert handler_names(router, context("hello", from_id=2)) == []
+
+
+def test_unhashable_filter_values_are_not_indexed():
+    router = Router()
+    register(router, "listed", peer_id=[2])
+
+    assert handler_names(router, context()) == []
+    assert handler_names(router, context(peer_id=[2])) == ["listed"]
+
+
+def test_command_captures_converted_args():
+    router = Router()
+    register(router, "ban", Command("ban", args=(int,)))
+    index = DispatchIndex([router])
+
+    ((_, captures),) = index.match(context("/BAN 42"))
+    assert captures == {"command": "BAN", "args": (42,)}
+    assert index.match(context("/ban x")) == []
+    assert index.match(context("/ban 1 2")) == []
+    assert index.match(context("/banned 1")) == []
+
+
+def test_command_without_converters_captures_every_word():
+    check = compile_filters(checks=[Command("say", prefixes=("/", "!"))])
+
+    assert check(context("!say hello  world")) == {
+        "command": "say",
+        "args": ("hello", "world"),
+    }
+    assert check(context("say hello")) is None
+
+
+def test_regex_captures_the_match():
+    check = compile_filters({"text": Regex(r"(\d+) apples")})
+
+    captures = check(context("give me 3 apples"))
+    assert isinstance(captures["match"], re.Match)
+    assert captures["match"].group(1) == "3"
+    assert check(context("no fruit")) is None
+
+
+def test_predicates_and_prefixes():
+    check = compile_filters(
+        {"from_id": lambda from_id: from_id > 100},
+        [StartsWith("hi", ignore_case=True), lambda ctx: ctx.peer_id == 2],
+    )
+
+    assert check(context("Hi there", from_id=101)) == {}
+    assert check(context("Hi there", from_id=5)) is None
+    assert check(context("hello", from_id=101)) is None
+    assert check(context("Hi", peer_id=3, from_id=101)) is None
+
+
+def test_cheapest_checks_run_first():
+    calls = []
+
+    def expensive(ctx: EventContext) -> bool:
+        calls.append(ctx)
+        return True
+
+    check = compile_filters({"text": "hello"}, [expensive])
+
+    assert check(context("bye")) is None
+    assert calls == []
+
+
+def test_command_needs_a_name():
+    with pytest.raises(ValueError):
+        Command()
+
+
+def test_filters_must_implement_compile():
+    class Incomplete(Filter):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
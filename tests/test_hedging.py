@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any
+
+from client.api import API
+
+
+class SlowSends:
+    def __init__(self, delays: list[float]) -> None:
+        self.delays = delays
+        self.started = 0
+        self.cancelled = 0
+
+    async def send(
+        self, method: str, params: dict[str, Any], pooled: bool = False
+    ) -> dict[str, Any]:
+        delay = self.delays[self.started]
+        self.started += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"response": delay}
+
+
+def hedged_api(sends: SlowSends) -> API:
+    api = API("token", hedging=True)
+    api.latency.percentile = lambda method, q: 0.01
+    api._send = sends.send
+    return api
+
+
+def test_hedge_answers_first_and_primary_is_cancelled():
+    sends = SlowSends([1.0, 0.0])
+
+    async def main():
+        result = await hedged_api(sends)._attempt("users.get", {})
+        await asyncio.sleep(0)
+        return result, sends.cancelled
+
+    assert asyncio.run(main()) == ({"response": 0.0}, 1)
+    assert sends.started == 2
+
+
+def test_cancelled_caller_cancels_the_primary_request():
+    sends = SlowSends([1.0, 1.0])
+
+    async def main():
+        api = hedged_api(sends)
+        api.latency.percentile = lambda method, q: 0.5
+        call = asyncio.create_task(api._attempt("users.get", {}))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0)
+        # checked before `asyncio.run` cancels whatever is left
+        return sends.cancelled
+
+    assert asyncio.run(main()) == 1
+    assert sends.started == 1
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from typing import Any
+
+import niquests
+
+from client.api import API
+
+STATE = {"server": "https://lp.vk.com/wh1", "key": "k", "ts": "10"}
+
+
+class Response:
+    def __init__(self, body: dict[str, Any]) -> None:
+        self.content = json.dumps(body).encode()
+
+
+class FlakySession:
+    """Long poll session failing with the given outcomes before answering."""
+
+    def __init__(self, *outcomes: Any) -> None:
+        self.outcomes = list(outcomes)
+        self.requested_ts: list[str] = []
+
+    async def get(self, url: str, params: dict[str, Any], timeout: float) -> Response:
+        self.requested_ts.append(params["ts"])
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if outcome == "hang":
+            await asyncio.sleep(10)
+        elif isinstance(outcome, Exception):
+            raise outcome
+        update = {"type": "message_new", "object": {"message": {"id": 1}}}
+        return Response({"ts": "11", "updates": [update]})
+
+
+def group_api(session: FlakySession) -> API:
+    api = API(
+        "token",
+        long_poll_session=session,
+        long_poll_wait=0,
+        long_poll_timeout_margin=0.01,
+        backoff_base=0.001,
+        backoff_max=0.001,
+    )
+    api._is_group_token = True
+    api._lp_data = dict(STATE)
+    return api
+
+
+def test_timed_out_request_is_repeated():
+    session = FlakySession("hang")
+    api = group_api(session)
+
+    updates = asyncio.run(api.get_long_poll_events())
+
+    assert len(updates) == 1
+    assert session.requested_ts == ["10", "10"]
+    assert api._lp_data["ts"] == "11"
+
+
+def test_transport_errors_are_repeated():
+    session = FlakySession(
+        niquests.exceptions.ConnectionError("reset"),
+        niquests.exceptions.ReadTimeout("read timed out"),
+        "hang",
+    )
+    api = group_api(session)
+
+    updates = asyncio.run(api.get_long_poll_events())
+
+    assert len(updates) == 1
+    assert session.requested_ts == ["10"] * 4
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from client.decoder import get_long_poll_decoder
+from core.polling.adapter import normalize_event
+
+pytest.importorskip("msgspec")
+
+MESSAGE = {
+    "id": 10,
+    "peer_id": 2000000001,
+    "from_id": 5,
+    "text": "/help",
+    "conversation_message_id": 3,
+    "is_hidden": False,
+    "keyboard": {"buttons": []},
+}
+
+
+def test_group_messages_are_decoded_into_plain_dicts():
+    decode = get_long_poll_decoder(is_group=True)
+    body = {
+        "ts": "42",
+        "updates": [
+            {"type": "message_new", "object": {"message": MESSAGE}, "v": "5.199"}
+        ],
+    }
+
+    response = decode(json.dumps(body).encode())
+    message = response["updates"][0]["object"]["message"]
+
+    assert response["ts"] == "42"
+    assert type(message) is dict
+    assert message == MESSAGE
+
+    event = normalize_event(message, is_user=False)
+    assert type(event.raw) is dict
+    assert event.text == "/help"
+
+
+def test_failed_response_has_no_updates():
+    decode = get_long_poll_decoder(is_group=True)
+
+    response = decode(b'{"failed": 2}')
+
+    assert response.get("failed") == 2
+    assert response.get("updates") is None
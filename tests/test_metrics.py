@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from client.api import API
+from core.dispatcher import DispatchIndex, MessageHandler, dispatch_event
+from core.routers.router import Router
+from utils.http import HTTPRequest, HTTPResponse, start_http_server
+from utils.metrics import REGISTRY, MetricsRegistry, _Metric
+
+
+def sample(name: str, **labels: str) -> float:
+    for found in REGISTRY.snapshot()[name]["samples"]:
+        if found["labels"] == labels:
+            return found.get("value", found.get("count"))
+    return 0
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("x", "x", ())
+
+
+def test_counter_labels_and_render():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test counter", ("kind",))
+
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+
+    assert counter.labels("a") is counter.labels("a")
+    assert 'test_total{kind="a"} 3' in registry.render()
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+
+
+def test_handler_metrics_are_bound_once():
+    router = Router()
+
+    @router.on_message()
+    async def fail(ctx):
+        raise RuntimeError
+
+    handler: MessageHandler = router.get_handlers()[0]
+    errors = sample("nique_handler_errors_total", handler=handler.name)
+
+    assert handler.errors_metric is REGISTRY.counter(
+        "nique_handler_errors_total", ""
+    ).labels(handler.name)
+
+    class Ctx:
+        def set_captures(self, captures):
+            pass
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(dispatch_event(Ctx(), DispatchIndex([router])))
+    assert sample("nique_handler_errors_total", handler=handler.name) == errors + 1
+
+
+def test_http_errors_are_counted():
+    async def bad_gateway(request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse("bad gateway", status=502)
+
+    async def main():
+        server = await start_http_server(bad_gateway, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        api = API(
+            "token",
+            base_url=f"http://127.0.0.1:{port}/method",
+            multiplexed=False,
+            rate_limit=100,
+        )
+        try:
+            with pytest.raises(Exception, match="HTTP error 502"):
+                await api._post("users.get", {"user_ids": 1})
+        finally:
+            await api.session.close()
+            server.close()
+            await server.wait_closed()
+
+    before = sample("nique_api_errors_total", method="users.get", code="http_502")
+    asyncio.run(main())
+    after = sample("nique_api_errors_total", method="users.get", code="http_502")
+    assert after == before + 1
@@ -0,0 +1,121 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from core.plugins.loader import (
+    PLUGIN_PACKAGE,
+    import_module_from_path,
+    load_plugin_files,
+    module_name_for,
+)
+from core.plugins.manifest import LazyHandler
+
+LITERAL = """
+from core.routers.router import Router
+
+router = Router()
+
+@router.on_message(text="/ping", peer_id=5)
+async def ping(ctx):
+    pass
+"""
+
+COMPUTED = """
+import os
+
+from core.routers.router import Router
+
+router = Router()
+
+@router.on_message(text=os.getenv("GREETING", "/hi"))
+async def greet(ctx):
+    pass
+"""
+
+
+@pytest.fixture
+def plugins(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    directory = tmp_path / "plugins"
+    directory.mkdir()
+    yield directory
+    for name in [m for m in sys.modules if m.startswith(PLUGIN_PACKAGE)]:
+        del sys.modules[name]
+
+
+def handler_types(files: dict[Path, list]) -> dict[str, str]:
+    return {
+        path.name: type(routers[0].get_handlers()[0]).__name__
+        for path, routers in files.items()
+    }
+
+
+def test_plugins_are_imported_unless_lazy(plugins):
+    (plugins / "ping.py").write_text(LITERAL)
+
+    load_plugin_files(str(plugins))
+    files = load_plugin_files(str(plugins))
+
+    assert handler_types(files) == {"ping.py": "MessageHandler"}
+
+
+def test_literal_filters_are_deferred_on_the_next_start(plugins):
+    (plugins / "ping.py").write_text(LITERAL)
+
+    first = load_plugin_files(str(plugins), lazy=True)
+    second = load_plugin_files(str(plugins), lazy=True)
+
+    assert handler_types(first) == {"ping.py": "MessageHandler"}
+    handler = next(iter(second.values()))[0].get_handlers()[0]
+    assert isinstance(handler, LazyHandler)
+    assert handler.filters == {"text": "/ping", "peer_id": 5}
+
+
+def test_computed_filters_are_always_imported(plugins, monkeypatch):
+    (plugins / "greet.py").write_text(COMPUTED)
+
+    load_plugin_files(str(plugins), lazy=True)
+    monkeypatch.setenv("GREETING", "/hello")
+    files = load_plugin_files(str(plugins), lazy=True)
+
+    handler = next(iter(files.values()))[0].get_handlers()[0]
+    assert type(handler).__name__ == "MessageHandler"
+
+
+def test_manifest_of_an_older_version_is_discarded(plugins):
+    (plugins / "ping.py").write_text(LITERAL)
+    manifest = plugins / "__pycache__" / "nique_manifest.json"
+    manifest.parent.mkdir()
+    manifest.write_text('{"version": 1, "files": {"ping.py": {"eager": false}}}')
+
+    files = load_plugin_files(str(plugins), lazy=True)
+
+    assert handler_types(files) == {"ping.py": "MessageHandler"}
+    assert '"version": 2' in manifest.read_text()
+
+
+def test_files_with_similar_names_get_their_own_modules(plugins):
+    (plugins / "a-b.py").write_text(LITERAL)
+    (plugins / "a_b.py").write_text(COMPUTED)
+
+    files = load_plugin_files(str(plugins))
+
+    texts = {
+        path.name: routers[0].get_handlers()[0].filters["text"]
+        for path, routers in files.items()
+    }
+    assert texts == {"a-b.py": "/ping", "a_b.py": "/hi"}
+    assert module_name_for(plugins / "a-b.py") != module_name_for(plugins / "a_b.py")
+    assert module_name_for(plugins / "a-b.py") == module_name_for(plugins / "a-b.py")
+
+
+def test_a_name_used_by_another_file_is_rejected(plugins):
+    (plugins / "ping.py").write_text(LITERAL)
+    (plugins / "greet.py").write_text(COMPUTED)
+    name = module_name_for(plugins / "ping.py")
+    import_module_from_path(plugins / "ping.py")
+
+    with pytest.raises(ImportError):
+        import_module_from_path(plugins / "greet.py", module_name=name)
+    assert sys.modules[name].__file__ == str(plugins / "ping.py")
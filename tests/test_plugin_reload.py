@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from core.plugins.loader import PLUGIN_PACKAGE, load_plugin_files
+from core.plugins.reloader import PluginReloader
+from core.routers.loader import get_all_routers, load_routers
+
+PLUGIN = """
+from core.routers.router import Router
+
+router = Router()
+
+@router.on_message(text="{text}")
+async def handler(ctx):
+    pass
+"""
+
+
+@pytest.fixture
+def plugins(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    directory = tmp_path / "plugins"
+    directory.mkdir()
+    registered = list(get_all_routers())
+    yield directory
+    get_all_routers()[:] = registered
+    for name in [m for m in sys.modules if m.startswith(PLUGIN_PACKAGE)]:
+        del sys.modules[name]
+
+
+def write(path: Path, source: str) -> None:
+    """Writes the file and moves its mtime forward, so the change is seen."""
+    mtime_ns = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(source)
+    mtime_ns = max(path.stat().st_mtime_ns, mtime_ns + 1_000_000)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def texts(routers: list) -> list[str]:
+    return [
+        handler.filters["text"]
+        for router in routers
+        for handler in router.get_handlers()
+    ]
+
+
+def start(directory: Path) -> PluginReloader:
+    files = load_plugin_files(str(directory))
+    routers = [router for routers in files.values() for router in routers]
+    load_routers(routers)
+    reloader = PluginReloader(routers)
+    reloader.track(str(directory), files)
+    return reloader
+
+
+def test_changed_plugins_swap_their_handlers(plugins):
+    write(plugins / "a.py", PLUGIN.format(text="/a"))
+    write(plugins / "b.py", PLUGIN.format(text="/b"))
+    reloader = start(plugins)
+    swapped = []
+    reloader.add_listener(lambda: swapped.append(texts(reloader.routers)))
+
+    write(plugins / "a.py", PLUGIN.format(text="/a2"))
+    changed = asyncio.run(reloader.check())
+
+    assert changed == [plugins / "a.py"]
+    assert swapped == [["/a2", "/b"]]
+    assert texts(get_all_routers())[-2:] == ["/a2", "/b"]
+    assert asyncio.run(reloader.check()) == []
+
+
+def test_failed_import_keeps_the_old_handlers(plugins):
+    write(plugins / "a.py", PLUGIN.format(text="/a"))
+    reloader = start(plugins)
+    routers = list(reloader.routers)
+
+    write(plugins / "a.py", "raise RuntimeError('broken')")
+    assert asyncio.run(reloader.check()) == []
+    assert reloader.routers == routers
+    assert texts(reloader.routers) == ["/a"]
+    # the broken version is not imported again until the file changes
+    assert asyncio.run(reloader.check()) == []
+
+    write(plugins / "a.py", PLUGIN.format(text="/fixed"))
+    asyncio.run(reloader.check())
+    assert texts(reloader.routers) == ["/fixed"]
+
+
+def test_deleted_plugins_are_removed(plugins):
+    write(plugins / "a.py", PLUGIN.format(text="/a"))
+    write(plugins / "b.py", PLUGIN.format(text="/b"))
+    reloader = start(plugins)
+    removed = reloader.routers[0]
+
+    (plugins / "a.py").unlink()
+    changed = asyncio.run(reloader.check())
+
+    assert changed == [plugins / "a.py"]
+    assert texts(reloader.routers) == ["/b"]
+    assert removed not in get_all_routers()
@@ -0,0 +1,107 @@
+import asyncio
+
+from core.polling.pool import PeerTaskPool
+
+
+class Jobs:
+    """Creates jobs that record their order and the number running at once."""
+
+    def __init__(self) -> None:
+        self.done: list[tuple[int, int]] = []
+        self.running = 0
+        self.max_running = 0
+
+    def job(self, peer_id: int, n: int, delay: float = 0.001):
+        async def run() -> None:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.running -= 1
+            self.done.append((peer_id, n))
+
+        return run
+
+
+def test_jobs_of_one_peer_run_in_order():
+    jobs = Jobs()
+
+    async def main():
+        pool = PeerTaskPool(8)
+        for n in range(20):
+            # later jobs are faster, they would overtake without the lanes
+            await pool.submit(n % 2, jobs.job(n % 2, n, delay=0.02 - n * 0.001))
+        await pool.join()
+
+    asyncio.run(main())
+
+    for peer_id in (0, 1):
+        done = [n for peer, n in jobs.done if peer == peer_id]
+        assert done == list(range(peer_id, 20, 2))
+
+
+def test_different_peers_run_concurrently():
+    jobs = Jobs()
+
+    async def main():
+        pool = PeerTaskPool(8)
+        for peer_id in range(4):
+            await pool.submit(peer_id, jobs.job(peer_id, 0, delay=0.01))
+        await pool.join()
+
+    asyncio.run(main())
+
+    assert jobs.max_running == 4
+
+
+def test_in_flight_jobs_are_bounded():
+    jobs = Jobs()
+
+    async def main():
+        pool = PeerTaskPool(3)
+        for n in range(12):
+            await pool.submit(n, jobs.job(n, n, delay=0.005))
+            assert pool.in_flight <= 3
+        await pool.join()
+        return pool.in_flight
+
+    assert asyncio.run(main()) == 0
+    assert jobs.max_running == 3
+    assert len(jobs.done) == 12
+
+
+def test_submit_waits_for_a_free_slot():
+    async def main():
+        pool = PeerTaskPool(1)
+        release = asyncio.Event()
+        await pool.submit(1, release.wait)
+
+        second = asyncio.create_task(pool.submit(2, release.wait))
+        await asyncio.sleep(0.01)
+        blocked = not second.done()
+
+        release.set()
+        await second
+        await pool.join()
+        return blocked
+
+    assert asyncio.run(main())
+
+
+def test_join_drains_queued_jobs_and_survives_errors():
+    jobs = Jobs()
+
+    async def failing() -> None:
+        raise ValueError("boom")
+
+    async def main():
+        pool = PeerTaskPool(10)
+        await pool.submit(1, failing)
+        for n in range(5):
+            await pool.submit(1, jobs.job(1, n))
+        await pool.join()
+        return pool.in_flight
+
+    assert asyncio.run(main()) == 0
+    assert [n for _, n in jobs.done] == list(range(5))
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, AsyncGenerator
+
+import pytest
+
+from core.polling.base import LongPollProvider
+from core.polling.prefetch import PrefetchingProvider
+from core.polling.runner import PollingRunner
+
+
+class CountingProvider(LongPollProvider):
+    """Yields `total` events and counts how many were produced."""
+
+    def __init__(self, total: int = 100, error: Exception | None = None) -> None:
+        self.total = total
+        self.error = error
+        self.produced = 0
+
+    async def listen(self) -> AsyncGenerator[dict[str, Any], None]:
+        for n in range(self.total):
+            self.produced += 1
+            yield {"n": n}
+            await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+
+
+async def settle() -> None:
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_polling_pauses_at_high_and_resumes_at_low_watermark():
+    source = CountingProvider()
+    prefetcher = PrefetchingProvider(source, high_watermark=10, low_watermark=4)
+
+    async def main():
+        listener = prefetcher.listen()
+        received = [await anext(listener)]
+        await settle()
+        # one event was consumed, the buffer filled up to the high watermark
+        assert prefetcher.buffered == 10
+        assert source.produced == 11
+
+        while prefetcher.buffered > 5:
+            received.append(await anext(listener))
+        await settle()
+        assert source.produced == 11
+
+        received.append(await anext(listener))
+        await settle()
+        assert prefetcher.buffered == 10
+        assert source.produced > 11
+
+        async for event in listener:
+            received.append(event)
+        return [event["n"] for event in received]
+
+    assert asyncio.run(main()) == list(range(100))
+
+
+def test_errors_are_raised_after_the_buffered_events():
+    source = CountingProvider(total=3, error=RuntimeError("lost connection"))
+
+    async def main():
+        received = []
+        with pytest.raises(RuntimeError):
+            async for event in PrefetchingProvider(source, high_watermark=10).listen():
+                received.append(event["n"])
+        return received
+
+    assert asyncio.run(main()) == [0, 1, 2]
+
+
+def test_invalid_watermarks_are_rejected():
+    with pytest.raises(ValueError):
+        PrefetchingProvider(CountingProvider(), high_watermark=10, low_watermark=10)
+
+
+def test_runner_derives_the_low_watermark():
+    runner = PollingRunner(None, [], prefetch=True, high_watermark=100)
+
+    provider = runner.create_provider("group")
+
+    assert isinstance(provider, PrefetchingProvider)
+    assert (provider.high_watermark, provider.low_watermark) == (100, 25)
@@ -0,0 +1,151 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+import client.ratelimit
+from client.api import API
+from client.errors import VKAPIError
+from client.ratelimit import FLOOD_CONTROL, TOO_MANY_REQUESTS, TokenBucket
+
+real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    """Replaces the monotonic clock; sleeping advances it instantly."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await real_sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(client.ratelimit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_burst_up_to_capacity_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate=2.0)
+
+    async def main():
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(main())
+
+    # two requests of the burst, then one every 1 / rate seconds
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+    assert clock.now == pytest.approx(1001.0)
+
+
+def test_tokens_refill_up_to_capacity(clock):
+    bucket = TokenBucket(rate=5.0, capacity=2.0)
+
+    async def main():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(main())
+    assert bucket.available() == pytest.approx(0.0)
+
+    clock.now += 0.2
+    assert bucket.available() == pytest.approx(1.0)
+    clock.now += 10
+    assert bucket.available() == pytest.approx(2.0)
+
+
+def test_waiters_are_served_in_order(clock):
+    bucket = TokenBucket(rate=1.0)
+    served: list[int] = []
+
+    async def request(n: int) -> None:
+        await bucket.acquire()
+        served.append(n)
+
+    async def main():
+        await asyncio.gather(*(request(n) for n in range(4)))
+
+    asyncio.run(main())
+
+    assert served == [0, 1, 2, 3]
+    assert clock.now == pytest.approx(1003.0)
+
+
+def test_throttling_halves_the_rate_and_success_recovers_it(clock):
+    bucket = TokenBucket(rate=20.0, min_rate=4.0)
+
+    assert bucket.on_throttled() == pytest.approx(0.1)
+    assert bucket.rate == 10.0
+    assert bucket.available() == 0.0
+    bucket.on_throttled()
+    bucket.on_throttled()
+    assert bucket.rate == 4.0
+
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 20.0
+
+
+class ThrottledServer:
+    """Fails the first calls with the given error codes, then succeeds."""
+
+    def __init__(self, *codes: int) -> None:
+        self.codes = list(codes)
+        self.calls = 0
+
+    async def post(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        self.calls += 1
+        if self.codes:
+            raise VKAPIError(self.codes.pop(0), "Too many requests per second", method)
+        return {"response": "ok"}
+
+
+def throttled_api(server: ThrottledServer) -> API:
+    api = API("token", coalesce_window=None, cache_ttls={}, rate_limit=20.0)
+    api._post = server.post
+    return api
+
+
+def test_error_6_is_repeated_at_a_lower_rate(clock):
+    server = ThrottledServer(TOO_MANY_REQUESTS, TOO_MANY_REQUESTS)
+    api = throttled_api(server)
+
+    result = asyncio.run(api.request("messages.send", {"peer_id": 1}))
+
+    assert result == "ok"
+    assert server.calls == 3
+    assert clock.sleeps[:1] == [pytest.approx(0.1)]
+    assert pytest.approx(0.2) in clock.sleeps
+    assert api.rate_limiter.rate < 20.0
+
+
+def test_flood_control_is_repeated_with_a_growing_delay(clock):
+    server = ThrottledServer(FLOOD_CONTROL, FLOOD_CONTROL)
+    api = throttled_api(server)
+    api.flood_delay = 1.5
+
+    assert asyncio.run(api.request("messages.send", {"peer_id": 1})) == "ok"
+    assert [s for s in clock.sleeps if s >= 1] == [1.5, 3.0]
+
+
+def test_throttling_gives_up_after_the_retry_limit(clock):
+    server = ThrottledServer(*[TOO_MANY_REQUESTS] * 10)
+    api = throttled_api(server)
+    api.max_throttle_retries = 2
+
+    with pytest.raises(VKAPIError) as info:
+        asyncio.run(api.request("messages.send", {"peer_id": 1}))
+
+    assert info.value.code == TOO_MANY_REQUESTS
+    assert server.calls == 3
@@ -0,0 +1,113 @@
+import asyncio
+import json
+from typing import Any
+
+from core.context.event_context import EventContext
+from core.polling.group import GroupLongPollProvider
+from core.polling.record import RecordingProvider, ReplayProvider
+from core.polling.runner import PollingRunner
+from core.polling.user import UserLongPollProvider
+
+
+def message_new(message_id: int, peer_id: int) -> dict[str, Any]:
+    message = {"id": message_id, "peer_id": peer_id, "from_id": peer_id}
+    message.update(conversation_message_id=message_id, text="hi")
+    return {"type": "message_new", "object": {"message": message}}
+
+
+class FakeClient:
+    """Answers the long poll with the given batches and loads messages by id."""
+
+    def __init__(self, batches: list[list[Any]] = ()) -> None:
+        self.batches = list(batches)
+        self.loaded: list[Any] = []
+
+    async def get_long_poll_events(self) -> list[Any]:
+        if not self.batches:
+            await asyncio.Event().wait()
+        return self.batches.pop(0)
+
+    def checkpoint_marker(self) -> None:
+        return None
+
+    async def get_message_by_id(self, message_id: Any = None, **params: Any):
+        message_id = params.get("cmids", message_id)
+        self.loaded.append(message_id)
+        return {"id": message_id, "peer_id": 1, "from_id": 1, "text": "full"}
+
+
+async def take(provider: Any, count: int) -> list[dict[str, Any]]:
+    listener = provider.listen()
+    try:
+        return [await anext(listener) for _ in range(count)]
+    finally:
+        await listener.aclose()
+
+
+class CollectingRunner(PollingRunner):
+    def __init__(self) -> None:
+        super().__init__(None, [])
+        self.dispatched: list[EventContext] = []
+
+    async def dispatch(self, ctx: EventContext) -> None:
+        self.dispatched.append(ctx)
+
+
+def test_raw_updates_are_recorded(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    batches = [[message_new(1, 5), {"type": "message_typing_state"}], []]
+    client = FakeClient(batches + [[message_new(2, 6)]])
+    recorder = RecordingProvider(GroupLongPollProvider(client), path)
+
+    messages = asyncio.run(take(recorder, 2))
+
+    assert [m["id"] for m in messages] == [1, 2]
+    with open(path) as file:
+        lines = [json.loads(line) for line in file]
+    # empty responses are skipped, other updates are kept as received
+    assert [updates for _, updates in lines] == [batches[0], [message_new(2, 6)]]
+    assert recorder.recorded == 2
+
+
+def test_replay_runs_the_recorded_updates_through_the_runner(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    batches = [[message_new(1, 5), message_new(2, 6)], [message_new(3, 5)]]
+    recorder = RecordingProvider(GroupLongPollProvider(FakeClient(batches)), path)
+    recorded = asyncio.run(take(recorder, 3))
+
+    runner = CollectingRunner()
+    replay = ReplayProvider(path, GroupLongPollProvider(FakeClient()), speed=None)
+    asyncio.run(runner.run(replay, is_user=False))
+
+    assert [ctx.message_id for ctx in runner.dispatched] == [1, 2, 3]
+    assert [ctx.raw for ctx in runner.dispatched] == recorded
+    assert replay.replayed == 2
+
+
+def test_replay_hydrates_again(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    recorder = RecordingProvider(
+        UserLongPollProvider(FakeClient([[[4, 7, 1, 5], [61, 5]], [[4, 8, 1, 5]]])),
+        path,
+    )
+    asyncio.run(take(recorder, 2))
+
+    client = FakeClient()
+    replay = ReplayProvider(path, UserLongPollProvider(client), speed=None)
+    messages = asyncio.run(take(replay, 2))
+
+    assert client.loaded == [7, 8]
+    assert [m["id"] for m in messages] == [7, 8]
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    path.write_text(
+        json.dumps([1.0, [message_new(1, 5)]]) + "\n" + '[2.0, [{"type": "mes'
+    )
+    replay = ReplayProvider(str(path), GroupLongPollProvider(FakeClient()), None)
+
+    async def main():
+        return [m async for m in replay.listen()]
+
+    assert [m["id"] for m in asyncio.run(main())] == [1]
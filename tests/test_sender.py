@@ -0,0 +1,142 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from client.errors import VKAPIError
+from core.message_queue.worker import MessageSender
+
+
+class FakeAPI:
+    """Records sent calls and how many requests were in flight at once."""
+
+    def __init__(self, delay: float = 0.001) -> None:
+        self.delay = delay
+        self.sender = None
+        self.sent: list[dict[str, Any]] = []
+        self.requests: list[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _send(self, calls: list[tuple[str, dict[str, Any]]]) -> list[Any]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        self.requests.append(len(calls))
+        self.sent.extend(params for _, params in calls)
+        return [params.get("fail") or params["n"] for _, params in calls]
+
+    async def request(self, method: str, params: dict[str, Any]) -> Any:
+        (result,) = await self._send([(method, params)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def execute(self, calls: list[tuple[str, dict[str, Any]]]) -> list[Any]:
+        return await self._send(calls)
+
+
+def sent_to(api: FakeAPI, peer_id: int) -> list[int]:
+    return [params["n"] for params in api.sent if params["peer_id"] == peer_id]
+
+
+def test_messages_to_one_peer_keep_their_order():
+    api = FakeAPI()
+
+    async def main():
+        sender = MessageSender(api, workers=4, batch_size=3)
+        for n in range(30):
+            await sender.enqueue("messages.send", {"peer_id": n % 3, "n": n})
+        await sender.stop()
+
+    asyncio.run(main())
+
+    for peer_id in range(3):
+        assert sent_to(api, peer_id) == list(range(peer_id, 30, 3))
+
+
+def test_concurrency_is_bounded_by_workers():
+    api = FakeAPI(delay=0.01)
+
+    async def main():
+        sender = MessageSender(api, workers=2, batch_size=1)
+        for n in range(20):
+            await sender.enqueue("messages.send", {"peer_id": n, "n": n})
+        await sender.stop()
+
+    asyncio.run(main())
+
+    assert api.max_in_flight == 2
+    assert len(api.sent) == 20
+
+
+def test_queued_calls_are_batched_into_execute():
+    api = FakeAPI()
+
+    async def main():
+        sender = MessageSender(api, workers=1, batch_size=25)
+        futures = [
+            await sender.enqueue("messages.send", {"peer_id": 1, "n": n})
+            for n in range(30)
+        ]
+        await sender.stop()
+        return [future.result() for future in futures]
+
+    assert asyncio.run(main()) == list(range(30))
+    assert api.requests == [25, 5]
+
+
+def test_stop_drains_the_queue():
+    api = FakeAPI()
+
+    async def main():
+        sender = MessageSender(api, workers=2, batch_size=2)
+        futures = [
+            await sender.enqueue("messages.send", {"peer_id": n % 2, "n": n})
+            for n in range(10)
+        ]
+        await sender.stop()
+        assert not sender.running
+        return futures
+
+    futures = asyncio.run(main())
+
+    assert all(future.done() for future in futures)
+    assert len(api.sent) == 10
+
+
+def test_stop_without_draining_leaves_calls_unsent():
+    api = FakeAPI(delay=0.01)
+
+    async def main():
+        sender = MessageSender(api, workers=1, batch_size=1)
+        for n in range(5):
+            await sender.enqueue("messages.send", {"peer_id": 1, "n": n})
+        await sender.stop(drain=False)
+        return sender.qsize()
+
+    assert asyncio.run(main()) > 0
+    assert len(api.sent) < 5
+
+
+def test_failed_calls_reject_only_their_future():
+    api = FakeAPI()
+    error = VKAPIError(901, "Can't send messages", "messages.send")
+
+    async def main():
+        sender = MessageSender(api, workers=1)
+        ok = await sender.enqueue("messages.send", {"peer_id": 1, "n": 1})
+        failed = await sender.enqueue(
+            "messages.send", {"peer_id": 1, "n": 2, "fail": error}
+        )
+        await sender.stop()
+        return ok, failed
+
+    ok, failed = asyncio.run(main())
+
+    assert ok.result() == 1
+    with pytest.raises(VKAPIError):
+        failed.result()
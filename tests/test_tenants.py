@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any
+
+import core.polling.tenants
+from client.errors import VKAPIError
+from core.context.event_context import EventContext
+from core.polling.runner import PollingRunner
+from core.polling.tenants import TenantRunner
+
+
+class CollectingRunner(PollingRunner):
+    def __init__(self, *args: Any, **options: Any) -> None:
+        super().__init__(*args, **options)
+        self.dispatched: list[tuple[str, int]] = []
+
+    async def dispatch(self, ctx: EventContext) -> None:
+        self.dispatched.append((ctx.client.access_token, ctx.message_id))
+
+
+class FakeLongPoll:
+    """Fails the first polls with the given errors, then answers one batch."""
+
+    def __init__(self, api, *errors: Exception, first_id: int = 1) -> None:
+        self.errors = list(errors)
+        self.polls = 0
+        self.delivered = False
+        self.first_id = first_id
+        api._is_group_token = True
+        api.get_long_poll_events = self.poll
+
+    async def poll(self) -> list[dict[str, Any]]:
+        self.polls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.delivered:
+            await asyncio.Event().wait()
+        self.delivered = True
+        return [
+            {"type": "message_new", "object": {"message": message(n)}}
+            for n in (self.first_id, self.first_id + 1)
+        ]
+
+
+def message(message_id: int) -> dict[str, Any]:
+    return {"id": message_id, "peer_id": 1, "from_id": 1, "text": "hi"}
+
+
+def test_failing_token_is_retried_without_stopping_the_others(monkeypatch):
+    monkeypatch.setattr(core.polling.tenants, "PollingRunner", CollectingRunner)
+    monkeypatch.setattr(core.polling.tenants, "backoff_delay", lambda n, **_: 0)
+    revoked = VKAPIError(5, "User authorization failed", "groups.getLongPollServer")
+
+    async def main():
+        runner = TenantRunner([])
+        broken = FakeLongPoll(runner.add_token("broken"), revoked, revoked)
+        FakeLongPoll(runner.add_token("healthy"), first_id=10)
+
+        task = asyncio.create_task(runner.run())
+        for _ in range(100):
+            await asyncio.sleep(0)
+            if len(runner.engine.dispatched) == 4:
+                break
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await runner.close()
+        return broken.polls, runner.engine.dispatched
+
+    polls, dispatched = asyncio.run(main())
+
+    # two failures, the batch, then waiting for the next one
+    assert polls == 4
+    assert sorted(dispatched) == [
+        ("broken", 1),
+        ("broken", 2),
+        ("healthy", 10),
+        ("healthy", 11),
+    ]
+
+
+def test_given_session_is_not_closed():
+    class Session:
+        closed = False
+
+        async def close(self) -> None:
+            self.closed = True
+
+    session = Session()
+    runner = TenantRunner([], session=session)
+
+    asyncio.run(runner.close())
+
+    assert not session.closed
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Any
+
+import pytest
+
+from client.api import API
+from client.errors import VKAPIError
+from client.tokens import (
+    AUTHORIZATION_FAILED,
+    RATE_LIMIT_REACHED,
+    TokenPool,
+    describes_caller,
+)
+
+
+class FakeServer:
+    """Answers every call with the token it was sent with."""
+
+    def __init__(self, errors: dict[str, int] | None = None) -> None:
+        self.errors = errors or {}
+        self.tokens: list[str] = []
+
+    async def post(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        token = params["access_token"]
+        self.tokens.append(token)
+        await asyncio.sleep(0)
+        if token in self.errors:
+            raise VKAPIError(self.errors[token], "error", method)
+        return {"response": token}
+
+
+def pooled_api(pool: TokenPool, server: FakeServer, **options: Any) -> API:
+    api = API("own", token_pool=pool, coalesce_window=None, **options)
+    api._post = server.post
+    return api
+
+
+def test_calls_describing_the_caller():
+    assert describes_caller("users.get", {})
+    assert describes_caller("users.get", {"fields": "photo_100"})
+    assert describes_caller("groups.getById", {"fields": "members_count"})
+    assert not describes_caller("users.get", {"user_ids": 1})
+    assert not describes_caller("groups.getById", {"group_id": 1})
+    assert not describes_caller("messages.send", {})
+
+
+def test_only_calls_with_an_id_are_pooled():
+    server = FakeServer()
+    api = pooled_api(TokenPool(["a"]), server, cache_ttls={})
+
+    async def main():
+        return [
+            await api.request("users.get", {"fields": "photo_100"}),
+            await api.request("groups.getById", {"fields": "members_count"}),
+            await api.request("users.get", {"user_ids": 1}),
+            await api.request("messages.getById", {"message_ids": 1}),
+        ]
+
+    assert asyncio.run(main()) == ["own", "own", "a", "own"]
+
+
+def test_least_loaded_token_is_chosen():
+    pool = TokenPool({"a": "token-a", "b": "token-b"})
+    a, b = pool.tokens
+    a.active = 2
+
+    assert pool.choose("users.get") is b
+    b.active = 3
+    assert pool.choose("users.get") is a
+
+
+def test_routes_restrict_tokens():
+    pool = TokenPool({"a": "token-a", "b": "token-b"}, routes={"users.get": ["b"]})
+
+    assert pool.choose("users.get").name == "b"
+    assert not pool.routes_call("groups.getById", {"group_ids": 1})
+    with pytest.raises(ValueError):
+        TokenPool(["x"], routes={"users.get": ["missing"]})
+
+
+def test_rate_limit_reached_evicts_only_the_method():
+    server = FakeServer({"token-a": RATE_LIMIT_REACHED})
+    pool = TokenPool({"a": "token-a", "b": "token-b"})
+    api = pooled_api(pool, server, cache_ttls={})
+    a, _ = pool.tokens
+
+    result = asyncio.run(api.request("users.get", {"user_ids": 1}))
+
+    assert result == "token-b"
+    assert server.tokens == ["token-a", "token-b"]
+    now = time.monotonic()
+    assert a.is_evicted("users.get", now)
+    assert not a.is_evicted("groups.getById", now)
+
+
+def test_failed_authorization_evicts_the_token():
+    pool = TokenPool({"a": "token-a", "b": "token-b"})
+    a, b = pool.tokens
+
+    assert pool.evict(a, AUTHORIZATION_FAILED, "users.get")
+    assert not pool.evict(b, 100, "users.get")
+
+    assert pool.choose("users.get") is b
+    assert pool.choose("groups.getById") is b
+
+
+def test_own_token_is_used_when_the_pool_is_exhausted():
+    server = FakeServer({"token-a": AUTHORIZATION_FAILED})
+    api = pooled_api(TokenPool({"a": "token-a"}), server, cache_ttls={})
+
+    result = asyncio.run(api.request("users.get", {"user_ids": 1}))
+
+    assert result == "own"
+    assert server.tokens == ["token-a", "own"]
+
+
+def test_only_the_limiter_of_the_used_token_recovers():
+    pool = TokenPool({"a": "token-a"})
+    api = pooled_api(pool, FakeServer(), cache_ttls={})
+    own, pooled = api.rate_limiter, pool.tokens[0].limiter
+    own.rate = pooled.rate = 1.0
+
+    asyncio.run(api.request("users.get", {"user_ids": 1}))
+    assert own.rate == 1.0
+    assert pooled.rate > 1.0
+
+    asyncio.run(api.request("users.get", {}))
+    assert own.rate > 1.0
+
+
+def test_responses_about_the_caller_are_cached_per_token():
+    server = FakeServer()
+    first = pooled_api(TokenPool(["a"]), server)
+    second = API("other", coalesce_window=None)
+    second._post = server.post
+    second.cache = first.cache
+
+    async def main():
+        return [
+            await first.request("users.get", {}),
+            await second.request("users.get", {}),
+            await first.request("users.get", {"user_ids": 1}),
+            await second.request("users.get", {"user_ids": 1}),
+        ]
+
+    assert asyncio.run(main()) == ["own", "other", "a", "a"]
+    assert server.tokens == ["own", "other", "a"]
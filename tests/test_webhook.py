@@ -0,0 +1,164 @@
+import asyncio
+import json
+from typing import Any, Optional
+
+from core.webhook.server import CallbackServer
+from utils.http import HTTPRequest
+
+GROUP_ID = 1
+SECRET = "s3cret"
+
+
+class RecordingRunner:
+    def __init__(self, max_concurrency: Optional[int] = 10) -> None:
+        self.max_concurrency = max_concurrency
+        self.handled: list[dict[str, Any]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def handle(self, raw_event: dict[str, Any], is_user: bool) -> None:
+        await self.release.wait()
+        self.handled.append(raw_event)
+
+
+def make_server(**options: Any) -> tuple[CallbackServer, RecordingRunner]:
+    runner = RecordingRunner()
+    options = {"secret": SECRET, "group_id": GROUP_ID, **options}
+    return CallbackServer(runner, "confirm-me", **options), runner
+
+
+def message_new(event_id: str = "e1", text: str = "hi", **fields: Any) -> dict:
+    return {
+        "type": "message_new",
+        "event_id": event_id,
+        "group_id": GROUP_ID,
+        "secret": SECRET,
+        "object": {"message": {"id": 1, "peer_id": 2, "from_id": 2, "text": text}},
+        **fields,
+    }
+
+
+def post(
+    server: CallbackServer, payload: Any, path: str = "/", **headers: str
+) -> tuple[int, str]:
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    request = HTTPRequest("POST", path, {}, headers, body)
+    response = asyncio.run(server.handle_request(request))
+    return response.status, response.body.decode()
+
+
+def test_confirmation_returns_code_without_secret():
+    server, runner = make_server()
+
+    status, body = post(server, {"type": "confirmation", "group_id": GROUP_ID})
+
+    assert (status, body) == (200, "confirm-me")
+    assert runner.handled == []
+
+
+def test_confirmation_for_another_group_is_rejected():
+    server, _ = make_server()
+
+    status, _ = post(server, {"type": "confirmation", "group_id": GROUP_ID + 1})
+
+    assert status == 403
+
+
+def test_wrong_secret_is_rejected():
+    server, runner = make_server()
+
+    status, _ = post(server, message_new(secret="wrong"))
+
+    assert status == 403
+    assert runner.handled == []
+
+
+def test_message_is_dispatched_and_acknowledged():
+    server, runner = make_server()
+
+    status, body = post(server, message_new(text="hello"))
+
+    assert (status, body) == (200, "ok")
+    assert [event["text"] for event in runner.handled] == ["hello"]
+
+
+def test_redelivered_event_is_only_acknowledged():
+    server, runner = make_server()
+
+    post(server, message_new("e1"))
+    status, body = post(server, message_new("e1"), **{"x-retry-counter": "1"})
+    post(server, message_new("e2"))
+
+    assert (status, body) == (200, "ok")
+    assert len(runner.handled) == 2
+
+
+def test_retry_of_an_unseen_event_is_dispatched():
+    server, runner = make_server()
+
+    status, _ = post(server, message_new("e1"), **{"x-retry-counter": "2"})
+
+    assert status == 200
+    assert len(runner.handled) == 1
+
+
+def test_malformed_retry_header_is_ignored():
+    server, runner = make_server()
+
+    status, _ = post(server, message_new("e1"), **{"x-retry-counter": "soon"})
+
+    assert status == 200
+    assert len(runner.handled) == 1
+
+
+def test_other_events_are_acknowledged_without_dispatch():
+    server, runner = make_server()
+
+    status, body = post(server, message_new(type="message_reply"))
+
+    assert (status, body) == (200, "ok")
+    assert runner.handled == []
+
+
+def test_bad_requests():
+    server, _ = make_server()
+
+    assert post(server, b"{not json")[0] == 400
+    assert post(server, message_new(), path="/other")[0] == 404
+
+    request = HTTPRequest("GET", "/", {}, {}, b"")
+    assert asyncio.run(server.handle_request(request)).status == 405
+
+
+def test_wrong_secret_type_is_rejected():
+    server, _ = make_server()
+
+    assert post(server, message_new(secret=123))[0] == 403
+    assert post(server, message_new(secret=None))[0] == 403
+
+
+def test_payload_that_is_not_an_object_is_rejected():
+    server, runner = make_server()
+
+    assert post(server, [message_new()])[0] == 400
+    assert post(server, "message_new")[0] == 400
+    assert runner.handled == []
+
+
+def test_inline_runner_is_acknowledged_before_dispatch():
+    runner = RecordingRunner(max_concurrency=None)
+    server = CallbackServer(runner, "confirm-me", secret=SECRET, group_id=GROUP_ID)
+    body = json.dumps(message_new()).encode()
+
+    async def main():
+        runner.release.clear()
+        request = HTTPRequest("POST", "/", {}, {}, body)
+        response = await asyncio.wait_for(server.handle_request(request), 1)
+        acknowledged_first = runner.handled == []
+
+        runner.release.set()
+        await server.close()
+        return response.status, acknowledged_first
+
+    assert asyncio.run(main()) == (200, True)
+    assert len(runner.handled) == 1
@@ -0,0 +1,159 @@
+import asyncio
+from http import HTTPStatus
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from loguru import logger
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class HTTPRequest:
+    """A parsed HTTP/1.1 request."""
+
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        query: dict[str, str],
+        headers: dict[str, str],
+        body: bytes,
+    ) -> None:
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the client wants to keep the connection open."""
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class HTTPResponse:
+    """An HTTP response to be written back to the client."""
+
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(
+        self,
+        body: bytes | str = b"",
+        status: int = 200,
+        content_type: str = "text/plain; charset=utf-8",
+    ) -> None:
+        self.status = status
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+
+
+HTTPHandler = Callable[[HTTPRequest], Awaitable[HTTPResponse]]
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[HTTPRequest]:
+    """
+    Reads a single request from the stream.
+
+    :param reader: The stream of the client connection
+    :return: The request, or None if the client closed the connection
+    :raises ValueError: If the request is malformed or too large
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("request head is too large")
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise ValueError(f"malformed request line: {request_line!r}")
+
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_SIZE:
+        raise ValueError("request body is too large")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    return HTTPRequest(method, url.path, dict(parse_qsl(url.query)), headers, body)
+
+
+async def write_response(
+    writer: asyncio.StreamWriter, response: HTTPResponse, keep_alive: bool = True
+) -> None:
+    """
+    Writes a response to the stream.
+
+    :param writer: The stream of the client connection
+    :param response: The response to write
+    :param keep_alive: Whether the connection stays open after the response
+    """
+    reason = HTTPStatus(response.status).phrase
+    head = (
+        f"HTTP/1.1 {response.status} {reason}\r\n"
+        f"Content-Type: {response.content_type}\r\n"
+        f"Content-Length: {len(response.body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    writer.write(head.encode("latin-1") + response.body)
+    await writer.drain()
+
+
+async def start_http_server(
+    handler: HTTPHandler, host: str = "127.0.0.1", port: int = 8080
+) -> asyncio.Server:
+    """
+    Starts a minimal HTTP/1.1 server that passes every request to `handler`.
+
+    It is meant for small local endpoints (webhooks, metrics), not as a
+    general purpose web server.
+
+    :param handler: Coroutine function turning a request into a response
+    :param host: The interface to listen on
+    :param port: The port to listen on, 0 picks a free one
+    :return: The started server
+    """
+
+    async def on_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    await write_response(
+                        writer, HTTPResponse(str(e), status=400), keep_alive=False
+                    )
+                    return
+
+                if request is None:
+                    return
+
+                try:
+                    response = await handler(request)
+                except Exception as e:
+                    logger.exception(f"Error while handling {request.path}: {e}")
+                    response = HTTPResponse(status=500)
+
+                await write_response(writer, response, request.keep_alive)
+                if not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port, limit=MAX_HEADER_SIZE)
@@ -0,0 +1,308 @@
+import asyncio
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Optional, Union
+
+from utils.http import HTTPRequest, HTTPResponse, start_http_server
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+LabelValues = tuple[str, ...]
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[LabelValues, Any] = {}
+
+    def labels(self, *values: Any) -> Any:
+        """
+        Returns the child metric for the given label values, in the order of
+        `labelnames`.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """Creates the value of a new label combination."""
+
+    def _label_dict(self, values: LabelValues) -> dict[str, str]:
+        return {name: str(value) for name, value in zip(self.labelnames, values)}
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increments the counter without labels."""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        """Sets the gauge without labels."""
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increments the gauge without labels."""
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Decrements the gauge without labels."""
+        self.labels().dec(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Observes a value without labels."""
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """
+    Collection of counters, gauges and histograms.
+
+    Metrics are plain Python objects updated in place, so recording a value
+    costs a dict lookup and an addition. The registry can be read as a
+    snapshot or rendered in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        """Returns the counter with the given name, creating it if needed."""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Gauge:
+        """Returns the gauge with the given name, creating it if needed."""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Returns the histogram with the given name, creating it if needed."""
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Histogram(
+                name, documentation, labelnames, buckets
+            )
+        return self._check(metric, Histogram)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """
+        Returns the current values of every metric.
+
+        :return: Metric names mapped to their type and samples; a sample holds
+            its labels and either `value` or `count`, `sum` and `buckets`
+        """
+        result: dict[str, dict[str, Any]] = {}
+        for metric in self._metrics.values():
+            samples = []
+            for values, child in list(metric._children.items()):
+                sample: dict[str, Any] = {"labels": metric._label_dict(values)}
+                if isinstance(child, _HistogramValue):
+                    sample["count"] = child.count
+                    sample["sum"] = child.sum
+                    sample["buckets"] = dict(
+                        zip([*child.buckets, float("inf")], _cumulative(child.counts))
+                    )
+                else:
+                    sample["value"] = child.value
+                samples.append(sample)
+            result[metric.name] = {"type": metric.kind, "samples": samples}
+        return result
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, child in list(metric._children.items()):
+                labels = metric._label_dict(values)
+                if isinstance(child, _HistogramValue):
+                    bounds = [*child.buckets, float("inf")]
+                    for bound, count in zip(bounds, _cumulative(child.counts)):
+                        bucket_labels = {**labels, "le": _format_number(bound)}
+                        lines.append(
+                            f"{metric.name}_bucket{_format_labels(bucket_labels)} {count}"
+                        )
+                    lines.append(
+                        f"{metric.name}_sum{_format_labels(labels)} {child.sum}"
+                    )
+                    lines.append(
+                        f"{metric.name}_count{_format_labels(labels)} {child.count}"
+                    )
+                else:
+                    lines.append(
+                        f"{metric.name}{_format_labels(labels)} "
+                        f"{_format_number(child.value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(
+        self,
+        cls: type[_Metric],
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+    ) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, labelnames)
+        return self._check(metric, cls)
+
+    @staticmethod
+    def _check(metric: _Metric, cls: type) -> Any:
+        if not isinstance(metric, cls):
+            raise ValueError(f"metric {metric.name} is already a {metric.kind}")
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+
+async def start_metrics_server(
+    host: str = "127.0.0.1",
+    port: int = 9090,
+    registry: Optional[MetricsRegistry] = None,
+) -> asyncio.Server:
+    """
+    Serves the metrics in the Prometheus text format on `/metrics`.
+
+    :param host: The interface to listen on
+    :param port: The port to listen on, 0 picks a free one
+    :param registry: The registry to expose, defaults to the global one
+    :return: The started server
+    """
+    registry = registry or REGISTRY
+
+    async def handler(request: HTTPRequest) -> HTTPResponse:
+        if request.path != "/metrics":
+            return HTTPResponse("not found", status=404)
+        return HTTPResponse(registry.render(), content_type="text/plain; version=0.0.4")
+
+    return await start_http_server(handler, host, port)
+
+
+def _cumulative(counts: list[int]) -> list[int]:
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_number(value: Union[int, float]) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))